@@ -0,0 +1,213 @@
+"""
+Admission control for the expensive pipeline stages.
+
+Each stage (OCR, extraction, generation, transcription upload) has its own
+concurrency limit and a bounded queue of requests waiting for it. Requests
+beyond the queue are shed with Overloaded, which the app turns into a 429
+with Retry-After, so an overload is turned away at the door instead of every
+request slowing down until all of them time out. Waiters are admitted by
+priority: urgent first, then normal, then background jobs.
+
+Limits are per process: with several server workers, each worker admits up
+to the configured number per stage.
+"""
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+# Requests holding each stage at once
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", "2"))
+EXTRACTION_CONCURRENCY = int(os.environ.get("EXTRACTION_CONCURRENCY", "2"))
+# Concurrent generations are batched together, so this should be at least GENERATION_MAX_BATCH
+GENERATION_CONCURRENCY = int(os.environ.get("GENERATION_CONCURRENCY", "8"))
+TRANSCRIPTION_CONCURRENCY = int(os.environ.get("TRANSCRIPTION_CONCURRENCY", "4"))
+# Requests allowed to wait for a stage, as a multiple of its concurrency
+ADMISSION_QUEUE_FACTOR = float(os.environ.get("ADMISSION_QUEUE_FACTOR", "2"))
+# Seconds a request may wait for a stage before it is shed
+ADMISSION_TIMEOUT = float(os.environ.get("ADMISSION_TIMEOUT", "30"))
+# Weight of the newest observation in the per-stage hold time estimate
+HOLD_SMOOTHING = 0.2
+
+# Priority levels; lower is admitted first
+URGENT = 0
+NORMAL = 1
+# Already admitted elsewhere (e.g. by the job queue): never shed and not counted
+# against the queue bound, but admitted after every interactive request
+BACKGROUND = 2
+
+ADMISSION_ACTIVE = metrics.Gauge("admission_active", "Requests holding a stage")
+ADMISSION_WAITING = metrics.Gauge("admission_waiting", "Requests waiting for a stage")
+ADMISSION_REJECTED = metrics.Counter("admission_rejected_total", "Requests shed by admission control, by stage and reason")
+ADMISSION_WAIT = metrics.Histogram("admission_wait_seconds", "Time a request waited for a stage")
+
+_priority = contextvars.ContextVar("admission_priority", default=NORMAL)
+
+class Overloaded(Exception):
+    """Raised when a stage cannot take a request; retry_after is a suggested delay in seconds."""
+    def __init__(self, stage, retry_after):
+        super().__init__(f"{stage} is at capacity")
+        self.stage = stage
+        self.retry_after = retry_after
+
+class _Waiter:
+    def __init__(self, level, seq):
+        self.level = level
+        self.seq = seq
+        # "waiting", then "admitted" or "shed"
+        self.state = "waiting"
+
+    def __lt__(self, other):
+        return (self.level, self.seq) < (other.level, other.seq)
+
+class StageLimiter:
+    """
+    Counting semaphore with a bounded priority wait queue. A freed slot is
+    handed straight to the best waiter, so a newcomer can't overtake the queue.
+    When the queue is full an urgent request displaces the newest normal one.
+    Args:
+        name (str): Stage name, used in metrics and errors.
+        limit (int): Requests holding the stage at once.
+        max_waiting (int): Interactive requests allowed to wait.
+        timeout (float): Seconds a request waits before it is shed.
+    """
+    def __init__(self, name, limit, max_waiting, timeout=ADMISSION_TIMEOUT):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_waiting = max(0, max_waiting)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._hold_seconds = None
+
+    def _interactive_waiting(self):
+        return [waiter for waiter in self._waiters if waiter.level != BACKGROUND]
+
+    def retry_after(self):
+        """Suggested seconds before retrying: roughly the time for the current queue to drain."""
+        hold = self._hold_seconds or 1.0
+        return max(1, math.ceil(hold * (len(self._waiters) + 1) / self.limit))
+
+    def _reject(self, reason):
+        ADMISSION_REJECTED.inc(stage=self.name, reason=reason)
+        return Overloaded(self.name, self.retry_after())
+
+    def _make_room(self, level):
+        # Called with the lock held; returns False if the request must be shed
+        interactive = self._interactive_waiting()
+        if level == BACKGROUND or len(interactive) < self.max_waiting:
+            return True
+        if level == URGENT:
+            normal = [waiter for waiter in interactive if waiter.level == NORMAL]
+            if normal:
+                newest = max(normal, key=lambda waiter: waiter.seq)
+                newest.state = "shed"
+                self._waiters.remove(newest)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                return True
+        return False
+
+    def check(self, level=None):
+        """Raises Overloaded if a request at this level would be shed right now, without queueing it."""
+        level = _priority.get() if level is None else level
+        with self._cond:
+            if self._active >= self.limit and level != BACKGROUND and len(self._interactive_waiting()) >= self.max_waiting:
+                if not (level == URGENT and any(waiter.level == NORMAL for waiter in self._waiters)):
+                    raise self._reject("queue_full")
+
+    def acquire(self, level=NORMAL):
+        start = time.perf_counter()
+        with self._cond:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                ADMISSION_ACTIVE.inc(stage=self.name)
+                ADMISSION_WAIT.observe(0.0, stage=self.name)
+                return
+            if not self._make_room(level):
+                raise self._reject("queue_full")
+            waiter = _Waiter(level, next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+            ADMISSION_WAITING.inc(stage=self.name)
+            try:
+                deadline = None if level == BACKGROUND else start + self.timeout
+                while waiter.state == "waiting":
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        self._waiters.remove(waiter)
+                        heapq.heapify(self._waiters)
+                        raise self._reject("timeout")
+                    self._cond.wait(remaining)
+                if waiter.state == "shed":
+                    raise self._reject("displaced")
+            finally:
+                ADMISSION_WAITING.dec(stage=self.name)
+        ADMISSION_WAIT.observe(time.perf_counter() - start, stage=self.name)
+
+    def release(self, held_seconds):
+        with self._cond:
+            previous = self._hold_seconds
+            self._hold_seconds = held_seconds if previous is None else previous + HOLD_SMOOTHING * (held_seconds - previous)
+            if self._waiters:
+                # The slot passes to the next waiter; the active count is unchanged
+                heapq.heappop(self._waiters).state = "admitted"
+                self._cond.notify_all()
+            else:
+                self._active -= 1
+                ADMISSION_ACTIVE.dec(stage=self.name)
+
+    @contextmanager
+    def slot(self, level=None):
+        """Holds one of the stage's slots for the block, at the current request's priority by default."""
+        self.acquire(_priority.get() if level is None else level)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+def _limiter(name, limit):
+    return StageLimiter(name, limit, math.ceil(limit * ADMISSION_QUEUE_FACTOR))
+
+LIMITERS = {
+    "ocr": _limiter("ocr", OCR_CONCURRENCY),
+    "extraction": _limiter("extraction", EXTRACTION_CONCURRENCY),
+    "generation": _limiter("generation", GENERATION_CONCURRENCY),
+    "transcription": _limiter("transcription", TRANSCRIPTION_CONCURRENCY),
+}
+
+def capacity():
+    """Requests the stages can hold or queue at once: every stage's limit plus its wait queue."""
+    return sum(limiter.limit + limiter.max_waiting for limiter in LIMITERS.values())
+
+def limit(stage):
+    """Context manager holding a slot of the named stage for the current request."""
+    return LIMITERS[stage].slot()
+
+def check(*stages):
+    """Raises Overloaded if any of the named stages would shed the current request right now."""
+    for stage in stages:
+        LIMITERS[stage].check()
+
+def set_priority(level):
+    """Sets the priority of the current request; returns a token for reset_priority."""
+    return _priority.set(level)
+
+def reset_priority(token):
+    _priority.reset(token)
+
+@contextmanager
+def priority(level):
+    """Runs the block, and the stages it enters, at the given priority level."""
+    token = set_priority(level)
+    try:
+        yield
+    finally:
+        reset_priority(token)
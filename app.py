@@ -1,60 +1,69 @@
+import io
 import os
-import sqlite3
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
-from PIL import Image
-import pytesseract
-import re
-from transformers import BartForConditionalGeneration, BartTokenizer
-import assemblyai as aai
-from extractor import extract_information_from_text, create_pdf
-
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+import json
+import logging
+import time
+from flask import Flask, request, jsonify, render_template, redirect, url_for, session, Response, send_file, stream_with_context, g
+import admission
+import cache
+import decoding
+import drafts
+import metrics
+import models
+import notifications
+import reports
+import storage
+import transcription
+from profiler import profiler
+from pipeline import run_pipeline, stream_pipeline
+from jobs import JobQueue, JobQueueFull, JOB_RETRY_AFTER, TERMINAL_STATUSES, get_job
+
+# Read by ocr.py, which is imported on the first /ocr request
+os.environ.setdefault("TESSERACT_CMD", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = ""  
 
 USERS = {"admin": "12345"}
-aai.settings.api_key = ""  
-
-tokenizer = BartTokenizer.from_pretrained("./models/bart-fine-tuned-mts")
-model = BartForConditionalGeneration.from_pretrained("./models/bart-fine-tuned-mts")
-
-# SQLite database initialization
-DB_PATH = "patients.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS patients 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  name TEXT, 
-                  age TEXT, 
-                  gender TEXT, 
-                  history TEXT, 
-                  summary TEXT)''')
-    conn.commit()
-    conn.close()
+
+# Models are not loaded at import, so the server answers as soon as it starts.
+# They load in a background thread started by the server (see gunicorn.conf.py
+# and __main__ below), or on first use.
 
 # Call this when the app starts
-init_db()
-
-def clean_ocr_text(ocr_text):
-    lines = ocr_text.split("\n")
-    cleaned_lines = []
-    for line in lines:
-        line = line.strip()
-        if not line: 
-            continue
-        if re.match(r"^\d{5,}$", line): 
-            continue
-        if re.search(r"@|\.com|www", line, re.IGNORECASE):  
-            continue
-        if re.match(r"^Page\s\d+", line, re.IGNORECASE):  
-            continue
-        if len(line.split()) <= 2 and re.search(r"\d{2,4}", line):  
-            continue
-        cleaned_lines.append(line)
-    return "\n".join(cleaned_lines)
+storage.init_db()
+
+# Background pool for /jobs submissions; started after forking (see gunicorn.conf.py)
+job_queue = JobQueue()
+transcription.init_transcriptions_table()
+notifications.init_notifications_table()
+drafts.init_drafts_table()
+
+@app.before_request
+def set_request_priority():
+    # "X-Priority: urgent", or ?urgent=true, jumps the stage queues. The body is
+    # never read here, so uploads are not parsed before the handler's auth check
+    urgent = request.headers.get("X-Priority", "").lower() == "urgent" or request.args.get("urgent", "").lower() in ("1", "true", "yes")
+    g.priority_token = admission.set_priority(admission.URGENT if urgent else admission.NORMAL)
+
+@app.teardown_request
+def reset_request_priority(exc):
+    token = g.pop("priority_token", None)
+    if token is not None:
+        admission.reset_priority(token)
+
+@app.errorhandler(admission.Overloaded)
+def overloaded(error):
+    response = jsonify({"error": "Too many requests in progress, please retry shortly", "stage": error.stage})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+@app.template_filter('timestamp')
+def format_timestamp(value):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(value)) if value else "-"
 
 @app.route('/login', methods=['GET'])
 def login_page():
@@ -76,6 +85,28 @@ def logout():
     session.pop('user', None)
     return redirect(url_for('login_page'))
 
+@app.route('/ready')
+def ready():
+    # Also starts loading under servers that never called the warmup hook
+    models.start_background_warmup()
+    code = 200 if models.is_ready() else 503
+    return jsonify({"ready": code == 200, "models": models.status()}), code
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/debug/profiler', methods=['POST'])
+def toggle_profiler():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    # {"action": "start"} begins sampling; {"action": "stop"} returns collapsed stacks for a flame graph
+    action = (request.get_json(silent=True) or {}).get("action", "start")
+    if action == "stop":
+        return Response(profiler.stop(), mimetype="text/plain")
+    profiler.start()
+    return jsonify({"running": profiler.running, "interval": profiler.interval})
+
 @app.route('/')
 def index():
     if 'user' not in session:
@@ -86,14 +117,40 @@ def index():
 def ocr():
     if 'user' not in session:
         return jsonify({"error": "Unauthorized, please log in"}), 401
-    if 'image' not in request.files:
+    # 'document' accepts multi-page PDFs and TIFF stacks; 'image' is kept for older clients
+    upload = request.files.get('document') or request.files.get('image')
+    if upload is None:
         return jsonify({"error": "No image provided"}), 400
 
-    image = request.files['image']
-    extracted_text = pytesseract.image_to_string(Image.open(image))
-    cleaned_text = clean_ocr_text(extracted_text)
-    
-    return jsonify({"extracted_text": cleaned_text})
+    # OCR's imports (numpy, Pillow, pytesseract) are deferred to the first request
+    from ocr import ocr_document, tesseract_version, OCR_DPI, OCR_PIPELINE_VERSION
+    document_data = upload.read()
+    key = cache.make_key("ocr", document_data, tesseract=tesseract_version(), pipeline=OCR_PIPELINE_VERSION, dpi=OCR_DPI)
+    def run_ocr():
+        with admission.limit("ocr"):
+            return ocr_document(document_data)
+
+    try:
+        result = cache.cached("ocr", key, run_ocr)
+    except admission.Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Could not read document: {e}"}), 400
+
+    return jsonify({
+        "extracted_text": result["text"],
+        "pages": result["pages"],
+        "total_seconds": result["total_seconds"]
+    })
+
+def resolve_draft(draft_id):
+    """
+    Returns the request's draft id if it is a live draft of the logged-in user;
+    otherwise starts a new one.
+    """
+    if draft_id and drafts.get_owner(draft_id) == session['user']:
+        return draft_id
+    return drafts.create_draft(session['user'])
 
 @app.route('/summarize', methods=['POST'])
 def summarize():
@@ -106,110 +163,198 @@ def summarize():
     if not ocr_text and not additional_text and not audio_text:
         return jsonify({"error": "No input provided"}), 400
 
-    extracted_info = extract_information_from_text(ocr_text, additional_text, audio_text)
+    # Optional decoding profile and generation deadline in seconds (see decoding.py)
+    profile = request.json.get("profile") or decoding.GENERATION_PROFILE
+    if profile not in decoding.PROFILES:
+        return jsonify({"error": f"Unknown profile, expected one of {', '.join(decoding.PROFILES)}"}), 400
+    try:
+        deadline = float(request.json.get("deadline") or 0) or None
+    except (TypeError, ValueError):
+        return jsonify({"error": "deadline must be a number of seconds"}), 400
 
-    combined_info = {
-        "Name": extracted_info.get("Name", "Not specified"),
-        "Age": extracted_info.get("Age", "Not specified"),
-        "Gender": extracted_info.get("Gender", "Not specified"),
-        "Disease": extracted_info.get("Disease", "Not specified"),
-        "Medications": extracted_info.get("Medications", "None specified") if extracted_info.get("Medications") != "Not Available" else "None specified",
-        "Discharge Date": extracted_info.get("Discharge Date")
-    }
+    draft_id = resolve_draft(request.json.get("draft_id"))
+    result = run_pipeline(ocr_text, additional_text, audio_text, draft_id=draft_id, profile=profile, deadline=deadline)
+    extracted_info = result["extracted_info"]
+    summary = result["summary"]
 
-    combined_text = (
-        "Generate a discharge summary based on the following clinical information:\n"
-        f"Patient Name: {combined_info['Name']}\n"
-        f"Age: {combined_info['Age']}\n"
-        f"Gender: {combined_info['Gender']}\n"
-        f"Disease/Condition: {combined_info['Disease']}\n"
-        f"Medications: {', '.join(combined_info['Medications']) if isinstance(combined_info['Medications'], list) else combined_info['Medications']}\n"
-        f"Discharge Date: {combined_info['Discharge Date']}\n"
-        "Additional Notes from Image Report:\n" + (ocr_text if ocr_text else "None provided") + "\n"
-        "Additional Notes from Text Input:\n" + (additional_text if additional_text else "None provided") + "\n"
-        "Additional Notes from Doctor-Patient Conversation:\n" + (audio_text if audio_text else "None provided") + "\n"
-        "Provide a concise discharge summary incorporating all relevant details."
-    ).strip()
-
-    inputs = tokenizer(combined_text, return_tensors="pt", max_length=4096, truncation=True)
-    outputs = model.generate(
-        inputs["input_ids"],
-        max_length=1000,
-        min_length=100,
-        num_beams=4,
-        early_stopping=True,
-        length_penalty=1.0
-    )
-
-    summary = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    summary = re.sub(r'\s+', ' ', summary).strip()
-
-    # Pass the summary to create_pdf
-    create_pdf(extracted_info, summary)
-
-    # Store data in SQLite database using extracted_info
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''INSERT INTO patients (name, age, gender, history, summary) 
-                 VALUES (?, ?, ?, ?, ?)''',
-              (extracted_info.get('Name', 'Not specified'),
-               extracted_info.get('Age', 'Not specified'),
-               extracted_info.get('Gender', 'Not specified'),  
-               extracted_info.get('Medical History', 'Not specified'),
-               summary))
-    conn.commit()
-    conn.close()
-
-    print("\n--- Consolidated Extracted Information ---")
-    for key, value in extracted_info.items():
-        print(f"{key}: {value}")
-    print("-----------------------------\n")
+    logger.info("Consolidated extracted information: %s", json.dumps(extracted_info))
 
-    return jsonify({"summary": summary})
+    return jsonify({"summary": summary, "extracted_info": extracted_info, "draft_id": draft_id})
 
-@app.route('/transcribe', methods=['POST'])
-def transcribe_audio():
+@app.route('/pdf', methods=['POST'])
+def download_pdf():
     if 'user' not in session:
         return jsonify({"error": "Unauthorized, please log in"}), 401
-    if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
-
-    audio_file = request.files['audio']
-    if audio_file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+    extracted_info = request.json.get("extracted_info") or {}
+    summary = request.json.get("summary", "")
+    if not summary:
+        return jsonify({"error": "No summary provided"}), 400
+    # Rendered in memory and streamed back; nothing touches disk
+    data = reports.render_bytes(extracted_info, summary)
+    return send_file(io.BytesIO(data), mimetype="application/pdf", as_attachment=True, download_name="discharge_summary.pdf")
+
+@app.route('/summarize/stream', methods=['POST'])
+def summarize_stream():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    ocr_text = request.json.get("ocr_text", "")
+    additional_text = request.json.get("additional_text", "")
+    audio_text = request.json.get("transcription", "")
 
-    if audio_file:
-        if not os.path.exists('uploads'):
-            os.makedirs('uploads')
+    if not ocr_text and not additional_text and not audio_text:
+        return jsonify({"error": "No input provided"}), 400
 
-        audio_path = os.path.join('uploads', audio_file.filename)
-        audio_file.save(audio_path)
+    # Shed before the stream starts, while a 429 can still be sent
+    admission.check("extraction", "generation")
+    draft_id = resolve_draft(request.json.get("draft_id"))
 
+    def events():
+        # Server-sent events: "draft" with the draft id, "fields" once extraction
+        # is done, then "token" pieces as they are generated, then "done" with the full summary
+        yield f"event: draft\ndata: {json.dumps({'draft_id': draft_id})}\n\n"
         try:
-            transcriber = aai.Transcriber()
-            transcript = transcriber.transcribe(audio_path)
-            if transcript.status == aai.TranscriptStatus.error:
-                return jsonify({"error": transcript.error}), 500
-            else:
-                return jsonify({"transcription": transcript.text})
+            for event, data in stream_pipeline(ocr_text, additional_text, audio_text, draft_id):
+                payload = data if isinstance(data, dict) else {"text": data}
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
-        finally:
-            try:
-                os.remove(audio_path)
-            except OSError as e:
-                print(f"Error: {e.filename} - {e.strerror}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream")
+    # Keep reverse proxies from buffering the stream
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    payload = {
+        "ocr_text": request.json.get("ocr_text", ""),
+        "additional_text": request.json.get("additional_text", ""),
+        "audio_text": request.json.get("transcription", ""),
+    }
+    if not any(payload.values()):
+        return jsonify({"error": "No input provided"}), 400
+
+    try:
+        job_id = job_queue.submit(payload)
+    except JobQueueFull:
+        response = jsonify({"error": "Too many summaries in progress, please retry shortly"})
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+        return response, 429
+    return jsonify({"job_id": job_id, "status_url": url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    if get_job(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def events():
+        # Push a server-sent event whenever the job's state changes
+        last_update = None
+        while True:
+            job = get_job(job_id)
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in TERMINAL_STATUSES:
+                break
+            time.sleep(0.5)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
+
+@app.route('/transcribe', methods=['POST'])
+def transcribe_audio():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+
+    # The 'audio' part of a form upload, or a raw audio body, is streamed to
+    # disk in one pass; request.files is never touched, so werkzeug does not
+    # spool the body first. The client's filename is never used on disk.
+    chunks = transcription.upload_chunks(request.stream, request.mimetype, request.mimetype_params.get("boundary"))
+    try:
+        with admission.limit("transcription"):
+            audio_path, digest = transcription.save_upload(chunks)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Identical uploads reuse the earlier transcript instead of a new paid job
+    result_cache = cache.get_cache()
+    cached_text = result_cache.get("transcription", transcription.cache_key(digest)) if result_cache else None
+    if cached_text is not None:
+        os.remove(audio_path)
+        return jsonify({"transcription": cached_text, "status": "done"})
+
+    # Upload and transcription happen off the request thread; the client polls
+    job = transcription.submit(audio_path, digest)
+    status_url = url_for('transcription_status', transcription_id=job["transcription_id"])
+    return jsonify({**job, "status_url": status_url}), 202, {"Location": status_url}
+
+@app.route('/transcribe/<transcription_id>', methods=['GET'])
+def transcription_status(transcription_id):
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    job = transcription.get_transcription(transcription_id)
+    if job is None:
+        return jsonify({"error": "Transcription not found"}), 404
+    return jsonify(job)
+
+@app.route('/transcribe/webhook', methods=['POST'])
+def transcription_webhook():
+    # Called by the provider, not a browser, so it is authenticated by shared secret
+    if not transcription.handle_webhook(request.get_json(silent=True) or {}, request.headers.get(transcription.WEBHOOK_AUTH_HEADER)):
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"ok": True})
 
 @app.route('/view_data')
 def view_data():
     if 'user' not in session:
         return redirect(url_for('login_page'))
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, name, age, gender, history, summary FROM patients")
-    data = c.fetchall()
-    conn.close()
-    return render_template('view_data.html', patients=data)
+    search = request.args.get('q', '').strip()
+    before = request.args.get('before', type=int)
+    since = request.args.get('since', '').strip()
+    try:
+        since_ts = time.mktime(time.strptime(since, "%Y-%m-%d")) if since else None
+    except ValueError:
+        since, since_ts = "", None
+    patients, next_cursor = storage.list_patients(before=before, search=search or None, since=since_ts)
+    return render_template('view_data.html', patients=patients, next_cursor=next_cursor,
+                           search=search, since=since, paged=before is not None)
+
+@app.route('/patients/<int:patient_id>/summary')
+def patient_summary(patient_id):
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized, please log in"}), 401
+    summary = storage.get_summary(patient_id)
+    if summary is None:
+        return jsonify({"error": "Patient not found"}), 404
+    return jsonify({"summary": summary})
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only; FLASK_DEBUG=1 enables the debugger and reloader.
+    # In production run under gunicorn (see gunicorn.conf.py).
+    models.start_background_warmup()
+    notifications.start_worker()
+    job_queue.start()
+    app.run()
\ No newline at end of file
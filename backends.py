@@ -0,0 +1,94 @@
+import os
+import re
+import shutil
+
+# Supported inference backends:
+#   torch       eager fp32 PyTorch (reference)
+#   torch-int8  PyTorch with dynamic int8 quantization of every Linear layer
+#   onnx        ONNX Runtime on an fp32 export
+#   onnx-int8   ONNX Runtime on a dynamically int8-quantized export
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+# Exported ONNX graphs are written here once and reused on later starts
+ONNX_EXPORT_DIR = os.environ.get("ONNX_EXPORT_DIR", "./models/onnx")
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+def quantize_torch(model):
+    """Dynamically quantizes a PyTorch model's Linear layers to int8 (weights int8, activations quantized on the fly)."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def export_dir(model_id, backend):
+    """Directory holding the ONNX export of model_id for an ONNX backend."""
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_id.strip("./"))
+    return os.path.join(ONNX_EXPORT_DIR, safe_name, backend)
+
+def _has_onnx(directory):
+    return os.path.isdir(directory) and any(name.endswith(".onnx") for name in os.listdir(directory))
+
+def _quantize_onnx_dir(src_dir, dst_dir):
+    # Copy configs/tokenizer files, then replace every graph with its int8 version
+    # under the same file name, so the ORT model classes load it unchanged
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    shutil.copytree(src_dir, dst_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns("*.onnx", "*.onnx_data"))
+    for name in os.listdir(src_dir):
+        if name.endswith(".onnx"):
+            quantize_dynamic(os.path.join(src_dir, name), os.path.join(dst_dir, name), weight_type=QuantType.QInt8)
+
+def _load_onnx(model_class, model_id, backend, **kwargs):
+    fp32_dir = export_dir(model_id, "onnx")
+    if not _has_onnx(fp32_dir):
+        model_class.from_pretrained(model_id, export=True, **kwargs).save_pretrained(fp32_dir)
+    if backend == "onnx-int8":
+        int8_dir = export_dir(model_id, "onnx-int8")
+        if not _has_onnx(int8_dir):
+            _quantize_onnx_dir(fp32_dir, int8_dir)
+        return model_class.from_pretrained(int8_dir, **kwargs)
+    return model_class.from_pretrained(fp32_dir, **kwargs)
+
+def load_seq2seq(model_path, backend=INFERENCE_BACKEND):
+    """
+    Loads the summarization model on the given backend. Every backend returns
+    an object with the transformers generate() API.
+    For ONNX, generation runs the encoder graph once and feeds the cached
+    self- and cross-attention key/values back into the decoder graph at each
+    step (use_cache=True) instead of re-running the whole prefix.
+    Args:
+        model_path (str): Local path or hub id of the fine-tuned BART model.
+        backend (str): One of BACKENDS.
+    """
+    _check_backend(backend)
+    if backend.startswith("onnx"):
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        return _load_onnx(ORTModelForSeq2SeqLM, model_path, backend, use_cache=True)
+
+    from transformers import BartForConditionalGeneration
+    model = BartForConditionalGeneration.from_pretrained(model_path)
+    # Inference only: disables dropout
+    model.eval()
+    if backend == "torch-int8":
+        model = quantize_torch(model)
+    return model
+
+def load_qa(model_name, backend=INFERENCE_BACKEND):
+    """
+    Loads the question-answering pipeline on the given backend.
+    Args:
+        model_name (str): Hub id of the QA model.
+        backend (str): One of BACKENDS.
+    """
+    _check_backend(backend)
+    from transformers import AutoTokenizer, pipeline
+    if backend.startswith("onnx"):
+        from optimum.onnxruntime import ORTModelForQuestionAnswering
+        model = _load_onnx(ORTModelForQuestionAnswering, model_name, backend)
+        return pipeline("question-answering", model=model, tokenizer=AutoTokenizer.from_pretrained(model_name))
+
+    qa = pipeline("question-answering", model=model_name)
+    qa.model.eval()
+    if backend == "torch-int8":
+        qa.model = quantize_torch(qa.model)
+    return qa
@@ -0,0 +1,220 @@
+"""
+Offline batch mode for backfilling discharge summaries from archived cases.
+
+Streams a manifest through OCR -> extraction -> generation -> PDF -> database
+on a pool of worker processes. Cases are read lazily and only a bounded
+number are in flight, so the corpus never has to fit in memory.
+
+Manifest: JSONL (one object per line) or CSV (with a header row). Columns:
+    id               Unique case id (required; used for resuming)
+    image            Scanned report: image, multi-page TIFF or PDF
+    notes            Text file with clinician notes
+    transcript       Text file with the transcribed consultation
+    ocr_text, additional_text, audio_text
+                     Inline text, used instead of the files above
+Relative paths are resolved against the manifest's directory.
+
+Results are appended to --output as JSONL as they complete. Patient rows are
+committed in batches together with a checkpoint, so re-running the same
+command skips every case already stored and retries the failed ones.
+
+Usage:
+    python batch.py cases.csv --output results.jsonl [--workers 8] [--run archive-2023]
+
+Notifications are not sent for backfilled cases.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+
+# Cases handed to the pool ahead of the workers, per worker
+PREFETCH_PER_WORKER = 2
+# Seconds between progress lines
+REPORT_INTERVAL = 10.0
+
+def read_manifest(path):
+    """Yields one case dict per manifest row, lazily."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if value}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _read_text(case, field, path_field, base_dir):
+    if case.get(field):
+        return case[field]
+    if case.get(path_field):
+        with open(os.path.join(base_dir, case[path_field]), "r", encoding="utf-8") as f:
+            return f.read()
+    return ""
+
+def _init_worker(torch_threads):
+    # Without this every worker starts one intra-op thread per core and they
+    # all fight over the same cores
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+def process_case(case, base_dir, pdf_dir):
+    """
+    Runs one case through the pipeline in a worker process. The database write
+    is left to the parent, which batches it with the checkpoint.
+    Returns:
+        dict: id, status and either the results and per-stage timings or the error.
+    """
+    from ocr import ocr_document
+    from pipeline import build_summary_input, extract_fields, generate_summary
+    import reports
+
+    timings = {}
+
+    @contextmanager
+    def stage(name):
+        start = time.perf_counter()
+        yield
+        timings[name] = time.perf_counter() - start
+
+    try:
+        with stage("ocr"):
+            ocr_text = case.get("ocr_text", "")
+            if not ocr_text and case.get("image"):
+                with open(os.path.join(base_dir, case["image"]), "rb") as f:
+                    # Parallelism is across cases here, so pages run in this process
+                    ocr_text = ocr_document(f.read(), parallel=False)["text"]
+        additional_text = _read_text(case, "additional_text", "notes", base_dir)
+        audio_text = _read_text(case, "audio_text", "transcript", base_dir)
+        if not (ocr_text or additional_text or audio_text):
+            raise ValueError("No input provided")
+
+        with stage("extraction"):
+            extracted_info = extract_fields(ocr_text, additional_text, audio_text)
+        with stage("generation"):
+            summary = generate_summary(build_summary_input(extracted_info, ocr_text, additional_text, audio_text))
+        with stage("pdf"):
+            pdf_path, _ = reports.write_pdf(extracted_info, summary, pdf_dir)
+    except Exception as e:
+        return {"id": case["id"], "status": "failed", "error": f"{type(e).__name__}: {e}", "timings": timings}
+    return {
+        "id": case["id"],
+        "status": "done",
+        "extracted_info": extracted_info,
+        "summary": summary,
+        "pdf_path": pdf_path,
+        "timings": timings,
+    }
+
+class Progress:
+    """Counts outcomes and prints throughput and mean stage times."""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.stage_totals = {}
+
+    def add(self, result):
+        if result["status"] == "done":
+            self.done += 1
+        else:
+            self.failed += 1
+        for name, seconds in result["timings"].items():
+            self.stage_totals[name] = self.stage_totals.get(name, 0.0) + seconds
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < REPORT_INTERVAL:
+            return
+        self.last_report = now
+        elapsed = now - self.start
+        processed = self.done + self.failed
+        stages = " ".join(f"{name}={total / processed:.2f}s" for name, total in self.stage_totals.items()) if processed else ""
+        print(f"[{elapsed:8.1f}s] done {self.done}  failed {self.failed}  skipped {self.skipped}  "
+              f"{processed / elapsed if elapsed else 0:.2f} cases/s  {processed * 3600 / elapsed if elapsed else 0:.0f} cases/h  mean {stages}",
+              file=sys.stderr, flush=True)
+
+def run(manifest, output, run_name, workers, commit_every, pdf_dir):
+    import models
+    import storage
+
+    storage.init_db()
+    completed = storage.completed_cases(run_name)
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+
+    # Load the models once here; forked workers share them copy-on-write
+    models.warmup()
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    progress = Progress()
+    pending_rows, pending_lines, pending_ids = [], [], []
+
+    def flush(out):
+        if pending_rows:
+            storage.save_patients(pending_rows, checkpoint=(run_name, pending_ids))
+        for line in pending_lines:
+            out.write(line)
+        out.flush()
+        pending_rows.clear()
+        pending_lines.clear()
+        pending_ids.clear()
+
+    def collect(future, out):
+        result = future.result()
+        progress.add(result)
+        pending_lines.append(json.dumps(result) + "\n")
+        if result["status"] == "done":
+            pending_rows.append((result["extracted_info"], result["summary"]))
+            pending_ids.append(result["id"])
+        if len(pending_lines) >= commit_every:
+            flush(out)
+        progress.report()
+
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    with open(output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(torch_threads,)) as pool:
+        in_flight = set()
+        for case in read_manifest(manifest):
+            case["id"] = str(case["id"])
+            if case["id"] in completed:
+                progress.skipped += 1
+                continue
+            in_flight.add(pool.submit(process_case, case, base_dir, pdf_dir))
+            # Bounded prefetch keeps memory flat however long the manifest is
+            while len(in_flight) >= workers * PREFETCH_PER_WORKER:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future, out)
+        for future in in_flight:
+            collect(future, out)
+        flush(out)
+    progress.report(force=True)
+    return progress
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill discharge summaries from a JSONL or CSV manifest.")
+    parser.add_argument("manifest", help="JSONL or CSV manifest of cases")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--run", help="Checkpoint name; defaults to the manifest's absolute path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: one per core)")
+    parser.add_argument("--commit-every", type=int, default=20, help="Results per database commit")
+    parser.add_argument("--pdf-dir", default=os.path.join("static", "pdfs"))
+    args = parser.parse_args()
+
+    progress = run(args.manifest, args.output, args.run or os.path.abspath(args.manifest),
+                   max(1, args.workers), max(1, args.commit_every), args.pdf_dir)
+    if progress.failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
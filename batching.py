@@ -0,0 +1,162 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import decoding
+import metrics
+import models
+import tracing
+
+# Scheduler limits
+GENERATION_MAX_BATCH = int(os.environ.get("GENERATION_MAX_BATCH", "8"))
+GENERATION_MAX_WAIT_MS = float(os.environ.get("GENERATION_MAX_WAIT_MS", "20"))
+# Requests gathered per scheduling round, so they can be regrouped by length
+GENERATION_WINDOW_FACTOR = 4
+
+QUEUE_DEPTH = metrics.Gauge("generation_queue_depth", "Generation requests waiting for a batch")
+BATCH_SIZE = metrics.Histogram("generation_batch_size", "Requests per generate() call", buckets=(1, 2, 4, 8, 16, 32))
+BATCH_OCCUPANCY = metrics.Histogram("generation_batch_occupancy", "Batch size as a fraction of the maximum batch size", buckets=(0.125, 0.25, 0.5, 0.75, 1.0))
+BATCH_WAIT = metrics.Histogram("generation_batch_wait_seconds", "Time a request waited before its batch started")
+BATCH_DURATION = metrics.Histogram("generation_batch_duration_seconds", "Wall time of one batched generate() call")
+
+class _Request:
+    def __init__(self, input_ids, generate_kwargs):
+        self.input_ids = input_ids
+        self.generate_kwargs = generate_kwargs
+        # Requests can only share a generate() call if their parameters match.
+        # Deadlines almost never match, so only whether there is one is part
+        # of the key; the batch runs to its tightest remaining deadline
+        self.max_time = generate_kwargs.get("max_time")
+        self.group_key = (tuple(sorted((k, v) for k, v in generate_kwargs.items() if k != "max_time")),
+                          self.max_time is not None)
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class GenerationBatcher:
+    """
+    Collects concurrent generation requests for a short window, groups them by
+    generation parameters and similar token length, pads each group and runs
+    one model.generate() call per group, then routes each decoded output back
+    to its caller.
+    Args:
+        max_batch_size (int): Largest number of requests per generate() call.
+        max_wait_ms (float): How long to wait for more requests once one arrives.
+        tokenizer: Tokenizer; defaults to the registry's BART tokenizer.
+        model: Seq2seq model; defaults to the registry's BART model.
+    """
+    def __init__(self, max_batch_size=GENERATION_MAX_BATCH, max_wait_ms=GENERATION_MAX_WAIT_MS, tokenizer=None, model=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.tokenizer = tokenizer or models.get_tokenizer()
+        self.model = model or models.get_summarizer()
+        self.max_input_length = models.input_token_limit(self.tokenizer, self.model)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, max_input_length=None, **generate_kwargs):
+        """
+        Queues a prompt for generation. Tokenization happens on the caller's thread.
+        Args:
+            text (str): Prompt to generate from.
+            max_input_length (int): Input tokens kept after truncation. Defaults
+                to the model's position embedding limit.
+            **generate_kwargs: Arguments for model.generate (num_beams, max_length, ...),
+                or decoding.generation_kwargs() output.
+        Returns:
+            Future: Resolves to the decoded output text. Its cut_off attribute
+            is True when generation stopped at the batch's deadline.
+        """
+        with tracing.span("generation.tokenize") as current:
+            input_ids = self.tokenizer(text, max_length=max_input_length or self.max_input_length, truncation=True)["input_ids"]
+            current.set(input_tokens=len(input_ids))
+        request = _Request(input_ids, generate_kwargs)
+        self._queue.put(request)
+        QUEUE_DEPTH.inc()
+        return request.future
+
+    def generate(self, text, timeout=None, **kwargs):
+        """Blocking wrapper around submit()."""
+        return self.submit(text, **kwargs).result(timeout=timeout)
+
+    def _collect(self):
+        # Block for the first request, then keep the window open for stragglers
+        requests = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        limit = self.max_batch_size * GENERATION_WINDOW_FACTOR
+        while len(requests) < limit:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                requests.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        QUEUE_DEPTH.dec(len(requests))
+        return requests
+
+    def _batches(self, requests):
+        # Group by generation parameters, then sort by length so each padded
+        # batch holds inputs of similar size
+        groups = {}
+        for request in requests:
+            groups.setdefault(request.group_key, []).append(request)
+        for group in groups.values():
+            group.sort(key=lambda r: len(r.input_ids))
+            for i in range(0, len(group), self.max_batch_size):
+                yield group[i:i + self.max_batch_size]
+
+    def _run(self):
+        while True:
+            for batch in self._batches(self._collect()):
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        for request in batch:
+            BATCH_WAIT.observe(start - request.enqueued_at)
+        BATCH_SIZE.observe(len(batch))
+        BATCH_OCCUPANCY.observe(len(batch) / self.max_batch_size)
+        generate_kwargs = decoding.expand(batch[0].generate_kwargs)
+        deadlines = [r.max_time - (start - r.enqueued_at) for r in batch if r.max_time is not None]
+        if deadlines:
+            generate_kwargs["max_time"] = max(min(deadlines), 1e-3)
+        try:
+            with tracing.span("generation.batch", batch_size=len(batch)):
+                inputs = self.tokenizer.pad({"input_ids": [r.input_ids for r in batch]}, return_tensors="pt")
+                generate_start = time.perf_counter()
+                outputs = self.model.generate(
+                    inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    **generate_kwargs
+                )
+                generate_duration = time.perf_counter() - generate_start
+                new_tokens = int((outputs != self.tokenizer.pad_token_id).sum())
+                tracing.record_generation(new_tokens, generate_duration,
+                                          num_beams=generate_kwargs.get("num_beams", 1), batch_size=len(batch))
+                texts = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+        else:
+            cut_off = bool(deadlines) and generate_duration >= generate_kwargs["max_time"]
+            for request, text in zip(batch, texts):
+                request.future.cut_off = cut_off
+                request.future.set_result(text)
+        BATCH_DURATION.observe(time.perf_counter() - start)
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    """
+    Returns the process-wide batcher, starting it on first use (so under a
+    forking server each worker starts its own scheduler thread after the fork).
+    """
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = GenerationBatcher()
+    return _batcher
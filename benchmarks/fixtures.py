@@ -0,0 +1,76 @@
+import random
+
+# Vocabulary for synthetic cases
+FIRST_NAMES = ["John", "Anita", "Rahul", "Mary", "Sameer", "Priya", "Thomas", "Fatima", "Arjun", "Leela"]
+LAST_NAMES = ["Mathew", "Rao", "Nair", "Joseph", "Khan", "Menon", "George", "Ali", "Varma", "Pillai"]
+CONDITIONS = ["hypertension", "type 2 diabetes", "asthma", "chronic kidney disease", "atrial fibrillation",
+              "hypothyroidism", "coronary artery disease", "pneumonia", "osteoarthritis", "migraine"]
+MEDICATIONS = ["aspirin", "metformin", "atorvastatin", "amlodipine", "insulin glargine", "levothyroxine",
+               "salbutamol", "paracetamol", "ceftriaxone", "clopidogrel", "pantoprazole", "furosemide"]
+PROCEDURES = ["coronary angiography", "laparoscopic appendectomy", "upper GI endoscopy", "bronchoscopy",
+              "percutaneous coronary intervention", "closed reduction", "lumbar puncture", "colonoscopy"]
+FINDINGS = ["mild cardiomegaly", "right lower lobe consolidation", "no pleural effusion", "normal liver echotexture",
+            "small renal calculus", "degenerative changes of the lumbar spine", "clear lung fields",
+            "mild hepatomegaly", "no focal neurological deficit"]
+STUDIES = ["CHEST X-RAY PA VIEW", "CT ABDOMEN", "MRI BRAIN", "USG ABDOMEN", "ECHOCARDIOGRAM"]
+
+def _fill(rng, target_words, make_sentence):
+    sentences, words = [], 0
+    while words < target_words:
+        sentence = make_sentence(rng)
+        sentences.append(sentence)
+        words += len(sentence.split())
+    return sentences
+
+def make_report(rng, target_words, name, age, gender):
+    """Synthetic radiology report, as OCR would return it (one statement per line, with header noise)."""
+    header = [
+        "ABC HOSPITAL DEPARTMENT OF RADIOLOGY",
+        "www.abchospital.example.com",
+        rng.choice(STUDIES),
+        f"Patient: {name} Age: {age} Sex: {gender}",
+        f"{rng.randint(10000000, 99999999)}",
+    ]
+    body = _fill(rng, target_words, lambda r: f"Findings show {r.choice(FINDINGS)}, {r.choice(['likely', 'consistent with', 'suggestive of'])} {r.choice(CONDITIONS)}.")
+    return "\n".join(header + body + [f"Page 1 of {max(1, target_words // 300)}", "Dr. Radiologist"])
+
+def make_notes(rng, target_words):
+    """Synthetic free-text clinical notes."""
+    templates = [
+        lambda r: f"{r.choice(PROCEDURES).capitalize()} performed on day {r.randint(1, 5)} without complications.",
+        lambda r: f"Started on {r.choice(MEDICATIONS)} {r.choice([5, 10, 20, 40, 75, 500])} mg {r.choice(['once', 'twice'])} daily.",
+        lambda r: f"Patient has a history of {r.choice(CONDITIONS)}.",
+        lambda r: f"Vitals stable, {r.choice(FINDINGS)} on review.",
+    ]
+    return " ".join(_fill(rng, target_words, lambda r: r.choice(templates)(r)))
+
+def make_transcript(rng, target_words, age):
+    """Synthetic doctor-patient conversation."""
+    turns = [
+        lambda r: f"Doctor: Do you have any history of {r.choice(CONDITIONS)}? Patient: {r.choice(['No.', 'Yes, for a few years.', 'Not that I know of.'])}",
+        lambda r: f"Doctor: Are you taking {r.choice(MEDICATIONS)} regularly? Patient: Yes, every day.",
+        lambda r: f"Doctor: Any family history of {r.choice(CONDITIONS)}? Patient: My {r.choice(['father', 'mother', 'brother'])} has it.",
+        lambda r: f"Patient: I'm {age} and I have had {r.choice(CONDITIONS)} since last year. Doctor: I see.",
+        lambda r: "Doctor: How are you feeling today? Patient: Much better than when I came in.",
+    ]
+    return " ".join(_fill(rng, target_words, lambda r: r.choice(turns)(r)))
+
+def make_case(size_words, seed=0):
+    """
+    Builds one synthetic case of roughly size_words words, split 30/20/50
+    between the image report, the typed notes and the conversation.
+    Args:
+        size_words (int): Approximate total input length in words.
+        seed (int): Random seed; the same seed and size give the same case.
+    Returns:
+        dict: ocr_text, additional_text and audio_text.
+    """
+    rng = random.Random(f"{seed}-{size_words}")
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    age = rng.randint(18, 90)
+    gender = rng.choice(["Male", "Female"])
+    return {
+        "ocr_text": make_report(rng, int(size_words * 0.3), name, age, gender),
+        "additional_text": make_notes(rng, int(size_words * 0.2)),
+        "audio_text": make_transcript(rng, int(size_words * 0.5), age),
+    }
@@ -0,0 +1,257 @@
+"""
+End-to-end pipeline benchmark on synthetic clinical cases.
+
+Tesseract, AssemblyAI and Twilio are replaced by offline stand-ins (see
+stubs.py); everything else, including the models, the transcription upload
+and poll loop and notification delivery, runs for real. For each
+stage and input size the harness reports p50/p95/mean latency, throughput and
+peak RSS, plus a log-log scaling exponent per stage, as JSON.
+
+Usage (from the repository root):
+    python -m benchmarks.run --sizes 100 400 1600 --repeats 5 --output bench_results.json
+    python -m benchmarks.run --compare bench_results.json --output new.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.fixtures import make_case
+from benchmarks import stubs
+
+STAGES = ("clean_ocr_text", "ocr", "extraction", "generation", "pdf", "transcription", "notification")
+DEFAULT_SIZES = (100, 400, 1600, 6400)
+# Synthetic audio bytes per transcript word, and outbox messages per 100 words
+AUDIO_BYTES_PER_WORD = 2048
+MESSAGES_PER_100_WORDS = 1
+
+class RssSampler:
+    """Tracks this process's peak resident set size while a stage runs."""
+    INTERVAL = 0.005
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource
+            # Not Linux: fall back to the lifetime peak (kilobytes on most platforms)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            time.sleep(self.INTERVAL)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def render_page(text):
+    """Renders text onto a white PNG, standing in for a scanned report page."""
+    from PIL import Image, ImageDraw
+    lines = text.split("\n")
+    image = Image.new("L", (1700, max(2200, 30 * len(lines) + 100)), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((80, 60 + 30 * i), line, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def transcribe(audio):
+    """Uploads audio through transcription.py and polls the fake provider until it finishes."""
+    import transcription
+    path, digest = transcription.save_upload([audio])
+    job = transcription.submit(path, digest)
+    while job["status"] not in transcription.TERMINAL_STATUSES:
+        time.sleep(0.01)
+        job = transcription.get_transcription(job["transcription_id"])
+    if job["status"] != "done":
+        raise RuntimeError(f"Transcription failed: {job['error']}")
+    return job["transcription"]
+
+def deliver_batch(count, body):
+    """Queues count messages in the outbox, then claims and delivers them as the worker would."""
+    import notifications
+    now = time.time()
+    with notifications.storage.connect() as conn:
+        conn.executemany(
+            '''INSERT INTO notifications (channel, recipient, body, media_url, status, next_attempt_at, created_at, updated_at)
+               VALUES ('whatsapp', '+10000000000', ?, NULL, 'pending', ?, ?, ?)''',
+            [(body, now, now, now)] * count
+        )
+    rows = notifications.claim_due(limit=count)
+    notifications.deliver(rows)
+    return len(rows)
+
+def make_stage(stage, case):
+    """Returns a zero-argument callable that runs one stage on one case."""
+    if stage == "clean_ocr_text":
+        from ocr import clean_ocr_text
+        return lambda: clean_ocr_text(case["ocr_text"])
+    if stage == "ocr":
+        from ocr import ocr_document
+        data = render_page(case["ocr_text"])
+        return lambda: ocr_document(data)
+    if stage == "extraction":
+        from extractor import extract_information_from_text
+        return lambda: extract_information_from_text(case["ocr_text"], case["additional_text"], case["audio_text"])
+    if stage == "generation":
+        from pipeline import build_summary_input, generate_summary
+        prompt = build_summary_input({}, case["ocr_text"], case["additional_text"], case["audio_text"])
+        return lambda: generate_summary(prompt)
+    if stage == "pdf":
+        # Time the render itself; create_pdf only queues it
+        from reports import write_pdf
+        info = {"Name": "Benchmark Patient", "Discharge Date": "2000-01-01", "Medical History": "hypertension"}
+        summary = case["additional_text"] + " " + case["audio_text"]
+        return lambda: write_pdf(info, summary)
+    if stage == "transcription":
+        import transcription
+        # Every poll reaches the provider, so the stage measures the full round trip
+        transcription.TRANSCRIBE_POLL_INTERVAL = 0
+        # Audio long enough to hold the case's conversation
+        words = len(case["audio_text"].split())
+        audio = random.Random(words).randbytes(AUDIO_BYTES_PER_WORD * words)
+        return lambda: transcribe(audio)
+    if stage == "notification":
+        words = sum(len(text.split()) for text in case.values())
+        count = max(1, words * MESSAGES_PER_100_WORDS // 100)
+        return lambda: deliver_batch(count, "Here is your discharge summary PDF.")
+    raise ValueError(f"Unknown stage {stage!r}")
+
+def bench_stage(stage, size, repeats, seed):
+    case = make_case(size, seed)
+    with stubs.offline(ocr_text=case["ocr_text"], transcript_text=case["audio_text"]):
+        run = make_stage(stage, case)
+        # Untimed first call: model loading and other one-off setup
+        run()
+        latencies = []
+        with RssSampler() as rss:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                run()
+                latencies.append(time.perf_counter() - start)
+    return {
+        "stage": stage,
+        "size_words": size,
+        "repeats": repeats,
+        "p50_seconds": percentile(latencies, 0.5),
+        "p95_seconds": percentile(latencies, 0.95),
+        "mean_seconds": statistics.mean(latencies),
+        "throughput_per_second": repeats / sum(latencies) if sum(latencies) else None,
+        "peak_rss_mb": rss.peak / (1024 * 1024),
+    }
+
+def scaling_exponent(points):
+    """Least-squares slope of log(p50) against log(size): ~1 is linear, ~2 quadratic."""
+    points = [(math.log(size), math.log(latency)) for size, latency in points if latency > 0]
+    if len(points) < 2:
+        return None
+    mean_x = statistics.mean(x for x, _ in points)
+    mean_y = statistics.mean(y for _, y in points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if denominator == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import backends
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "inference_backend": backends.INFERENCE_BACKEND,
+    }
+
+def compare(baseline, current):
+    """Prints the p50 change of every stage/size present in both runs."""
+    previous = {(r["stage"], r["size_words"]): r for r in baseline["results"]}
+    print(f"\n{'stage':<16}{'words':>8}{'old p50':>12}{'new p50':>12}{'change':>10}")
+    for result in current["results"]:
+        old = previous.get((result["stage"], result["size_words"]))
+        if old is None:
+            continue
+        change = (result["p50_seconds"] - old["p50_seconds"]) / old["p50_seconds"] * 100 if old["p50_seconds"] else 0.0
+        print(f"{result['stage']:<16}{result['size_words']:>8}{old['p50_seconds']:>12.4f}{result['p50_seconds']:>12.4f}{change:>9.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the discharge summary pipeline on synthetic cases.")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="Input sizes in words")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Measure the stages themselves, not the result cache
+    import cache
+    cache.CACHE_ENABLED = False
+    # Keep benchmark transcriptions, uploads and outbox rows out of the app's database
+    import notifications
+    import storage
+    import transcription
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    storage.DB_PATH = os.path.join(workdir, "bench.db")
+    transcription.UPLOAD_DIR = os.path.join(workdir, "uploads")
+    transcription.init_transcriptions_table()
+    notifications.init_notifications_table()
+
+    results = []
+    for stage in args.stages:
+        for size in args.sizes:
+            result = bench_stage(stage, size, args.repeats, args.seed)
+            results.append(result)
+            print(f"{stage:<16}{size:>8} words  p50 {result['p50_seconds']:.4f}s  p95 {result['p95_seconds']:.4f}s  peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    report = {
+        "meta": metadata(),
+        "results": results,
+        "scaling": {
+            stage: scaling_exponent([(r["size_words"], r["p50_seconds"]) for r in results if r["stage"] == stage])
+            for stage in args.stages
+        },
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import time
+from contextlib import contextmanager
+from fake_assemblyai import FakeAssemblyAI
+
+class _FakeMessage:
+    def __init__(self, sid):
+        self.sid = sid
+
+class _FakeMessages:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, **kwargs):
+        time.sleep(self.client.latency)
+        self.client.sent.append(kwargs)
+        return _FakeMessage(f"SMfake{len(self.client.sent)}")
+
+class FakeTwilioClient:
+    """Stand-in for twilio.rest.Client that records messages instead of sending them."""
+    latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        self.sent = []
+        self.messages = _FakeMessages(self)
+
+@contextmanager
+def offline(ocr_text="", transcript_text="", ocr_latency=0.0, transcription_latency=0.0, notification_latency=0.0):
+    """
+    Replaces Tesseract, AssemblyAI and Twilio with offline stand-ins for the
+    duration of the block. Each returns canned output after an optional
+    simulated latency, so the rest of the pipeline runs for real. AssemblyAI
+    is the in-process fake API server from fake_assemblyai.py, so the real SDK
+    and transcription.py's upload, submit and poll code paths are exercised.
+    """
+    import assemblyai
+    import pytesseract
+    import notifications
+
+    def image_to_string(image, *args, **kwargs):
+        time.sleep(ocr_latency)
+        return ocr_text
+
+    FakeTwilioClient.latency = notification_latency
+
+    server = FakeAssemblyAI(delay=transcription_latency, text=transcript_text or None).start()
+    saved = (pytesseract.image_to_string, assemblyai.settings.base_url, assemblyai.settings.api_key)
+    pytesseract.image_to_string = image_to_string
+    assemblyai.settings.base_url = server.url
+    assemblyai.settings.api_key = assemblyai.settings.api_key or "benchmark"
+    saved_transport = notifications.set_transport(notifications.TwilioTransport(client=FakeTwilioClient()))
+    try:
+        yield
+    finally:
+        pytesseract.image_to_string, assemblyai.settings.base_url, assemblyai.settings.api_key = saved
+        notifications.set_transport(saved_transport)
+        server.stop()
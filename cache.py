@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import metrics
+
+# On-disk cache location and size bound
+CACHE_DIR = os.environ.get("CACHE_DIR", "cache")
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") == "1"
+# Bump when a stage's code changes in a way that changes its output
+CACHE_VERSION = "1"
+# Eviction frees space down to this fraction of the bound, so it doesn't run on every write
+EVICT_TO_FRACTION = 0.9
+
+CACHE_HITS = metrics.Counter("cache_hits_total", "Result cache hits by stage")
+CACHE_MISSES = metrics.Counter("cache_misses_total", "Result cache misses by stage")
+
+def make_key(namespace, *parts, **params):
+    """
+    Builds a content-addressed cache key.
+    Args:
+        namespace (str): Pipeline stage, e.g. "ocr" or "generation".
+        *parts: Content the result depends on (bytes or str).
+        **params: Model versions and parameters the result depends on.
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{namespace}\0{CACHE_VERSION}\0".encode())
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Content-addressed, size-bounded store for stage results. Values are JSON
+    files under the cache directory; an SQLite index tracks sizes and last
+    access times for LRU eviction, and is safe to share between processes.
+    Args:
+        directory (str): Cache directory.
+        max_bytes (int): Total size of stored values before eviction kicks in.
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS entries
+                        (key TEXT PRIMARY KEY,
+                         namespace TEXT NOT NULL,
+                         size INTEGER NOT NULL,
+                         last_access REAL NOT NULL)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=30)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, namespace, key):
+        """
+        Returns:
+            The cached value, or None on a miss.
+        """
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            CACHE_MISSES.inc(stage=namespace)
+            return None
+        conn = self._connect()
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        conn.close()
+        CACHE_HITS.inc(stage=namespace)
+        return value
+
+    def set(self, namespace, key, value):
+        """Stores a JSON-serializable value, evicting least recently used entries if over budget."""
+        data = json.dumps(value).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial value
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, namespace, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, namespace, len(data), time.time())
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total)
+            conn.commit()
+            conn.close()
+
+    def _evict(self, conn, total):
+        target = self.max_bytes * EVICT_TO_FRACTION
+        rows = conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if total <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def get_or_compute(self, namespace, key, compute):
+        """
+        Returns the cached value for key, computing and storing it on a miss.
+        Args:
+            namespace (str): Stage name, used for hit/miss counters.
+            key (str): Key from make_key.
+            compute (callable): Produces the value on a miss.
+        """
+        value = self.get(namespace, key)
+        if value is None:
+            value = compute()
+            self.set(namespace, key, value)
+        return value
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count and bytes per stage, plus this process's hit/miss counts.
+        """
+        conn = self._connect()
+        rows = conn.execute("SELECT namespace, COUNT(*), SUM(size) FROM entries GROUP BY namespace").fetchall()
+        conn.close()
+        return {
+            namespace: {
+                "entries": count,
+                "bytes": size,
+                "hits": CACHE_HITS.value(stage=namespace),
+                "misses": CACHE_MISSES.value(stage=namespace),
+            }
+            for namespace, count, size in rows
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Returns the process-wide result cache, or None if caching is disabled."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+def cached(namespace, key, compute):
+    """get_or_compute on the process-wide cache; just computes when caching is disabled."""
+    result_cache = get_cache()
+    if result_cache is None:
+        return compute()
+    return result_cache.get_or_compute(namespace, key, compute)
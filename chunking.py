@@ -0,0 +1,102 @@
+import re
+
+# A sentence ends at terminal punctuation or a line break
+SENTENCE_RE = re.compile(r'[^.!?\n]+(?:[.!?]+|\n|$)')
+
+def split_sections(text, headers, instruction):
+    """
+    Splits a summarization prompt into its preamble, its note sections and its
+    closing instruction. Each header is looked for on a line of its own, after
+    the previous one, so header text quoted in the notes is not taken for a
+    section boundary.
+    Args:
+        text (str): Prompt built by build_summary_input.
+        headers (list): Section headers, in the order they appear.
+        instruction (str): Closing instruction line.
+    Returns:
+        tuple: (preamble, [(header, body), ...]) with the instruction removed.
+    """
+    if text.endswith(instruction):
+        text = text[:-len(instruction)]
+    positions, search_from = [], 0
+    for header in headers:
+        match = re.compile(rf"^{re.escape(header)}[ \t]*$", re.MULTILINE).search(text, search_from)
+        if match:
+            positions.append((match.start(), match.end(), header))
+            search_from = match.end()
+    if not positions:
+        return text.strip(), []
+    preamble = text[:positions[0][0]].strip()
+    sections = []
+    for i, (_, body_start, header) in enumerate(positions):
+        end = positions[i + 1][0] if i + 1 < len(positions) else len(text)
+        sections.append((header, text[body_start:end].strip()))
+    return preamble, sections
+
+def split_sentences(text):
+    """Yields the sentences of text, stripped, in order."""
+    for match in SENTENCE_RE.finditer(text):
+        sentence = match.group(0).strip()
+        if sentence:
+            yield sentence
+
+def _pieces(text, count_tokens, budget):
+    # (piece, tokens) for every sentence, splitting sentences longer than the
+    # budget at word boundaries (transcripts often have no punctuation)
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if tokens <= budget:
+            yield sentence, tokens
+            continue
+        words, word_tokens = [], 0
+        for word in sentence.split():
+            n = count_tokens(" " + word)
+            if words and word_tokens + n > budget:
+                yield " ".join(words), word_tokens
+                words, word_tokens = [], 0
+            words.append(word)
+            word_tokens += n
+        if words:
+            yield " ".join(words), word_tokens
+
+def window_text(text, count_tokens, budget, overlap):
+    """
+    Packs whole sentences into windows of at most budget tokens. Consecutive
+    windows share up to overlap tokens of trailing sentences, so facts that
+    straddle a boundary appear whole in at least one window.
+    Args:
+        text (str): Section body.
+        count_tokens (callable): Returns the token count of a string.
+        budget (int): Maximum tokens per window.
+        overlap (int): Maximum tokens repeated from the previous window.
+    Yields:
+        str: Window text.
+    """
+    window, window_tokens, fresh = [], 0, False
+    for piece, tokens in _pieces(text, count_tokens, budget):
+        if window and window_tokens + tokens > budget:
+            yield " ".join(p for p, _ in window)
+            # Carry the tail of this window into the next one
+            carried, carried_tokens = [], 0
+            for p, n in reversed(window):
+                if carried_tokens + n > overlap or carried_tokens + n + tokens > budget:
+                    break
+                carried.insert(0, (p, n))
+                carried_tokens += n
+            window, window_tokens, fresh = carried, carried_tokens, False
+        window.append((piece, tokens))
+        window_tokens += tokens
+        fresh = True
+    if fresh:
+        yield " ".join(p for p, _ in window)
+
+def iter_chunks(sections, count_tokens, budget, overlap):
+    """
+    Yields (header, window) for every section, windowing each section separately
+    so a chunk never mixes the image report with the conversation.
+    """
+    for header, body in sections:
+        if not body or body == "None provided":
+            continue
+        for window in window_text(body, count_tokens, budget, overlap):
+            yield header, window
@@ -0,0 +1,166 @@
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+# Trigger lexicon for ConText/NegEx-style classification: category -> phrases
+TRIGGERS = {
+    "negated": [
+        "no history of",
+        "does not have",
+        "not have",
+        "without",
+        "no evidence of",
+        "not diagnosed with",
+        "not that i'm aware of",
+        "not that i know of",
+        "no",
+        "not",
+        "never had",
+        "absence of",
+        "negative for",
+    ],
+    "family": [
+        "in your family",
+        "family history",
+        "parents",
+        "siblings",
+        "family",
+        "relatives",
+    ],
+    "hypothetical": [
+        "suggestive of",
+        "likely",
+        "possible",
+        "probable",
+        "may be",
+        "consistent with",
+        "indicative of",
+    ],
+}
+
+# Sentence-shape rules that are not simple trigger phrases
+QUESTION_RE = re.compile(r'\b(do you|have you|are there|is there|any|what|when|where|how|did you|can you)\b.*\?|[\?\!]')
+PATIENT_RE = re.compile(r'\b(the patient|patient|i|he|she)\b.*\b(has|had|history of|diagnosed with)\b')
+
+# A scoped negation ("no fever, started aspirin") stops at the end of its clause
+SCOPE_END_RE = re.compile(r'[,;:]|\b(?:but|however|although|except)\b')
+
+EntityContext = namedtuple("EntityContext", ["sentence_idx", "negated", "question", "family", "hypothetical", "patient"])
+
+def compile_triggers(triggers):
+    """
+    Compiles a trigger lexicon into a single alternation regex with one named
+    group per category, so a sentence is scanned once for every trigger.
+    Longer phrases are tried first so "no history of" wins over "no".
+    Args:
+        triggers (dict): Category -> list of trigger phrases.
+    Returns:
+        re.Pattern: Compiled trigger automaton.
+    """
+    groups = []
+    for category, phrases in triggers.items():
+        alternatives = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+        groups.append(f"(?P<{category}>\\b(?:{alternatives})\\b)")
+    return re.compile("|".join(groups))
+
+class SentenceIndex:
+    """
+    Maps character offsets to sentences with a binary search over sentence start
+    offsets instead of scanning every sentence.
+    Args:
+        sents (list): spaCy sentence spans in document order.
+    """
+    def __init__(self, sents):
+        self.sents = sents
+        self.starts = [sent.start_char for sent in sents]
+
+    def find(self, offset):
+        """Returns the index of the sentence containing offset, or -1."""
+        idx = bisect_right(self.starts, offset) - 1
+        if idx < 0 or offset > self.sents[idx].end_char:
+            return -1
+        return idx
+
+class ContextEngine:
+    """
+    Classifies entity mentions as negated, family history, hypothetical, part of
+    a question and/or attributed to the patient, from the sentence they occur in.
+    Each sentence is scanned at most once per classify() call, however many
+    entities it contains.
+    Args:
+        triggers (dict): Category -> trigger phrases. Defaults to TRIGGERS.
+    """
+    def __init__(self, triggers=None):
+        self.triggers = triggers or TRIGGERS
+        self._trigger_re = compile_triggers(self.triggers)
+
+    def sentence_flags(self, sentence_text):
+        """
+        Args:
+            sentence_text (str): Lowercased sentence text.
+        Returns:
+            dict: Category -> bool, plus "question", "patient" and
+            "negation_ends", the end offsets of the negation triggers.
+        """
+        triggers = list(self._trigger_re.finditer(sentence_text))
+        found = {match.lastgroup for match in triggers}
+        flags = {category: category in found for category in self.triggers}
+        flags["negation_ends"] = [match.end() for match in triggers if match.lastgroup == "negated"]
+        flags["question"] = bool(QUESTION_RE.search(sentence_text))
+        flags["patient"] = bool(PATIENT_RE.search(sentence_text))
+        return flags
+
+    def classify(self, sentence_index, offsets, scoped=False):
+        """
+        Classifies every entity in a single pass.
+        Args:
+            sentence_index (SentenceIndex): Sentence lookup for the document.
+            offsets (list): Start character offset of each entity mention.
+            scoped (bool): Only negate a mention that follows a negation trigger
+                in the same clause, so "started aspirin, no fever" keeps
+                aspirin. By default a trigger anywhere in the sentence negates it.
+        Returns:
+            list: One EntityContext per offset, or None where the offset falls
+            outside every sentence.
+        """
+        cache = {}
+
+        def flags_for(idx):
+            if idx not in cache:
+                cache[idx] = self.sentence_flags(sentence_index.sents[idx].text.lower())
+            return cache[idx]
+
+        def negated_before(idx, offset):
+            sent = sentence_index.sents[idx]
+            position = offset - sent.start_char
+            ends = [end for end in flags_for(idx)["negation_ends"] if end <= position]
+            return bool(ends) and not SCOPE_END_RE.search(sent.text.lower(), ends[-1], position)
+
+        contexts = []
+        for offset in offsets:
+            idx = sentence_index.find(offset)
+            if idx == -1:
+                contexts.append(None)
+                continue
+            flags = flags_for(idx)
+            negated = negated_before(idx, offset) if scoped else flags.get("negated", False)
+            # A question answered with a negation in the next sentence ("Any diabetes? No.")
+            if not negated and flags["question"] and idx + 1 < len(sentence_index.sents):
+                negated = flags_for(idx + 1).get("negated", False)
+            contexts.append(EntityContext(
+                sentence_idx=idx,
+                negated=negated,
+                question=flags["question"],
+                family=flags.get("family", False),
+                hypothetical=flags.get("hypothetical", False),
+                patient=flags["patient"],
+            ))
+        return contexts
+
+def is_patient_condition(context):
+    """True if the mention is an affirmed, non-hypothetical condition of the patient."""
+    return (
+        context is not None
+        and context.patient
+        and not (context.negated or context.question or context.family or context.hypothetical)
+    )
@@ -0,0 +1,139 @@
+"""
+Decoding profiles for summary generation.
+
+A profile names a search strategy. Its output length budget is derived from
+the prompt's token count, so a two-line note is not searched with the budget
+of a full consult. Every profile also ends a sequence early once it starts
+repeating itself, and a request may carry a latency deadline: when the
+requested profile is not expected to finish in time, a cheaper one is used,
+and generation is cut off at the deadline regardless.
+"""
+import os
+import threading
+import metrics
+
+# Profile used when a request doesn't name one
+GENERATION_PROFILE = os.environ.get("GENERATION_PROFILE", "quality")
+# Default per-request generation deadline in seconds; 0 means none
+GENERATION_DEADLINE = float(os.environ.get("GENERATION_DEADLINE", "0"))
+
+# Output budget bounds, in tokens; max_length is the profile's fraction of the input within them
+MIN_OUTPUT_TOKENS = 64
+MAX_OUTPUT_TOKENS = 1000
+# min_length as a fraction of the input, capped at the old fixed minimum
+MIN_LENGTH_RATIO = 0.2
+MIN_LENGTH_CAP = 100
+# A sequence ending in the same n-gram (of up to REPEAT_MAX_NGRAM tokens)
+# REPEAT_LIMIT times in a row is looping and is stopped
+REPEAT_LIMIT = 3
+REPEAT_MAX_NGRAM = 8
+# Weight of the newest observation in the per-profile speed estimate
+ESTIMATE_SMOOTHING = 0.2
+
+PROFILES = {
+    # Greedy; blocking repeated trigrams keeps greedy output from looping
+    "fast": {"num_beams": 1, "no_repeat_ngram_size": 3, "output_ratio": 0.6},
+    "balanced": {"num_beams": 2, "early_stopping": True, "no_repeat_ngram_size": 3, "output_ratio": 0.8},
+    "quality": {"num_beams": 4, "early_stopping": True, "length_penalty": 1.0, "output_ratio": 1.0},
+}
+# Next cheaper profile, tried when a deadline can't be met
+FALLBACKS = {"quality": "balanced", "balanced": "fast"}
+
+PROFILE_FALLBACKS = metrics.Counter("generation_profile_fallbacks_total", "Generations moved to a cheaper profile to meet a deadline")
+
+def length_budget(profile, input_tokens):
+    """
+    Returns:
+        tuple: (min_length, max_length) in tokens for a prompt of input_tokens.
+    """
+    max_length = min(MAX_OUTPUT_TOKENS, max(MIN_OUTPUT_TOKENS, round(input_tokens * PROFILES[profile]["output_ratio"])))
+    min_length = min(MIN_LENGTH_CAP, round(input_tokens * MIN_LENGTH_RATIO), max_length // 2)
+    return min_length, max_length
+
+def generation_kwargs(profile, input_tokens, max_time=None):
+    """
+    Builds the generate() arguments for a profile. The values are all hashable,
+    so requests with equal arguments (max_time aside) can share a batch; pass
+    the result through expand() before calling generate().
+    Args:
+        profile (str): Key of PROFILES.
+        input_tokens (int): Prompt length in tokens.
+        max_time (float): Seconds after which generation is cut off.
+    Returns:
+        dict: Arguments for model.generate, plus stop_repeats.
+    """
+    kwargs = {key: value for key, value in PROFILES[profile].items() if key != "output_ratio"}
+    kwargs["min_length"], kwargs["max_length"] = length_budget(profile, input_tokens)
+    kwargs["stop_repeats"] = REPEAT_LIMIT
+    if max_time:
+        kwargs["max_time"] = float(max_time)
+    return kwargs
+
+class RepetitionStop:
+    """
+    Stopping criterion that finishes each sequence whose last tokens are one
+    n-gram repeated `repeats` times. Only the tail of each sequence is
+    inspected, so the check costs the same at every step. Under beam search
+    generation stops once every beam is looping.
+    """
+    def __init__(self, repeats=REPEAT_LIMIT, max_ngram=REPEAT_MAX_NGRAM):
+        self.repeats = repeats
+        self.max_ngram = max_ngram
+
+    def is_looping(self, tokens):
+        for n in range(1, self.max_ngram + 1):
+            if len(tokens) < n * self.repeats:
+                break
+            last = tokens[-n:]
+            if all(tokens[-n * (k + 1):-n * k] == last for k in range(1, self.repeats)):
+                return True
+        return False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        tails = input_ids[:, -self.repeats * self.max_ngram:].tolist()
+        return torch.tensor([self.is_looping(tail) for tail in tails], dtype=torch.bool, device=input_ids.device)
+
+def expand(generate_kwargs):
+    """Turns generation_kwargs() output into arguments model.generate accepts."""
+    kwargs = dict(generate_kwargs)
+    repeats = kwargs.pop("stop_repeats", 0)
+    if repeats:
+        from transformers import StoppingCriteriaList
+        kwargs["stopping_criteria"] = StoppingCriteriaList([RepetitionStop(repeats)])
+    return kwargs
+
+_seconds_per_token = {}
+_estimate_lock = threading.Lock()
+
+def observe(profile, max_length, seconds):
+    """Records how long a generation with the given output budget took, for choose()."""
+    rate = seconds / max_length
+    with _estimate_lock:
+        previous = _seconds_per_token.get(profile)
+        _seconds_per_token[profile] = rate if previous is None else previous + ESTIMATE_SMOOTHING * (rate - previous)
+
+def estimate_seconds(profile, input_tokens):
+    """
+    Returns:
+        float: Expected generation time from this process's recent runs, or
+        None before the profile has been observed.
+    """
+    with _estimate_lock:
+        rate = _seconds_per_token.get(profile)
+    return None if rate is None else rate * length_budget(profile, input_tokens)[1]
+
+def choose(profile, input_tokens, deadline=None):
+    """
+    Returns the profile to run: the requested one, or the first cheaper one
+    expected to finish within deadline seconds (the cheapest as a last resort).
+    """
+    requested = profile
+    while deadline and profile in FALLBACKS:
+        estimate = estimate_seconds(profile, input_tokens)
+        if estimate is None or estimate <= deadline:
+            break
+        profile = FALLBACKS[profile]
+    if profile != requested:
+        PROFILE_FALLBACKS.inc(requested=requested, profile=profile)
+    return profile
@@ -0,0 +1,72 @@
+"""
+Editing sessions for summarization.
+
+A draft remembers, for each input source, the NER and lexicon candidates
+computed from it and the key of the text they came from. When a clinician
+edits one input and summarizes again, pipeline.extract_fields re-parses only
+the sources whose key changed; the QA questions are answered once over the
+new combined context and the fields re-merged.
+"""
+import json
+import os
+import time
+import uuid
+import storage
+
+# Drafts untouched for this many seconds are discarded
+DRAFT_TTL = float(os.environ.get("DRAFT_TTL", str(24 * 3600)))
+
+def init_drafts_table(db_path=None):
+    with storage.connect(db_path) as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS drafts
+                        (id TEXT PRIMARY KEY,
+                         owner TEXT NOT NULL,
+                         sources TEXT NOT NULL,
+                         created_at REAL NOT NULL,
+                         updated_at REAL NOT NULL)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_drafts_updated_at ON drafts (updated_at)")
+
+def create_draft(owner, db_path=None):
+    """
+    Starts an empty draft, clearing out expired ones.
+    Returns:
+        str: Draft id.
+    """
+    now = time.time()
+    draft_id = uuid.uuid4().hex
+    with storage.connect(db_path) as conn:
+        conn.execute("DELETE FROM drafts WHERE updated_at < ?", (now - DRAFT_TTL,))
+        conn.execute("INSERT INTO drafts (id, owner, sources, created_at, updated_at) VALUES (?, ?, '{}', ?, ?)",
+                     (draft_id, owner, now, now))
+    return draft_id
+
+def get_owner(draft_id, db_path=None):
+    """
+    Returns:
+        str: User the draft belongs to, or None if it does not exist or has expired.
+    """
+    with storage.connect(db_path) as conn:
+        row = conn.execute("SELECT owner FROM drafts WHERE id = ? AND updated_at >= ?",
+                           (draft_id, time.time() - DRAFT_TTL)).fetchone()
+    return row["owner"] if row else None
+
+def get_sources(draft_id, db_path=None):
+    """
+    Loads the draft for a run and marks it used, so a draft summarized again
+    without edits does not expire mid-session.
+    Returns:
+        dict: Source name -> {"key", "extraction"} from the draft's last run;
+        empty if the draft has none, does not exist or has expired.
+    """
+    now = time.time()
+    with storage.connect(db_path) as conn:
+        conn.execute("UPDATE drafts SET updated_at = ? WHERE id = ? AND updated_at >= ?",
+                     (now, draft_id, now - DRAFT_TTL))
+        row = conn.execute("SELECT sources FROM drafts WHERE id = ? AND updated_at >= ?",
+                           (draft_id, now - DRAFT_TTL)).fetchone()
+    return json.loads(row["sources"]) if row else {}
+
+def save_sources(draft_id, sources, db_path=None):
+    with storage.connect(db_path) as conn:
+        conn.execute("UPDATE drafts SET sources = ?, updated_at = ? WHERE id = ?",
+                     (json.dumps(sources), time.time(), draft_id))
@@ -0,0 +1,142 @@
+"""
+Latency versus quality of the decoding profiles in decoding.py.
+
+Runs every sample through summary generation once per profile and reports
+generation latency and ROUGE-1/2/L F1. Samples with a "reference" field are
+scored against it; the others against the output of the old fixed decoding
+settings (4 beams, 100 to 1000 tokens), so the scores then measure how much
+each profile departs from what the app used to produce.
+
+Usage:
+    python eval_profiles.py [--samples samples/parity.jsonl] [--profiles fast,balanced,quality]
+                            [--repeats 3] [--deadline 5] [--output profiles.json]
+
+The result cache is bypassed, so every run really generates.
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+from collections import Counter
+from parity import DEFAULT_SAMPLES, load_samples
+
+# The decoding settings used for every request before profiles existed
+REFERENCE_KWARGS = {
+    "max_length": 1000,
+    "min_length": 100,
+    "num_beams": 4,
+    "early_stopping": True,
+    "length_penalty": 1.0,
+}
+
+def _tokens(text):
+    return re.findall(r"\w+", text.lower())
+
+def _f1(overlap, reference_total, candidate_total):
+    if not overlap:
+        return 0.0
+    precision = overlap / candidate_total
+    recall = overlap / reference_total
+    return 2 * precision * recall / (precision + recall)
+
+def rouge_n(reference, candidate, n):
+    """ROUGE-N F1 over lowercased word tokens."""
+    ref_tokens, cand_tokens = _tokens(reference), _tokens(candidate)
+    ref_grams = Counter(tuple(ref_tokens[i:i + n]) for i in range(len(ref_tokens) - n + 1))
+    cand_grams = Counter(tuple(cand_tokens[i:i + n]) for i in range(len(cand_tokens) - n + 1))
+    if not ref_grams or not cand_grams:
+        return float(ref_grams == cand_grams)
+    return _f1(sum((ref_grams & cand_grams).values()), sum(ref_grams.values()), sum(cand_grams.values()))
+
+def rouge_l(reference, candidate):
+    """ROUGE-L F1: longest common subsequence of lowercased word tokens."""
+    ref_tokens, cand_tokens = _tokens(reference), _tokens(candidate)
+    if not ref_tokens or not cand_tokens:
+        return float(ref_tokens == cand_tokens)
+    # One row of the LCS table at a time
+    previous = [0] * (len(cand_tokens) + 1)
+    for ref_token in ref_tokens:
+        current = [0]
+        for j, cand_token in enumerate(cand_tokens):
+            current.append(previous[j] + 1 if ref_token == cand_token else max(previous[j + 1], current[j]))
+        previous = current
+    return _f1(previous[-1], len(ref_tokens), len(cand_tokens))
+
+def evaluate(samples, profiles, repeats=1, deadline=None):
+    """
+    Returns:
+        dict: Per-profile latency, output length and mean ROUGE F1 scores.
+    """
+    import batching
+    import cache
+    import decoding
+    from pipeline import build_summary_input, condense_input, generate_summary
+
+    cache.CACHE_ENABLED = False
+    prompts = [build_summary_input({}, sample.get("ocr_text", ""), sample.get("additional_text", ""), sample.get("audio_text", ""))
+               for sample in samples]
+    batcher = batching.get_batcher()
+    # Untimed first call: model loading and other one-off setup
+    batcher.generate(prompts[0], max_length=8, num_beams=1)
+
+    references = []
+    for sample, prompt in zip(samples, prompts):
+        if sample.get("reference"):
+            references.append(sample["reference"])
+        else:
+            references.append(re.sub(r'\s+', ' ', batcher.generate(condense_input(prompt), **REFERENCE_KWARGS)).strip())
+
+    report = {}
+    for profile in profiles:
+        latencies, lengths, scores = [], [], {"rouge1": [], "rouge2": [], "rougeL": []}
+        fallbacks_before = sum(decoding.PROFILE_FALLBACKS.value(requested=profile, profile=other) for other in decoding.PROFILES)
+        for prompt, reference in zip(prompts, references):
+            for _ in range(repeats):
+                start = time.perf_counter()
+                summary = generate_summary(prompt, profile=profile, deadline=deadline)
+                latencies.append(time.perf_counter() - start)
+            lengths.append(len(_tokens(summary)))
+            scores["rouge1"].append(rouge_n(reference, summary, 1))
+            scores["rouge2"].append(rouge_n(reference, summary, 2))
+            scores["rougeL"].append(rouge_l(reference, summary))
+        report[profile] = {
+            "p50_seconds": statistics.median(latencies),
+            "mean_seconds": statistics.mean(latencies),
+            "max_seconds": max(latencies),
+            "mean_output_words": statistics.mean(lengths),
+            **{name: statistics.mean(values) for name, values in scores.items()},
+            "deadline_fallbacks": sum(decoding.PROFILE_FALLBACKS.value(requested=profile, profile=other) for other in decoding.PROFILES) - fallbacks_before,
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Report latency and ROUGE for each decoding profile.")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="JSONL sample set; an optional 'reference' field holds a reference summary")
+    parser.add_argument("--profiles", default="fast,balanced,quality", help="Comma-separated profiles to evaluate")
+    parser.add_argument("--repeats", type=int, default=1, help="Timed generations per sample and profile")
+    parser.add_argument("--deadline", type=float, help="Generation deadline in seconds, to exercise the fallback")
+    parser.add_argument("--output", help="Write the report here as JSON")
+    args = parser.parse_args()
+
+    import decoding
+    profiles = [profile.strip() for profile in args.profiles.split(",") if profile.strip()]
+    unknown = [profile for profile in profiles if profile not in decoding.PROFILES]
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(unknown)}")
+
+    samples = load_samples(args.samples)
+    report = evaluate(samples, profiles, max(1, args.repeats), args.deadline)
+
+    print(f"{'profile':<10} {'p50 s':>8} {'mean s':>8} {'words':>7} {'R-1':>6} {'R-2':>6} {'R-L':>6} {'fallbacks':>9}", file=sys.stderr)
+    for profile, row in report.items():
+        print(f"{profile:<10} {row['p50_seconds']:8.2f} {row['mean_seconds']:8.2f} {row['mean_output_words']:7.1f} "
+              f"{row['rouge1']:6.3f} {row['rouge2']:6.3f} {row['rougeL']:6.3f} {row['deadline_fallbacks']:9d}", file=sys.stderr)
+    print(json.dumps({"samples": len(samples), "deadline": args.deadline, "profiles": report}, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"samples": len(samples), "deadline": args.deadline, "profiles": report}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,375 +1,353 @@
-import os
+import contextvars
 from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from twilio.rest import Client
-from transformers import pipeline
-import spacy
+import logging
 import re
+import time
+import lexicon
+import models
+import notifications
+import reports
+import tracing
+from context import ContextEngine, SentenceIndex, is_patient_condition
 
-# Load spaCy's named entity recognition model
-nlp = spacy.load('en_core_web_sm')
+logger = logging.getLogger(__name__)
 
-# Initialize the QA model
-qa_model = pipeline("question-answering", model="ktrapeznikov/biobert_v1.1_pubmed_squad_v2")
+# Fields answered by NER/rules rather than the QA model
+NER_FIELDS = ("Medical History", "Medications")
+# Fields matched against the clinical lexicon first; the models only run for a
+# source in which the lexicon finds nothing
+LEXICON_FIELDS = {"Medications": "medications", "Procedures": "procedures"}
+# Maximum number of answer spans kept for multi-answer fields such as Procedures
+MAX_PROCEDURES = 5
 
-def extract_information_from_text(ocr_text="", additional_text="", audio_text="", summary=""):
+# Negation/family/hypothetical classifier shared by every request
+CONTEXT_ENGINE = ContextEngine()
+HISTORY_OF_RE = re.compile(r'\bhistory of\s+([A-Za-z\s\d]+?)(?:,|\.|including|$)', re.IGNORECASE)
+
+# Questions for extracting clinical details
+QUESTIONS = {
+    "Name": "What is the patient's name?",
+    "Age": "What is the patient's age?",
+    "Gender": "What is the patient's gender?",
+    "Medical History": "What relevant medical history does the patient have?",
+    "Examination Findings": "What are the examination findings?",
+    "Medications": "What medications were administered or prescribed to the patient?",
+    "Procedures": "What medical procedures were performed, including surgeries or interventions?",
+}
+
+def combine_inputs(ocr_text="", additional_text="", audio_text=""):
     """
-    Extracts clinical information from combined OCR, additional text, and audio inputs.
-    Args:
-        ocr_text (str): Text from image report.
-        additional_text (str): Manually entered text.
-        audio_text (str): Transcribed audio text.
-        summary (str): Summary text to be included in the PDF.
+    Combines all inputs into one normalized context with source markers.
     Returns:
-        dict: Consolidated clinical information.
+        str: Single context over every input, as used by parity.py.
     """
-    # Combine all inputs into one context with markers
     combined_text = f"[OCR] {ocr_text}\n[Additional] {additional_text}\n[Audio] {audio_text}".strip()
     combined_text = re.sub(r'[¢«§]', '', combined_text)  # Clean OCR artifacts
     combined_text = re.sub(r'\s+', ' ', combined_text).strip()  # Normalize whitespace
+    return combined_text
 
-    # Define questions for extracting clinical details
-    questions = {
-        "Name": "What is the patient's name?",
-        "Age": "What is the patient's age?",
-        "Gender": "What is the patient's gender?",
-        "Medical History": "What relevant medical history does the patient have?",
-        "Examination Findings": "What are the examination findings?",
-        "Medications": "What medications were administered or prescribed to the patient?",
-        "Procedures": "What medical procedures were performed, including surgeries or interventions?",
-    }
-
-    # Extract answers for each question from combined text
-    extracted_info = {}
-    # Load scispaCy's biomedical model for NER
-    nlp_med = spacy.load("en_ner_bc5cdr_md")
+def answer_questions(qa_model, questions, context, top_k=1):
+    """
+    Answers several questions over the same context in one batched QA pipeline
+    call, so every question/context window goes through the model together.
+    Args:
+        qa_model: Hugging Face question-answering pipeline.
+        questions (list): Questions to ask.
+        context (str): Shared context for all questions.
+        top_k (int): Number of candidate answer spans to return per question.
+    Returns:
+        list: One list of answer dicts (best first) per question.
+    """
+    if not questions:
+        return []
+    results = qa_model(
+        question=list(questions),
+        context=[context] * len(questions),
+        top_k=top_k,
+        batch_size=len(questions)
+    )
+    # The pipeline unwraps single-question inputs and top_k=1 outputs
+    if len(questions) == 1:
+        results = [results]
+    return [result if isinstance(result, list) else [result] for result in results]
+
+class ParsedDocument:
+    """
+    A single parse of one input source, shared by every field extractor.
+    The biomedical Doc, its sentence list and offset index, and its entity spans
+    (grouped by label) are computed once; the general-purpose Doc used for PERSON entities is only
+    parsed if a field actually needs it.
+    Args:
+        text (str): Normalized input text.
+        nlp_med: scispaCy pipeline used for DISEASE/CHEMICAL entities.
+        nlp_general: spaCy pipeline used for PERSON entities.
+    """
+    def __init__(self, text, nlp_med, nlp_general):
+        self.text = text
+        self.doc = nlp_med(text)
+        self.sents = list(self.doc.sents)
+        self.sentence_index = SentenceIndex(self.sents)
+        self.entities = {}
+        for ent in self.doc.ents:
+            self.entities.setdefault(ent.label_, []).append(ent)
+        self._nlp_general = nlp_general
+        self._general_doc = None
+
+    def entities_of(self, label):
+        """Returns the biomedical entity spans with the given label, in document order."""
+        return self.entities.get(label, [])
+
+    @property
+    def general_doc(self):
+        """The general-purpose Doc, parsed on first access."""
+        if self._general_doc is None:
+            self._general_doc = self._nlp_general(self.text)
+        return self._general_doc
+
+# Input sources, in the order their results are merged
+SOURCES = ("ocr", "additional", "audio")
+
+GENDER_RE = re.compile(r'\b(male|female)\b', re.IGNORECASE)
+# Conversational age ("I'm 29", "29 years old") is preferred over a form label ("Age: 29")
+AGE_PHRASE_RE = re.compile(r'(?:I\'m|I am|age is)\s*(\d+)|(\d+)\s*(?:years old|years)', re.IGNORECASE)
+AGE_LABEL_RE = re.compile(r'\bAge\s*:\s*(\d+)\b', re.IGNORECASE)
+
+def normalize_source(text):
+    """Strips OCR artifacts and collapses whitespace in one input source."""
+    text = re.sub(r'[¢«§]', '', text or "")  # Clean OCR artifacts
+    return re.sub(r'\s+', ' ', text).strip()  # Normalize whitespace
+
+def _clean_name(answer):
+    if answer == "Not Available" or "Dr." in answer:
+        return "Not Available"
+    return answer.replace(" PID", "")
+
+def _dedupe(items):
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+def _not_negated(parsed, offsets):
+    # Negation is scoped to the words after the trigger, so "started aspirin,
+    # no fever" keeps aspirin while "not on aspirin" drops it
+    contexts = CONTEXT_ENGINE.classify(parsed.sentence_index, offsets, scoped=True)
+    return [not (context and context.negated) for context in contexts]
+
+def extract_source(text):
+    """
+    Runs the per-source extractors (lexicon, biomedical NER and the rules) over
+    a single input source. These only look at the text around each match, so
+    a source gives the same candidates on its own as inside the combined
+    context, and each source can be extracted (and cached) separately. The QA
+    questions are answered once over the combined context by answer_combined.
+    Args:
+        text (str): One source: OCR text, additional notes or transcription.
+    Returns:
+        dict: JSON-serializable candidates: affirmed conditions, normalized
+        medications and lexicon procedures, whether the lexicon matched any
+        procedure before negated ones were dropped, and Gender/Age regex matches.
+    """
+    text = normalize_source(text)
+    extraction = {"conditions": [], "medications": [], "procedures": [], "procedures_matched": False,
+                  "gender": None, "age_phrase": None, "age_label": None}
+    if not text:
+        return extraction
+
+    # Parse the source once and share the Doc across all field extractors
+    with tracing.span("extraction.parse", chars=len(text)):
+        parsed = ParsedDocument(text, models.get_nlp_med(), models.get_nlp())
+
+    # One pass of the lexicon automaton finds every known drug and procedure,
+    # with synonyms and brand names mapped to the generic concept; negated
+    # mentions ("no aspirin", "not on metformin") are dropped
+    terms = lexicon.get_lexicon()
+    with tracing.span("extraction.lexicon"):
+        matches = terms.match(text)
+        affirmed = [m for m, keep in zip(matches, _not_negated(parsed, [m.start for m in matches])) if keep]
+    extraction["medications"] = lexicon.concepts(affirmed, LEXICON_FIELDS["Medications"])
+    extraction["procedures"] = lexicon.concepts(affirmed, LEXICON_FIELDS["Procedures"])
+    # Whether the models fall back is decided on the matches before negation,
+    # so a source whose only drug is negated does not get it back from NER
+    extraction["procedures_matched"] = any(m.category == LEXICON_FIELDS["Procedures"] for m in matches)
+
+    field_start = time.perf_counter()
+    # Step 1: Candidate conditions from scispaCy DISEASE entities
+    candidates = [(ent.text, ent.start_char) for ent in parsed.entities_of("DISEASE")]
+    # Step 2: Rule-based candidates from "history of" phrases
+    for match in HISTORY_OF_RE.finditer(text):
+        phrase = match.group(1).strip()
+        if phrase and "including" not in phrase.lower():
+            candidates.append((phrase, match.start()))
+    # Step 3: Keep only affirmed, patient-specific conditions, classifying all candidates in one pass
+    contexts = CONTEXT_ENGINE.classify(parsed.sentence_index, [offset for _, offset in candidates])
+    extraction["conditions"] = [phrase for (phrase, _), context in zip(candidates, contexts) if is_patient_condition(context)]
+    tracing.record("extraction.medical_history", time.perf_counter() - field_start)
 
-    # Extract answers for each question from combined text
+    if not any(m.category == LEXICON_FIELDS["Medications"] for m in matches):
+        # Fallback: entities labeled as "CHEMICAL" (which includes drugs/medications),
+        # normalized so spelling variants dedupe; negated ones are dropped as above
+        chemicals = parsed.entities_of("CHEMICAL")
+        keep = _not_negated(parsed, [ent.start_char for ent in chemicals])
+        extraction["medications"] = [terms.normalize(ent.text) for ent, kept in zip(chemicals, keep) if kept]
+
+    # Rule-based fallbacks, used when QA has no usable answer
+    match = GENDER_RE.search(text)
+    extraction["gender"] = match.group(0).capitalize() if match else None
+    match = AGE_PHRASE_RE.search(text)
+    extraction["age_phrase"] = (match.group(1) or match.group(2)) if match else None
+    match = AGE_LABEL_RE.search(text)
+    extraction["age_label"] = match.group(1) if match else None
+    return extraction
+
+def answer_combined(combined_text, ask_procedures=True):
+    """
+    Answers every QA-backed question over the combined context in a single
+    batched pass, so answers compete within one context and their scores are
+    comparable.
+    Args:
+        combined_text (str): Output of combine_inputs.
+        ask_procedures (bool): Ask the Procedures question; False when the
+            lexicon already found procedures in some source.
+    Returns:
+        dict: JSON-serializable QA answers per question (top-k spans for
+        Procedures, the best one otherwise) and, when the Name answer is
+        unusable, PERSON entities of the combined context.
+    """
+    answers = {"qa": {}, "persons": []}
+    qa_keys = [key for key in QUESTIONS if key not in NER_FIELDS and (ask_procedures or key != "Procedures")]
+    top_k = MAX_PROCEDURES if "Procedures" in qa_keys else 1
+    # Models are loaded once per process by the registry
+    qa_model = models.get_qa_model()
+    with tracing.span("extraction.qa", questions=len(qa_keys)):
+        qa_results = answer_questions(qa_model, [QUESTIONS[key] for key in qa_keys], combined_text, top_k=top_k)
+    for key, results in zip(qa_keys, qa_results):
+        kept = results if key == "Procedures" else results[:1]
+        answers["qa"][key] = [{"answer": result['answer'], "score": float(result['score']),
+                               "start": result['start'], "end": result['end']} for result in kept]
+
+    # The general-purpose parse is only needed when QA found no usable name
+    names = answers["qa"]["Name"]
+    if not names or names[0]["score"] <= 0.01 or _clean_name(names[0]["answer"].strip()) == "Not Available":
+        answers["persons"] = [ent.text.strip() for ent in models.get_nlp()(combined_text).ents
+                              if ent.label_ == 'PERSON' and "Dr." not in ent.text and "Radiologist" not in ent.text]
+    return answers
+
+def merge_extractions(extractions, answers):
+    """
+    Combines per-source candidates and the combined-context QA answers into
+    the final fields. Cheap: no models run here.
+    Args:
+        extractions (list): extract_source results, in SOURCES order.
+        answers (dict): answer_combined result.
+    Returns:
+        dict: Consolidated clinical information.
+    """
+    qa = answers["qa"]
     extracted_info = {}
-    for key, question in questions.items():
+    for key in QUESTIONS:
         if key == "Medical History":
-            # Step 1: Use scispaCy to extract DISEASE entities, focusing on patient-specific history
-            doc = nlp_med(combined_text)
-            conditions = []
-            for ent in doc.ents:
-                if ent.label_ == "DISEASE":
-                    condition_text = ent.text
-                    # Find the sentence containing the entity
-                    sentence = None
-                    sentence_idx = -1
-                    for idx, sent in enumerate(doc.sents):
-                        if sent.start_char <= ent.start_char <= sent.end_char:
-                            sentence = sent
-                            sentence_idx = idx
-                            break
-                    if sentence:
-                        sentence_text = sentence.text.lower()
-                        # Check for negation in the same sentence
-                        negation_patterns = [
-                            r'\bno history of\b',
-                            r'\bdoes not have\b',
-                            r'\bnot have\b',
-                            r'\bwithout\b',
-                            r'\bno evidence of\b',
-                            r'\bnot diagnosed with\b',
-                            r'\b(not that i\'m aware of|not that i know of)\b',
-                            r'\bno\b',
-                            r'\bnot\b',
-                            r'\bnever had\b',
-                            r'\babsence of\b',
-                            r'\bnegative for\b'
-                        ]
-                        is_negated = False
-                        for pattern in negation_patterns:
-                            if re.search(pattern, sentence_text):
-                                is_negated = True
-                                break
-                        # If the sentence is a question, check the next sentence for negation
-                        if not is_negated:
-                            is_question = bool(re.search(r'\b(do you|have you|are there|is there|any|what|when|where|how|did you|can you)\b.*\?|[\?\!]', sentence_text))
-                            if is_question:
-                                # Look for negation in the next sentence
-                                next_sentence = None
-                                if sentence_idx + 1 < len(list(doc.sents)):
-                                    next_sentence = list(doc.sents)[sentence_idx + 1]
-                                if next_sentence:
-                                    next_sentence_text = next_sentence.text.lower()
-                                    for pattern in negation_patterns:
-                                        if re.search(pattern, next_sentence_text):
-                                            is_negated = True
-                                            break
-                        # Check if the condition pertains to the patient or family
-                        is_family_history = bool(re.search(r'\b(in your family|family history|parents|siblings|family|relatives)\b', sentence_text))
-                        # Check if the condition is a potential diagnosis (e.g., "suggestive of", "likely")
-                        is_potential_diagnosis = bool(re.search(r'\b(suggestive of|likely|possible|probable|may be|consistent with|indicative of)\b', sentence_text))
-                        # Check if the condition is explicitly attributed to the patient
-                        is_patient_specific = bool(re.search(r'\b(the patient|patient|i|he|she)\b.*\b(has|had|history of|diagnosed with)\b', sentence_text))
-                        if not is_negated and not is_family_history and not is_question and not is_potential_diagnosis and is_patient_specific:
-                            conditions.append(condition_text)
-
-            # Step 2: Rule-based extraction for "history of" phrases, focusing on patient-specific history
-            history_phrases = re.findall(r'\bhistory of\s+([A-Za-z\s\d]+?)(?:,|\.|including|$)', combined_text, re.IGNORECASE)
-            for phrase in history_phrases:
-                phrase = phrase.strip()
-                if phrase and "including" not in phrase.lower():
-                    # Find the sentence containing the "history of" phrase
-                    phrase_start = combined_text.lower().find(f"history of {phrase.lower()}")
-                    if phrase_start != -1:
-                        sentence = None
-                        sentence_idx = -1
-                        for idx, sent in enumerate(doc.sents):
-                            if sent.start_char <= phrase_start <= sent.end_char:
-                                sentence = sent
-                                sentence_idx = idx
-                                break
-                        if sentence:
-                            sentence_text = sentence.text.lower()
-                            # Check for negation in the same sentence
-                            negation_patterns = [
-                                r'\bno history of\b',
-                                r'\bdoes not have\b',
-                                r'\bnot have\b',
-                                r'\bwithout\b',
-                                r'\bno evidence of\b',
-                                r'\bnot diagnosed with\b',
-                                r'\b(not that i\'m aware of|not that i know of)\b',
-                                r'\bno\b',
-                                r'\bnot\b',
-                                r'\bnever had\b',
-                                r'\babsence of\b',
-                                r'\bnegative for\b'
-                            ]
-                            is_negated = False
-                            for pattern in negation_patterns:
-                                if re.search(pattern, sentence_text):
-                                    is_negated = True
-                                    break
-                            # If the sentence is a question, check the next sentence for negation
-                            if not is_negated:
-                                is_question = bool(re.search(r'\b(do you|have you|are there|is there|any|what|when|where|how|did you|can you)\b.*\?|[\?\!]', sentence_text))
-                                if is_question:
-                                    # Look for negation in the next sentence
-                                    next_sentence = None
-                                    if sentence_idx + 1 < len(list(doc.sents)):
-                                        next_sentence = list(doc.sents)[sentence_idx + 1]
-                                    if next_sentence:
-                                        next_sentence_text = next_sentence.text.lower()
-                                        for pattern in negation_patterns:
-                                            if re.search(pattern, next_sentence_text):
-                                                is_negated = True
-                                                break
-                            # Check if the condition pertains to the patient or family
-                            is_family_history = bool(re.search(r'\b(in your family|family history|parents|siblings|family|relatives)\b', sentence_text))
-                            # Check if the condition is a potential diagnosis
-                            is_potential_diagnosis = bool(re.search(r'\b(suggestive of|likely|possible|probable|may be|consistent with|indicative of)\b', sentence_text))
-                            # Check if the condition is explicitly attributed to the patient
-                            is_patient_specific = bool(re.search(r'\b(the patient|patient|i|he|she)\b.*\b(has|had|history of|diagnosed with)\b', sentence_text))
-                            if not is_negated and not is_family_history and not is_question and not is_potential_diagnosis and is_patient_specific:
-                                conditions.append(phrase)
-
-            # Step 3: Remove duplicates while preserving order
-            seen = set()
-            conditions = [cond for cond in conditions if not (cond in seen or seen.add(cond))]
-            
-            # Convert to a comma-separated string
+            conditions = _dedupe(cond for extraction in extractions for cond in extraction["conditions"])
             answer = ", ".join(conditions) if conditions else "Not Available"
         elif key == "Medications":
-            doc = nlp_med(combined_text)
-            # Extract entities labeled as "CHEMICAL" (which includes drugs/medications)
-            medications = []
-            for ent in doc.ents:
-                if ent.label_ == "CHEMICAL":
-                    medications.append(ent.text)
-            # Remove duplicates while preserving order
-            seen = set()
-            medications = [med for med in medications if not (med in seen or seen.add(med))]
-            # Convert to a comma-separated string
+            medications = _dedupe(med for extraction in extractions for med in extraction["medications"])
             answer = ", ".join(medications) if medications else "Not Available"
         elif key == "Procedures":
-            # Use BioBERT to extract procedures as a list
-            procedures = []
-            remaining_context = combined_text
-            max_iterations = 5  # Prevent infinite loops, max 5 procedures
-            for _ in range(max_iterations):
-                result = qa_model(question=question, context=remaining_context)
+            # Lexicon matches, or when there are none the top-k QA spans
+            procedures = [proc for extraction in extractions for proc in extraction["procedures"]]
+            accepted_spans = []
+            for result in qa.get(key, []):
+                # Candidates are sorted by score, so stop at the first weak one
                 if result['score'] < 0.01:
                     break
-                procedure = result['answer'].strip()
-                # Clean the procedure name 
-                procedure = procedure.lower().replace(" procedure", "").strip()
+                # Skip spans overlapping one already taken (e.g. "appendectomy" inside "laparoscopic appendectomy")
+                if any(result['start'] < end and start < result['end'] for start, end in accepted_spans):
+                    continue
+                accepted_spans.append((result['start'], result['end']))
+                # Clean the procedure name
+                procedure = result['answer'].strip().lower().replace(" procedure", "").strip()
                 if procedure:
-                    procedures.append(procedure)
-                remaining_context = remaining_context.replace(procedure, "", 1)
-                # If the context becomes too short or no more procedures 
-                if len(remaining_context.strip()) < 10:
-                    break
-            seen = set()
-            procedures = [proc for proc in procedures if not (proc in seen or seen.add(proc))]
+                    procedures.append(lexicon.get_lexicon().normalize(procedure))
+            procedures = _dedupe(procedures)
             answer = ", ".join(procedures) if procedures else "Not Available"
         else:
-            result = qa_model(question=question, context=combined_text)
-            answer = result['answer'].strip() if result['score'] > 0.01 else "Not Available"
-        
+            best = qa[key][0] if qa.get(key) else None
+            answer = best['answer'].strip() if best and best['score'] > 0.01 else "Not Available"
+
         # Post-process Gender
         if key == "Gender":
             if answer == "Not Available":
-                # for "male" or "female" in the text
-                match = re.search(r'\b(male|female)\b', combined_text, re.IGNORECASE)
-                if match:
-                    answer = match.group(0).capitalize()
+                # "male" or "female" anywhere in the inputs
+                answer = next((extraction["gender"] for extraction in extractions if extraction["gender"]), "Not Available")
             else:
-                match = re.search(r'\b(male|female)\b', answer, re.IGNORECASE)
-                if match:
-                    answer = match.group(0).capitalize()
-                else:
-                    answer = "Not Available"
-    
+                match = GENDER_RE.search(answer)
+                answer = match.group(0).capitalize() if match else "Not Available"
+
         # Post-process Age to extract only the numerics
         if key == "Age":
             if answer == "Not Available":
-                # conversational patterns like "I'm 29" or "29 years old"
-                match = re.search(r'(?:I\'m|I am|age is)\s*(\d+)|(\d+)\s*(?:years old|years)', combined_text, re.IGNORECASE)
-                if match:
-                    answer = match.group(1) if match.group(1) else match.group(2)
-                else:
-                    match = re.search(r'\bAge\s*:\s*(\d+)\b', combined_text, re.IGNORECASE)
-                    if match:
-                        answer = match.group(1)
-            else:                
-                match = re.search(r'\b\d+\b', answer)
-                if match:
-                    answer = match.group(0)
-                else:
-                    answer = "Not Available"
-        
-        # Post-process Name 
-        if key == "Name" and answer != "Not Available":
-            if "Dr." in answer:
-                answer = "Not Available"
+                # conversational patterns like "I'm 29" or "29 years old", then "Age: 29"
+                answer = next((extraction["age_phrase"] for extraction in extractions if extraction["age_phrase"]), None) \
+                    or next((extraction["age_label"] for extraction in extractions if extraction["age_label"]), "Not Available")
             else:
-                answer = answer.replace(" PID", "")
-        
+                match = re.search(r'\b\d+\b', answer)
+                answer = match.group(0) if match else "Not Available"
+
+        # Post-process Name
+        if key == "Name":
+            answer = _clean_name(answer)
+
         extracted_info[key] = answer
 
-    # If name is not found by QA, use SpaCy on combined text
-    if extracted_info['Name'] == "Not Available":
-        doc = nlp(combined_text)
-        for ent in doc.ents:
-            if ent.label_ == 'PERSON' and "Dr." not in ent.text and "Radiologist" not in ent.text:
-                extracted_info['Name'] = ent.text.strip()
-                extracted_info['Name'] = extracted_info['Name'].replace(" PID", "")
-                break
+    # If name is not found by QA, use SpaCy's PERSON entities
+    if extracted_info['Name'] == "Not Available" and answers["persons"]:
+        extracted_info['Name'] = answers["persons"][0].replace(" PID", "")
 
     # Add discharge date and time
-    today_date = datetime.today().strftime('%Y-%m-%d')
-    current_time = datetime.today().strftime('%H:%M:%S')
-    extracted_info["Discharge Date"] = today_date
-    extracted_info["Discharge Time"] = current_time
+    now = datetime.today()
+    extracted_info["Discharge Date"] = now.strftime('%Y-%m-%d')
+    extracted_info["Discharge Time"] = now.strftime('%H:%M:%S')
 
     return extracted_info
 
+def extract_information_from_text(ocr_text="", additional_text="", audio_text="", summary=""):
+    """
+    Extracts clinical information from OCR, additional text, and audio inputs.
+    Each source is run through the per-source extractors, the QA questions are
+    answered once over the combined context, and the results merged.
+    Args:
+        ocr_text (str): Text from image report.
+        additional_text (str): Manually entered text.
+        audio_text (str): Transcribed audio text.
+        summary (str): Summary text to be included in the PDF.
+    Returns:
+        dict: Consolidated clinical information.
+    """
+    extractions = [extract_source(text) for text in (ocr_text, additional_text, audio_text)]
+    ask_procedures = not any(extraction["procedures"] or extraction.get("procedures_matched") for extraction in extractions)
+    answers = answer_combined(combine_inputs(ocr_text, additional_text, audio_text), ask_procedures)
+    return merge_extractions(extractions, answers)
+
 def create_pdf(extracted_info, summary):
     """
-    Create a PDF for the patient's discharge summary.
+    Queue the patient's discharge summary PDF for rendering on the background
+    pool. Once written, it is queued for WhatsApp delivery.
     Args:
         extracted_info (dict): Dictionary containing extracted information from the text inputs.
         summary (str): Summary text to be included in the PDF.
+    Returns:
+        Future: Resolves to (path, render seconds) once the PDF is on disk.
     """
-    # PDF generation
-    pdf_path = os.path.join("static", "pdfs", "discharge_summary.pdf")
-    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
-    c = canvas.Canvas(pdf_path, pagesize=letter)
-    width, height = letter
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(100, height - 40, "Patient Discharge Summary")
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(100, height - 80, f"Patient Name: {extracted_info['Name']}")
-    c.drawString(100, height - 100, f"Discharge Date: {extracted_info['Discharge Date']}")
-    c.setStrokeColorRGB(0, 0, 0)
-    c.setLineWidth(0.5)
-    c.line(100, height - 110, width - 100, height - 110)
-    c.setFont("Helvetica", 10)
-    c.drawString(100, height - 140, "Discharge Summary Details:")
-
-    y = height - 160
-    for key, value in extracted_info.items():
-        if y < 40:
-            c.showPage()
-            y = height - 40
-            c.setFont("Helvetica", 10)
-        c.drawString(100, y, f"{key}: {value}")
-        y -= 20
-
-    c.setFont("Helvetica-Bold", 12)
-    y -= 20
-    c.drawString(100, y, "SUMMARY")
-    c.setFont("Helvetica", 10)
-    y -= 20
-
-
-
-    current_line = ""
-    char_count = 0
-
-    for char in summary:
-        current_line += char
-        char_count += 1
-        
-        if char_count >= 100:
-            # If we end in the middle of a word 
-            if char != " " and char != summary[-1]:
-                # Find the last space
-                last_space = current_line.rfind(" ")
-                if last_space != -1 and last_space < len(current_line) - 1:
-                    # If there's a space in the line break there
-                    to_print = current_line[:last_space]
-                    current_line = current_line[last_space + 1:]
-                    c.drawString(100, y, to_print.strip())
-                else:
-                    to_print = current_line[:-1] + "-"
-                    current_line = current_line[-1:]
-                    c.drawString(100, y, to_print)
-            else:
-                c.drawString(100, y, current_line.strip())
-                current_line = ""
-            
-            y -= 20
-            char_count = len(current_line)
-            
-
-            if y < 40:
-                c.showPage()
-                y = height - 40
-                c.setFont("Helvetica", 10)
-
-
-    if current_line:
-        c.drawString(100, y, current_line.strip())
-
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(100, y - 20, "Approved by: ABC Hospital")
-    c.setFont("Helvetica-Bold", 8)
-    c.drawString(100, y - 40, "Additional Notes")
-    c.drawString(100, y - 60, "In case of Emergency, contact:")
-    c.drawString(100, y - 80, "0494-2763225")
-    c.save()
-    
-
-
-    account_sid = ""  
-    auth_token = ""  
-    client = Client(account_sid, auth_token)
-
-    pdf_url = "https://.ngrok-free.app/static/pdfs/discharge_summary.pdf"
-
-    recipient_phone_number = ""
-    message = client.messages.create(
-        from_='whatsapp:',
-        body="Here is your discharge summary PDF.",
-        media_url=[pdf_url],
-        to=f"whatsapp:{recipient_phone_number}"
-    )
+    future = reports.render_async(extracted_info, summary)
+    # Run the callback in this request's context so its spans join the request's trace
+    context = contextvars.copy_context()
+    future.add_done_callback(lambda done: context.run(_pdf_rendered, done))
+    return future
 
-    print(f"Message sent to {recipient_phone_number}: {message.sid}")
-    print(f"Discharge summary PDF has been saved at {pdf_path}")
+def _pdf_rendered(future):
+    try:
+        pdf_path, seconds = future.result()
+    except Exception:
+        logger.exception("Rendering the discharge summary PDF failed")
+        return
+    tracing.record("pdf.render", seconds)
+    with tracing.span("notification.enqueue", channel="whatsapp"):
+        notifications.notify_pdf_ready(pdf_path)
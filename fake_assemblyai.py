@@ -0,0 +1,165 @@
+"""
+Local stand-in for the AssemblyAI REST API, for exercising /transcribe without
+network access or a paid key.
+
+Implements the endpoints the SDK uses for an asynchronous job: upload, create
+transcript and get transcript. Each transcript completes after a fixed delay
+and, if the job was created with a webhook, the webhook is called just like
+the real service does.
+
+Usage:
+    python fake_assemblyai.py --port 8765 --delay 5
+    ASSEMBLYAI_BASE_URL=http://127.0.0.1:8765 python app.py
+
+or in-process:
+    server = FakeAssemblyAI(delay=0.5).start()
+    aai.settings.base_url = server.url
+    ...
+    server.stop()
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeAssemblyAI/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.fake.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self):
+        # The SDK streams uploads, which may arrive chunked
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self._read_body()
+        if self.path == "/v2/upload":
+            upload_id = uuid.uuid4().hex
+            fake.uploads[upload_id] = len(body)
+            self._send_json(200, {"upload_url": f"{fake.url}/files/{upload_id}"})
+        elif self.path == "/v2/transcript":
+            self._send_json(200, fake.create(json.loads(body or b"{}")))
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_GET(self):
+        prefix = "/v2/transcript/"
+        transcript = self.server.fake.get(self.path[len(prefix):]) if self.path.startswith(prefix) else None
+        if transcript is None:
+            self._send_json(404, {"error": "Transcript not found"})
+        else:
+            self._send_json(200, transcript)
+
+class FakeAssemblyAI:
+    """
+    Args:
+        port (int): Port to listen on; 0 picks a free one.
+        delay (float): Seconds from job creation to completion.
+        text (str): Transcript text; defaults to one mentioning the upload size.
+        fail (bool): Finish every job with an error instead.
+    """
+    def __init__(self, port=0, delay=1.0, text=None, fail=False, verbose=False):
+        self.delay = delay
+        self.text = text
+        self.fail = fail
+        self.verbose = verbose
+        self.uploads = {}
+        self.transcripts = {}
+        self.webhook_calls = []
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def create(self, request):
+        transcript_id = uuid.uuid4().hex
+        upload_id = request.get("audio_url", "").rsplit("/", 1)[-1]
+        self.transcripts[transcript_id] = {
+            "request": request,
+            "created_at": time.monotonic(),
+            "text": self.text or f"Fake transcript of {self.uploads.get(upload_id, 0)} bytes of audio.",
+        }
+        if request.get("webhook_url"):
+            threading.Timer(self.delay, self._call_webhook, args=(transcript_id,)).start()
+        return self.get(transcript_id)
+
+    def get(self, transcript_id):
+        record = self.transcripts.get(transcript_id)
+        if record is None:
+            return None
+        finished = time.monotonic() - record["created_at"] >= self.delay
+        status = ("error" if self.fail else "completed") if finished else "processing"
+        return {
+            "id": transcript_id,
+            "status": status,
+            "audio_url": record["request"].get("audio_url", ""),
+            "text": record["text"] if status == "completed" else None,
+            "error": "Fake transcription failure" if status == "error" else None,
+            "webhook_url": record["request"].get("webhook_url"),
+        }
+
+    def _call_webhook(self, transcript_id):
+        request = self.transcripts[transcript_id]["request"]
+        headers = {"Content-Type": "application/json"}
+        if request.get("webhook_auth_header_name"):
+            headers[request["webhook_auth_header_name"]] = request.get("webhook_auth_header_value") or ""
+        payload = {"transcript_id": transcript_id, "status": self.get(transcript_id)["status"]}
+        call = urllib.request.Request(request["webhook_url"], data=json.dumps(payload).encode("utf-8"), headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(call, timeout=10) as response:
+                self.webhook_calls.append((transcript_id, response.status))
+        except OSError as e:
+            self.webhook_calls.append((transcript_id, str(e)))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-assemblyai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake AssemblyAI API locally.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=5.0, help="Seconds until each transcript completes")
+    parser.add_argument("--text", help="Transcript text to return")
+    parser.add_argument("--fail", action="store_true", help="Fail every transcript")
+    args = parser.parse_args()
+    server = FakeAssemblyAI(args.port, args.delay, args.text, args.fail, verbose=True)
+    print(f"Fake AssemblyAI listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import gc
+import os
+import admission
+import models
+import notifications
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+# Each worker process holds its own copy of the models (unless preloaded) and
+# its own admission limits, so size workers by memory: one or two per host is
+# usually enough, with the concurrency coming from threads.
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+# Threaded workers let requests queue inside admission control (admission.py)
+# instead of in the socket backlog. Enough threads for every stage's slots and
+# wait queue keeps fast pages (login, /view_data, polling) responsive under load.
+worker_class = "gthread"
+# Threads left over for requests that take no admission slot
+SPARE_THREADS = 16
+threads = int(os.environ.get("GUNICORN_THREADS", str(admission.capacity() + SPARE_THREADS)))
+# Long enough for a queued request plus a quality-profile generation
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+
+# "background": each worker starts serving immediately and loads the models in
+# a background thread; /ready reports 503 until they are in. Fast restarts, but
+# every worker holds its own copy of the weights.
+# "preload": the master loads every model before forking, so workers share one
+# read-only copy of the weights, at the cost of a slow start.
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "background")
+
+# Import the app in the master before forking. The import is cheap; with
+# MODEL_WARMUP=preload the models are loaded there too.
+preload_app = True
+
+def when_ready(server):
+    if MODEL_WARMUP == "preload":
+        models.warmup()
+        # Move the loaded objects out of the collector's reach so GC passes in the
+        # workers don't touch (and un-share) their pages
+        gc.freeze()
+
+def post_fork(server, worker):
+    # Background threads are not inherited across fork; each worker starts its
+    # own notification worker, job lease keeper and, unless preloaded, model warmup
+    notifications.start_worker()
+    # Imported here rather than at the top: the app is loaded after this config
+    from app import job_queue
+    job_queue.start()
+    if MODEL_WARMUP != "preload":
+        models.start_background_warmup()
@@ -0,0 +1,276 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import admission
+import pipeline
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Worker pool sizing and backpressure
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", "8"))
+# "thread" shares this process's models; "process" forks workers that share them copy-on-write
+JOB_EXECUTOR = os.environ.get("JOB_EXECUTOR", "thread")
+# Seconds a client is told to wait before resubmitting when the queue is full
+JOB_RETRY_AFTER = 5
+# A process holds a lease on the jobs it queued and renews it every third of
+# this many seconds; a job whose lease has run out was orphaned by a crash or
+# restart and is taken over by another process
+JOB_LEASE = float(os.environ.get("JOB_LEASE", "60"))
+JOB_INTERRUPTED = "Interrupted by a server restart"
+
+TERMINAL_STATUSES = ("done", "failed", "cancelled")
+
+class JobQueueFull(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+def init_jobs_table(db_path=None):
+    with storage.connect(db_path) as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                        (id TEXT PRIMARY KEY,
+                         status TEXT NOT NULL,
+                         stage TEXT,
+                         payload TEXT NOT NULL,
+                         result TEXT,
+                         error TEXT,
+                         timings TEXT,
+                         cancel_requested INTEGER NOT NULL DEFAULT 0,
+                         created_at REAL NOT NULL,
+                         updated_at REAL NOT NULL,
+                         lease_until REAL)''')
+        # Tables created before leases existed; their unfinished rows count as orphaned
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "lease_until" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+
+def _update_job(db_path, job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    with storage.connect(db_path) as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+def get_job(job_id, db_path=None):
+    """
+    Returns:
+        dict: Job status, current stage, per-stage timings and, once done, the
+        result; None if the job does not exist.
+    """
+    with storage.connect(db_path) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "stage": row["stage"],
+        "timings": json.loads(row["timings"]) if row["timings"] else {},
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "cancel_requested": bool(row["cancel_requested"]),
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+def _cancel_requested(db_path, job_id):
+    with storage.connect(db_path) as conn:
+        row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return bool(row and row[0])
+
+def claim_orphans(lease_until, db_path=None):
+    """
+    Takes over jobs whose lease has expired. Orphaned running jobs are marked
+    failed, since a stage may have partly run; orphaned queued jobs are leased
+    to the caller, which must run them. Rows are claimed conditionally, so two
+    processes recovering at once never take the same job.
+    Args:
+        lease_until (float): Lease expiry given to the claimed jobs.
+    Returns:
+        list: Ids of the queued jobs claimed, oldest first.
+    """
+    now = time.time()
+    claimed = []
+    with storage.connect(db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE status = 'running' AND COALESCE(lease_until, 0) < ?",
+            (JOB_INTERRUPTED, now, now)
+        )
+        rows = conn.execute(
+            "SELECT id, lease_until FROM jobs WHERE status = 'queued' AND COALESCE(lease_until, 0) < ? ORDER BY created_at",
+            (now,)
+        ).fetchall()
+        for row in rows:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'queued' AND lease_until IS ?",
+                (lease_until, now, row["id"], row["lease_until"])
+            )
+            if cursor.rowcount:
+                claimed.append(row["id"])
+    return claimed
+
+def run_job(job_id, db_path):
+    """
+    Runs the summarization pipeline for a queued job, recording each stage and
+    its timing in the jobs table. Cancellation is checked between stages.
+    Module-level so it can be sent to a process pool.
+    """
+    with storage.connect(db_path) as conn:
+        row = conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return
+
+    def on_stage(stage, timings):
+        if _cancel_requested(db_path, job_id):
+            raise JobCancelled()
+        _update_job(db_path, job_id, stage=stage, timings=json.dumps(timings))
+
+    try:
+        if _cancel_requested(db_path, job_id):
+            raise JobCancelled()
+        _update_job(db_path, job_id, status="running")
+        # Jobs were admitted by the queue already: they wait for stage slots
+        # behind interactive requests instead of being shed
+        with admission.priority(admission.BACKGROUND):
+            result = pipeline.run_pipeline(on_stage=on_stage, **json.loads(row[0]))
+    except JobCancelled:
+        _update_job(db_path, job_id, status="cancelled")
+    except Exception as e:
+        _update_job(db_path, job_id, status="failed", error=str(e))
+    else:
+        _update_job(
+            db_path, job_id,
+            status="done",
+            stage=None,
+            timings=json.dumps(result["timings"]),
+            result=json.dumps({"summary": result["summary"], "extracted_info": result["extracted_info"]})
+        )
+
+class JobQueue:
+    """
+    Bounded pool that runs summarization jobs off the request thread. Jobs and
+    their payloads live in SQLite, so any worker process can answer status
+    polls and cancellations for a job started by another, and jobs left behind
+    by a crash or restart are picked up again (see start()).
+    Args:
+        db_path (str): SQLite database holding the jobs table.
+        workers (int): Number of concurrent pipeline runs.
+        max_pending (int): Queued plus running jobs this process accepts before
+            submit() refuses. The bound is per process, so with several server
+            workers the total is max_pending times the number of workers.
+        executor (str): "thread" or "process".
+    """
+    def __init__(self, db_path=None, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, executor=JOB_EXECUTOR):
+        self.db_path = db_path or storage.DB_PATH
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor_kind = executor
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._started_pid = None
+        init_jobs_table(self.db_path)
+
+    def _get_executor(self):
+        # Created on first use so a process pool forks after the models are warm
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("fork"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="summarize-job")
+        return self._executor
+
+    @property
+    def pending(self):
+        """Number of jobs queued or running in this process."""
+        return len(self._futures)
+
+    def start(self):
+        """
+        Re-queues jobs orphaned by a crash or restart and starts the thread that
+        keeps this process's leases alive and recovers jobs of processes that
+        die later. Threads do not survive fork, so call it after forking;
+        submit() also calls it.
+        """
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return self
+            # Pools and futures inherited across a fork belong to the parent
+            self._started_pid, self._executor, self._futures = os.getpid(), None, {}
+        self._recover()
+        threading.Thread(target=self._heartbeat, name="job-lease", daemon=True).start()
+        return self
+
+    def _recover(self):
+        # Recovered jobs were accepted before, so they are not refused for max_pending
+        for job_id in claim_orphans(time.time() + JOB_LEASE, self.db_path):
+            with self._lock:
+                self._enqueue(job_id)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_LEASE / 3)
+            try:
+                job_ids = list(self._futures)
+                if job_ids:
+                    with storage.connect(self.db_path) as conn:
+                        conn.executemany("UPDATE jobs SET lease_until = ? WHERE id = ?",
+                                         [(time.time() + JOB_LEASE, job_id) for job_id in job_ids])
+                self._recover()
+            except Exception:
+                logger.exception("Job lease renewal failed")
+
+    def _enqueue(self, job_id):
+        # Called with the lock held
+        future = self._get_executor().submit(run_job, job_id, self.db_path)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+
+    def submit(self, payload):
+        """
+        Queues a pipeline run. The payload is stored with the job, so the run
+        can be repeated by another process if this one dies before starting it.
+        Args:
+            payload (dict): ocr_text, additional_text and audio_text.
+        Returns:
+            str: The new job id.
+        Raises:
+            JobQueueFull: If max_pending jobs are already queued or running in this process.
+        """
+        self.start()
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                raise JobQueueFull()
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            with storage.connect(self.db_path) as conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, status, payload, created_at, updated_at, lease_until) VALUES (?, 'queued', ?, ?, ?, ?)",
+                    (job_id, json.dumps(payload), now, now, now + JOB_LEASE)
+                )
+            self._enqueue(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        Requests cancellation. A queued job is dropped immediately; a running
+        job stops before its next stage.
+        Returns:
+            dict: The job's status after the request, or None if it does not exist.
+        """
+        job = get_job(job_id, self.db_path)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return job
+        _update_job(self.db_path, job_id, cancel_requested=1)
+        future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            _update_job(self.db_path, job_id, status="cancelled")
+        return get_job(job_id, self.db_path)
@@ -0,0 +1,137 @@
+"""
+Clinical lexicon matcher for medications and procedures.
+
+The lexicon maps each concept's canonical (generic) name to its synonyms and
+brand names. Every term is compiled into one Aho-Corasick automaton over
+lowercased word tokens, so a document is matched against the whole lexicon
+in a single pass, linear in its length. Matching on tokens makes case,
+hyphens and spacing irrelevant ("C-section", "c section").
+"""
+import hashlib
+import json
+import os
+import re
+from collections import deque, namedtuple
+from functools import lru_cache
+
+# Concept file: {category: {canonical name: [synonyms and brand names]}}
+LEXICON_PATH = os.environ.get("LEXICON_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "lexicon.json"))
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+LexiconMatch = namedtuple("LexiconMatch", ["start", "end", "category", "concept"])
+
+def tokenize(text):
+    """Lowercased word tokens of text."""
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+class Lexicon:
+    """
+    Multi-pattern matcher over a concept lexicon.
+    Args:
+        concepts (dict): Category -> {canonical name: [variant terms]}.
+    """
+    def __init__(self, concepts):
+        # Trie transitions, failure links and the terms ending at each node,
+        # as (length in tokens, category, canonical name)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._canonical = {}
+        for category, entries in concepts.items():
+            for canonical, variants in entries.items():
+                for term in (canonical, *variants):
+                    tokens = tokenize(term)
+                    if tokens:
+                        self._add(tokens, (len(tokens), category, canonical))
+                        self._canonical[" ".join(tokens)] = canonical
+        self._link()
+
+    def _add(self, tokens, output):
+        node = 0
+        for token in tokens:
+            if token not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][token] = len(self._goto) - 1
+            node = self._goto[node][token]
+        if output not in self._out[node]:
+            self._out[node].append(output)
+
+    def _link(self):
+        # Breadth-first, so every node's failure target is linked before it
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def match(self, text, category=None):
+        """
+        Finds lexicon terms in text. Overlapping matches are resolved leftmost-
+        longest, so "laparoscopic appendectomy" wins over "appendectomy" inside it.
+        Args:
+            text (str): Document text.
+            category (str): Only return matches of this category.
+        Returns:
+            list: LexiconMatch tuples with character offsets, in document order.
+        """
+        spans, candidates = [], []
+        node = 0
+        for i, token in enumerate(TOKEN_RE.finditer(text)):
+            spans.append(token.span())
+            word = token.group().lower()
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+            for length, term_category, canonical in self._out[node]:
+                candidates.append((i - length + 1, i, term_category, canonical))
+
+        matches, last_end = [], -1
+        for first, last, term_category, canonical in sorted(candidates, key=lambda c: (c[0], c[0] - c[1])):
+            if first > last_end:
+                last_end = last
+                if category is None or term_category == category:
+                    matches.append(LexiconMatch(spans[first][0], spans[last][1], term_category, canonical))
+        return matches
+
+    def normalize(self, term):
+        """
+        Returns:
+            str: The canonical name if term is exactly a lexicon term, otherwise
+            the term lowercased with its whitespace and punctuation collapsed,
+            so near-duplicate spellings compare equal.
+        """
+        key = " ".join(tokenize(term))
+        return self._canonical.get(key, key)
+
+def concepts(matches, category):
+    """Canonical names of the concepts of one category among matches, first mention first, each once."""
+    seen = set()
+    return [m.concept for m in matches if m.category == category and not (m.concept in seen or seen.add(m.concept))]
+
+@lru_cache(maxsize=8)
+def _load(path, version):
+    with open(path, "rb") as f:
+        data = f.read()
+    return Lexicon(json.loads(data)), hashlib.sha256(data).hexdigest()[:16]
+
+def _current(path):
+    # Keyed on the file's modification time and size, so an edited file is
+    # recompiled on its next use without a restart
+    stat = os.stat(path)
+    return _load(path, (stat.st_mtime_ns, stat.st_size))
+
+def get_lexicon(path=None):
+    """Returns the compiled lexicon for path (default LEXICON_PATH), rebuilt only when the file changes."""
+    return _current(path or LEXICON_PATH)[0]
+
+def fingerprint(path=None):
+    """Hash of the lexicon file, for keying cached extraction results."""
+    return _current(path or LEXICON_PATH)[1]
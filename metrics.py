@@ -0,0 +1,91 @@
+import threading
+
+# Every metric created in this process, in creation order
+_registry = []
+_lock = threading.Lock()
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        for key, value in list(self._values.items()):
+            yield self.name, key, value
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+class Histogram:
+    """Distribution of observed values over fixed buckets."""
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., sum, count]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        for key, state in list(self._values.items()):
+            for bound, count in zip(self.buckets, state):
+                yield f"{self.name}_bucket", key + (("le", bound),), count
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), state[-1]
+            yield f"{self.name}_sum", key, state[-2]
+            yield f"{self.name}_count", key, state[-1]
+
+def render():
+    """
+    Returns:
+        str: Every metric in this process in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
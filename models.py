@@ -0,0 +1,198 @@
+import logging
+import os
+import threading
+import time
+import backends
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Model locations
+BART_MODEL_PATH = os.environ.get("BART_MODEL_PATH", "./models/bart-fine-tuned-mts")
+QA_MODEL_NAME = os.environ.get("QA_MODEL_NAME", "ktrapeznikov/biobert_v1.1_pubmed_squad_v2")
+SPACY_GENERAL_MODEL = os.environ.get("SPACY_GENERAL_MODEL", "en_core_web_sm")
+SPACY_MED_MODEL = os.environ.get("SPACY_MED_MODEL", "en_ner_bc5cdr_md")
+# Bump when new weights are deployed under the same paths, so cached results are not reused
+MODEL_REVISION = os.environ.get("MODEL_REVISION", "1")
+
+# name -> loader function, in registration order
+_loaders = {}
+# name -> loaded model
+_models = {}
+# name -> lock guarding the first load of that model
+_locks = {}
+# name -> "pending", "loading", "ready" or "failed"
+_states = {}
+# name -> load error / load time in seconds
+_errors = {}
+_load_seconds = {}
+
+MODEL_LOAD_SECONDS = metrics.Gauge("model_load_seconds", "Time taken to load each model in this process")
+
+def register(name):
+    """
+    Registers a loader function for a named model. The loader is called at most
+    once per process, the first time the model is requested or during warmup.
+    Args:
+        name (str): Registry key for the model.
+    """
+    def decorator(loader):
+        _loaders[name] = loader
+        _locks[name] = threading.Lock()
+        _states[name] = "pending"
+        return loader
+    return decorator
+
+@register("bart_tokenizer")
+def _load_bart_tokenizer():
+    from transformers import BartTokenizer
+    return BartTokenizer.from_pretrained(BART_MODEL_PATH)
+
+@register("bart")
+def _load_bart():
+    return backends.load_seq2seq(BART_MODEL_PATH)
+
+@register("qa")
+def _load_qa():
+    return backends.load_qa(QA_MODEL_NAME)
+
+@register("nlp")
+def _load_nlp():
+    import spacy
+    return spacy.load(SPACY_GENERAL_MODEL)
+
+@register("nlp_med")
+def _load_nlp_med():
+    import spacy
+    return spacy.load(SPACY_MED_MODEL)
+
+def get(name):
+    """
+    Returns the named model, loading it on first use.
+    Args:
+        name (str): Registry key of the model.
+    Returns:
+        The loaded model object.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+    if name not in _loaders:
+        raise KeyError(f"Unknown model: {name}")
+    with _locks[name]:
+        # Another thread (e.g. the warmup thread) may have finished loading while we waited
+        if name not in _models:
+            _states[name] = "loading"
+            start = time.perf_counter()
+            try:
+                _models[name] = _loaders[name]()
+            except Exception as e:
+                # Left retryable: the next get() tries again
+                _states[name] = "failed"
+                _errors[name] = f"{type(e).__name__}: {e}"
+                raise
+            _load_seconds[name] = time.perf_counter() - start
+            MODEL_LOAD_SECONDS.set(_load_seconds[name], model=name)
+            _states[name] = "ready"
+            _errors.pop(name, None)
+        return _models[name]
+
+def get_tokenizer():
+    return get("bart_tokenizer")
+
+def get_summarizer():
+    return get("bart")
+
+def get_qa_model():
+    return get("qa")
+
+def get_nlp():
+    return get("nlp")
+
+def get_nlp_med():
+    return get("nlp_med")
+
+def warmup(names=None):
+    """
+    Loads the given models (all registered models by default). Call this in the
+    master process before forking workers so they share one copy-on-write set of
+    weights instead of each loading their own.
+    Args:
+        names (list): Registry keys to load. Defaults to every registered model.
+    """
+    for name in names or list(_loaders):
+        get(name)
+
+_warmup_thread = None
+_warmup_pid = None
+_warmup_lock = threading.Lock()
+
+def _warmup_in_background(names):
+    for name in names or list(_loaders):
+        try:
+            get(name)
+        except Exception:
+            logger.exception("Loading model %s failed", name)
+
+def start_background_warmup(names=None):
+    """
+    Loads models on a daemon thread so the server answers requests (login,
+    static files, readiness probes) while the weights load. A request that
+    needs a model before then waits for that one model only. Safe to call
+    repeatedly; threads do not survive fork, so call it in each worker.
+    Args:
+        names (list): Registry keys to load. Defaults to every registered model.
+    Returns:
+        threading.Thread: The warmup thread.
+    """
+    global _warmup_thread, _warmup_pid
+    with _warmup_lock:
+        if _warmup_pid != os.getpid() or _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warmup_in_background, args=(names,), name="model-warmup", daemon=True)
+            _warmup_pid = os.getpid()
+            _warmup_thread.start()
+        return _warmup_thread
+
+def status():
+    """
+    Returns:
+        dict: Registry key -> {"state": pending/loading/ready/failed,
+        "load_seconds", "error"} for this process.
+    """
+    return {
+        name: {"state": _states[name], "load_seconds": _load_seconds.get(name), "error": _errors.get(name)}
+        for name in _loaders
+    }
+
+def is_ready():
+    """Returns True once every registered model is loaded."""
+    return all(state == "ready" for state in _states.values())
+
+def fingerprint(*names):
+    """
+    Identifies the configured models, for keying cached results.
+    Args:
+        *names: Registry keys to include. Defaults to every registered model.
+    Returns:
+        dict: Model identifiers plus the deployment revision and inference backend.
+    """
+    sources = {
+        "bart_tokenizer": BART_MODEL_PATH,
+        "bart": BART_MODEL_PATH,
+        "qa": QA_MODEL_NAME,
+        "nlp": SPACY_GENERAL_MODEL,
+        "nlp_med": SPACY_MED_MODEL,
+    }
+    result = {name: sources.get(name, name) for name in names or _loaders}
+    result["revision"] = MODEL_REVISION
+    result["backend"] = backends.INFERENCE_BACKEND
+    return result
+
+def input_token_limit(tokenizer=None, model=None):
+    """
+    Returns:
+        int: Longest input the summarization model can attend to, in tokens.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    model = model or get_summarizer()
+    return min(tokenizer.model_max_length, model.config.max_position_embeddings)
@@ -0,0 +1,293 @@
+import logging
+import os
+import random
+import threading
+import time
+import metrics
+import storage
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Which registered transport delivers messages: "twilio", or "stub" to record them locally
+NOTIFICATION_TRANSPORT = os.environ.get("NOTIFICATION_TRANSPORT", "twilio")
+TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID", "")
+TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN", "")
+WHATSAPP_FROM = os.environ.get("WHATSAPP_FROM", "")
+WHATSAPP_RECIPIENT = os.environ.get("WHATSAPP_RECIPIENT", "")
+# Public address the recipient downloads PDFs from
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "https://.ngrok-free.app")
+
+# Delivery attempts before a message is marked failed, and the retry backoff
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_BACKOFF_BASE = float(os.environ.get("NOTIFY_BACKOFF_BASE", "2"))
+NOTIFY_BACKOFF_MAX = float(os.environ.get("NOTIFY_BACKOFF_MAX", "300"))
+# Messages claimed per worker pass, and how often the outbox is checked when idle
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", "20"))
+NOTIFY_POLL_INTERVAL = float(os.environ.get("NOTIFY_POLL_INTERVAL", "1"))
+# A message left "sending" this long (e.g. its worker died) is picked up again.
+# The claim is renewed before each send, so this only has to outlast one send.
+NOTIFY_CLAIM_TIMEOUT = 300
+
+NOTIFICATIONS_SENT = metrics.Counter("notifications_total", "Notification delivery attempts by outcome")
+NOTIFICATION_SEND_DURATION = metrics.Histogram("notification_send_seconds", "Time taken by one transport send")
+
+TRANSPORTS = {}
+
+def register_transport(name):
+    """
+    Registers a transport class under a name usable in NOTIFICATION_TRANSPORT.
+    A transport has send(recipient, body, media_url) returning the provider's
+    message id, and raises on failure.
+    """
+    def decorator(cls):
+        TRANSPORTS[name] = cls
+        return cls
+    return decorator
+
+@register_transport("twilio")
+class TwilioTransport:
+    """
+    Sends WhatsApp messages through Twilio. One client is kept for the life of
+    the process, so its HTTP session and connections are reused.
+    Args:
+        client: twilio.rest.Client; created from the TWILIO_* settings if omitted.
+    """
+    def __init__(self, client=None):
+        if client is None:
+            from twilio.rest import Client
+            client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        self.client = client
+
+    def send(self, recipient, body, media_url=None):
+        message = self.client.messages.create(
+            from_=f"whatsapp:{WHATSAPP_FROM}",
+            body=body,
+            media_url=[media_url] if media_url else None,
+            to=f"whatsapp:{recipient}"
+        )
+        return message.sid
+
+@register_transport("stub")
+class StubTransport:
+    """
+    Records messages instead of sending them.
+    Args:
+        failures (int): Number of initial sends that raise, to exercise retries.
+        latency (float): Seconds each send takes.
+    """
+    def __init__(self, failures=0, latency=0.0):
+        self.failures = failures
+        self.latency = latency
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, recipient, body, media_url=None):
+        time.sleep(self.latency)
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("Simulated transport failure")
+            self.sent.append({"recipient": recipient, "body": body, "media_url": media_url})
+            return f"stub-{len(self.sent)}"
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = TRANSPORTS[NOTIFICATION_TRANSPORT]()
+        return _transport
+
+def set_transport(transport):
+    """Replaces the process's transport (e.g. with a StubTransport) and returns the previous one."""
+    global _transport
+    with _transport_lock:
+        previous, _transport = _transport, transport
+    return previous
+
+def init_notifications_table(db_path=None):
+    with storage.connect(db_path) as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS notifications
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         channel TEXT NOT NULL,
+                         recipient TEXT NOT NULL,
+                         body TEXT NOT NULL,
+                         media_url TEXT,
+                         status TEXT NOT NULL,
+                         attempts INTEGER NOT NULL DEFAULT 0,
+                         next_attempt_at REAL NOT NULL,
+                         provider_id TEXT,
+                         last_error TEXT,
+                         created_at REAL NOT NULL,
+                         updated_at REAL NOT NULL)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications (status, next_attempt_at)")
+
+def enqueue(recipient, body, media_url=None, channel="whatsapp"):
+    """
+    Adds a message to the outbox and wakes this process's delivery worker.
+    Returns immediately; delivery happens in the background.
+    Returns:
+        int: Outbox row id.
+    """
+    worker = start_worker()
+    now = time.time()
+    with storage.connect() as conn:
+        notification_id = conn.execute(
+            '''INSERT INTO notifications (channel, recipient, body, media_url, status, next_attempt_at, created_at, updated_at)
+               VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)''',
+            (channel, recipient, body, media_url, now, now, now)
+        ).lastrowid
+    worker.wake()
+    return notification_id
+
+def notify_pdf_ready(pdf_path):
+    """
+    Queues the discharge summary PDF for the patient over WhatsApp.
+    Args:
+        pdf_path (str): Path of the rendered PDF, relative to the app root.
+    """
+    pdf_url = f"{PUBLIC_BASE_URL}/{pdf_path.replace(os.sep, '/')}"
+    return enqueue(WHATSAPP_RECIPIENT, "Here is your discharge summary PDF.", media_url=pdf_url)
+
+def backoff_delay(attempts):
+    """Exponential backoff with full jitter, capped at NOTIFY_BACKOFF_MAX."""
+    return random.uniform(0, min(NOTIFY_BACKOFF_MAX, NOTIFY_BACKOFF_BASE * 2 ** (attempts - 1)))
+
+def claim_due(limit=NOTIFY_BATCH_SIZE, db_path=None):
+    """
+    Marks up to `limit` due messages as sending and returns them. A row is only
+    claimed if it is still unclaimed, so concurrent workers in other processes
+    never take the same message.
+    Returns:
+        list: Claimed rows as dicts; updated_at is the claim's timestamp.
+    """
+    now = time.time()
+    claimed = []
+    with storage.connect(db_path) as conn:
+        rows = conn.execute(
+            '''SELECT * FROM notifications
+               WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND updated_at < ?)
+               ORDER BY next_attempt_at LIMIT ?''',
+            (now, now - NOTIFY_CLAIM_TIMEOUT, limit)
+        ).fetchall()
+        for row in rows:
+            cursor = conn.execute(
+                "UPDATE notifications SET status = 'sending', updated_at = ? WHERE id = ? AND status = ? AND updated_at = ?",
+                (now, row["id"], row["status"], row["updated_at"])
+            )
+            if cursor.rowcount:
+                claimed.append({**dict(row), "updated_at": now})
+    return claimed
+
+def _renew_claim(row, db_path=None):
+    """
+    Refreshes a claimed message's timestamp just before it is sent, so a batch
+    of slow sends never outlives NOTIFY_CLAIM_TIMEOUT for the messages still
+    waiting in it. Returns False if another worker has taken the message over.
+    """
+    now = time.time()
+    with storage.connect(db_path) as conn:
+        cursor = conn.execute(
+            "UPDATE notifications SET updated_at = ? WHERE id = ? AND status = 'sending' AND updated_at = ?",
+            (now, row["id"], row["updated_at"])
+        )
+    row["updated_at"] = now
+    return bool(cursor.rowcount)
+
+def deliver(rows, transport=None, db_path=None):
+    """
+    Sends claimed messages and records every outcome in one transaction.
+    Failures are rescheduled with backoff until NOTIFY_MAX_ATTEMPTS. A message
+    whose claim was lost to another worker is skipped, and its outcome is only
+    written while the claim is still held.
+    Args:
+        rows (list): Rows returned by claim_due.
+    """
+    transport = transport or get_transport()
+    updates = []
+    for row in rows:
+        if not _renew_claim(row, db_path):
+            logger.warning("Notification %s was claimed by another worker; skipping it", row["id"])
+            continue
+        attempts = row["attempts"] + 1
+        start = time.perf_counter()
+        try:
+            with tracing.span("notification.send", channel=row["channel"], attempt=attempts):
+                provider_id = transport.send(row["recipient"], row["body"], row["media_url"])
+        except Exception as e:
+            if attempts >= NOTIFY_MAX_ATTEMPTS:
+                logger.error("Giving up on notification %s after %d attempts: %s", row["id"], attempts, e)
+                updates.append(("failed", attempts, row["next_attempt_at"], None, str(e), time.time(), row["id"], row["updated_at"]))
+                NOTIFICATIONS_SENT.inc(channel=row["channel"], outcome="failed")
+            else:
+                logger.warning("Notification %s attempt %d failed: %s", row["id"], attempts, e)
+                updates.append(("pending", attempts, time.time() + backoff_delay(attempts), None, str(e), time.time(), row["id"], row["updated_at"]))
+                NOTIFICATIONS_SENT.inc(channel=row["channel"], outcome="retry")
+        else:
+            logger.info("Notification %s sent to %s: %s", row["id"], row["recipient"], provider_id)
+            updates.append(("sent", attempts, row["next_attempt_at"], provider_id, None, time.time(), row["id"], row["updated_at"]))
+            NOTIFICATIONS_SENT.inc(channel=row["channel"], outcome="sent")
+        NOTIFICATION_SEND_DURATION.observe(time.perf_counter() - start, channel=row["channel"])
+
+    with storage.connect(db_path) as conn:
+        conn.executemany(
+            '''UPDATE notifications SET status = ?, attempts = ?, next_attempt_at = ?,
+               provider_id = ?, last_error = ?, updated_at = ?
+               WHERE id = ? AND status = 'sending' AND updated_at = ?''',
+            updates
+        )
+
+class NotificationWorker:
+    """
+    Background thread that drains the outbox: claims due messages in batches,
+    sends them over the shared transport and sleeps until woken by enqueue()
+    or NOTIFY_POLL_INTERVAL passes.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notification-worker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            try:
+                rows = claim_due(db_path=self.db_path)
+                if rows:
+                    deliver(rows, db_path=self.db_path)
+                    # A full batch probably means more are waiting
+                    if len(rows) == NOTIFY_BATCH_SIZE:
+                        continue
+            except Exception:
+                logger.exception("Notification worker pass failed")
+            self._wake.wait(NOTIFY_POLL_INTERVAL)
+            self._wake.clear()
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+def start_worker():
+    """
+    Starts this process's delivery worker, creating the outbox table, if it is
+    not already running. Threads do not survive fork, so call it after forking.
+    """
+    global _worker, _worker_pid
+    with _worker_lock:
+        if _worker_pid != os.getpid() or not _worker.running:
+            init_notifications_table()
+            _worker, _worker_pid = NotificationWorker().start(), os.getpid()
+        return _worker
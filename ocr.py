@@ -0,0 +1,185 @@
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageSequence
+import pytesseract
+import tracing
+
+# OCR worker pool size and rasterization resolution
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_DPI = int(os.environ.get("OCR_DPI", "300"))
+# Largest skew (degrees) corrected by deskew, and the search step
+MAX_SKEW_ANGLE = 5.0
+SKEW_STEP = 0.5
+# Bump when preprocessing or cleaning changes, so cached OCR results are not reused
+OCR_PIPELINE_VERSION = "1"
+# Tesseract executable, if it is not on PATH
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD")
+if TESSERACT_CMD:
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+# Lines dropped by clean_ocr_text: long bare numbers, e-mail/web addresses, page headers
+NOISE_LINE_RE = re.compile(r"^\d{5,}$|@|\.com|www|^Page\s\d+", re.IGNORECASE)
+SHORT_NUMERIC_RE = re.compile(r"\d{2,4}")
+
+def clean_ocr_text(ocr_text):
+    lines = ocr_text.split("\n")
+    cleaned_lines = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if NOISE_LINE_RE.search(line):
+            continue
+        if len(line.split()) <= 2 and SHORT_NUMERIC_RE.search(line):
+            continue
+        cleaned_lines.append(line)
+    return "\n".join(cleaned_lines)
+
+@lru_cache(maxsize=1)
+def tesseract_version():
+    return str(pytesseract.get_tesseract_version())
+
+def is_pdf(data):
+    return data[:5] == b"%PDF-"
+
+def count_pages(data):
+    """Returns the number of pages in a PDF or (possibly multi-frame) image."""
+    if is_pdf(data):
+        from pdf2image import pdfinfo_from_bytes
+        return int(pdfinfo_from_bytes(data)["Pages"])
+    with Image.open(io.BytesIO(data)) as image:
+        return getattr(image, "n_frames", 1)
+
+def load_page(data, index):
+    """
+    Loads one page of a document as an image. PDFs are rasterized at OCR_DPI,
+    one page at a time, so large documents never sit in memory all at once.
+    Args:
+        data (bytes): PDF, TIFF stack or single image.
+        index (int): Zero-based page number.
+    Returns:
+        PIL.Image.Image: The page.
+    """
+    if is_pdf(data):
+        from pdf2image import convert_from_bytes
+        return convert_from_bytes(data, dpi=OCR_DPI, first_page=index + 1, last_page=index + 1)[0]
+    with Image.open(io.BytesIO(data)) as image:
+        for i, frame in enumerate(ImageSequence.Iterator(image)):
+            if i == index:
+                return frame.copy()
+    raise IndexError(f"Page {index} out of range")
+
+def otsu_threshold(gray):
+    """Returns the global threshold maximizing between-class variance for a grayscale image."""
+    hist = np.asarray(gray.histogram()[:256], dtype=np.float64)
+    bins = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    cum_mean = np.cumsum(hist * bins)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_bg = cum_mean / weight_bg
+        mean_fg = (cum_mean[-1] - cum_mean) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.nanargmax(between))
+
+def estimate_skew(gray):
+    """
+    Estimates page skew with a projection profile: text rows give the sharpest
+    row-sum profile (highest variance) when the lines are horizontal.
+    Returns:
+        float: Rotation in degrees that straightens the page.
+    """
+    # Skew estimation does not need full resolution
+    small = gray.copy()
+    small.thumbnail((1000, 1000))
+    threshold = otsu_threshold(small)
+    ink = small.point(lambda v: 255 if v <= threshold else 0)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_ANGLE, MAX_SKEW_ANGLE + SKEW_STEP / 2, SKEW_STEP):
+        rotated = np.asarray(ink.rotate(float(angle), resample=Image.NEAREST))
+        score = float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def preprocess(image):
+    """Grayscales, deskews and binarizes a page for Tesseract."""
+    gray = image.convert("L")
+    angle = estimate_skew(gray)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+    threshold = otsu_threshold(gray)
+    return gray.point(lambda v: 255 if v > threshold else 0)
+
+def ocr_page(data, index):
+    """
+    Rasterizes, preprocesses and OCRs one page.
+    Returns:
+        tuple: (page text, timings dict in seconds)
+    """
+    start = time.perf_counter()
+    page = load_page(data, index)
+    loaded = time.perf_counter()
+    page = preprocess(page)
+    preprocessed = time.perf_counter()
+    text = pytesseract.image_to_string(page)
+    done = time.perf_counter()
+    return text, {
+        "load_seconds": loaded - start,
+        "preprocess_seconds": preprocessed - loaded,
+        "ocr_seconds": done - preprocessed,
+    }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Returns the process-wide OCR pool. Threads are enough: Tesseract runs in
+    its own subprocess per page, and forking a server worker that already runs
+    other threads could deadlock on locks they hold.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(OCR_WORKERS, thread_name_prefix="ocr")
+    return _pool
+
+def ocr_document(data, parallel=True):
+    """
+    OCRs every page of a PDF, TIFF stack or single image, in parallel for
+    multi-page documents, keeping page order.
+    Args:
+        data (bytes): Uploaded document.
+        parallel (bool): Use the OCR pool for multi-page documents. Callers
+            that already parallelize across documents pass False.
+    Returns:
+        dict: Cleaned text, per-page timings and total seconds.
+    """
+    start = time.perf_counter()
+    with tracing.span("ocr") as current:
+        page_count = count_pages(data)
+        current.set(pages=page_count)
+        if page_count == 1 or not parallel:
+            results = [ocr_page(data, index) for index in range(page_count)]
+        else:
+            # Page tasks share the upload's bytes; map() yields results in
+            # submission order, i.e. page order
+            results = list(get_pool().map(ocr_page, [data] * page_count, range(page_count)))
+
+        pages = []
+        for index, (text, timings) in enumerate(results):
+            pages.append({"page": index + 1, "chars": len(text), **timings})
+            tracing.record("ocr.page", sum(timings.values()), page=index + 1, **timings)
+    return {
+        "text": clean_ocr_text("\n".join(text for text, _ in results)),
+        "pages": pages,
+        "total_seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,173 @@
+"""
+Parity harness for the inference backends in backends.py.
+
+Runs the fp32 PyTorch reference and a candidate backend over a fixed sample
+set, each in its own process so latency and peak memory are measured
+separately, then compares summaries and QA answers.
+
+Usage:
+    python parity.py --backend onnx-int8 [--samples samples/parity.jsonl] [--output parity.json]
+
+Exits with status 1 if the candidate falls below the agreement thresholds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+REFERENCE_BACKEND = "torch"
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples", "parity.jsonl")
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_samples(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def token_f1(reference, candidate):
+    """Bag-of-words F1 between two strings."""
+    ref_tokens = reference.lower().split()
+    cand_tokens = candidate.lower().split()
+    if not ref_tokens or not cand_tokens:
+        return float(ref_tokens == cand_tokens)
+    common = sum((Counter(ref_tokens) & Counter(cand_tokens)).values())
+    if common == 0:
+        return 0.0
+    precision = common / len(cand_tokens)
+    recall = common / len(ref_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+def run_backend(backend, samples_path, output_path):
+    """Loads one backend, runs every sample through it and writes the raw outputs as JSON."""
+    import backends
+    import models
+    from extractor import NER_FIELDS, QUESTIONS, answer_questions, combine_inputs
+    import decoding
+    from pipeline import build_summary_input
+
+    samples = load_samples(samples_path)
+    tokenizer = models.get_tokenizer()
+    start = time.perf_counter()
+    model = backends.load_seq2seq(models.BART_MODEL_PATH, backend)
+    qa = backends.load_qa(models.QA_MODEL_NAME, backend)
+    load_seconds = time.perf_counter() - start
+    limit = models.input_token_limit(tokenizer, model)
+    questions = [question for key, question in QUESTIONS.items() if key not in NER_FIELDS]
+
+    results = []
+    for sample in samples:
+        texts = (sample.get("ocr_text", ""), sample.get("additional_text", ""), sample.get("audio_text", ""))
+        # Empty extracted fields keep the prompt identical across backends
+        prompt = build_summary_input({}, *texts)
+        inputs = tokenizer(prompt, return_tensors="pt", max_length=limit, truncation=True)
+        generate_kwargs = decoding.expand(decoding.generation_kwargs("quality", inputs["input_ids"].shape[1]))
+        start = time.perf_counter()
+        outputs = model.generate(inputs["input_ids"], attention_mask=inputs["attention_mask"], **generate_kwargs)
+        generation_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        answers = answer_questions(qa, questions, combine_inputs(*texts))
+        qa_seconds = time.perf_counter() - start
+
+        results.append({
+            "id": sample["id"],
+            "summary": tokenizer.decode(outputs[0], skip_special_tokens=True),
+            "answers": [{"answer": a[0]["answer"], "score": float(a[0]["score"])} for a in answers],
+            "generation_seconds": generation_seconds,
+            "qa_seconds": qa_seconds,
+        })
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "backend": backend,
+            "load_seconds": load_seconds,
+            "peak_rss_mb": peak_rss_mb(),
+            "samples": results,
+        }, f)
+
+def _run_in_subprocess(backend, samples_path):
+    fd, output_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", backend, "--samples", samples_path, "--output", output_path],
+            check=True
+        )
+        with open(output_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.remove(output_path)
+
+def compare(reference, candidate):
+    """
+    Returns:
+        dict: Agreement and performance of candidate relative to reference.
+    """
+    summary_f1, summary_exact, qa_exact, score_deltas = [], [], [], []
+    for ref, cand in zip(reference["samples"], candidate["samples"]):
+        summary_f1.append(token_f1(ref["summary"], cand["summary"]))
+        summary_exact.append(ref["summary"].strip() == cand["summary"].strip())
+        for ref_answer, cand_answer in zip(ref["answers"], cand["answers"]):
+            qa_exact.append(ref_answer["answer"].strip() == cand_answer["answer"].strip())
+            score_deltas.append(abs(ref_answer["score"] - cand_answer["score"]))
+
+    def median_of(run, field):
+        return statistics.median(sample[field] for sample in run["samples"])
+
+    report = {
+        "reference": reference["backend"],
+        "candidate": candidate["backend"],
+        "samples": len(summary_f1),
+        "summary_exact_match": sum(summary_exact) / len(summary_exact),
+        "summary_token_f1_mean": statistics.mean(summary_f1),
+        "summary_token_f1_min": min(summary_f1),
+        "qa_exact_match": sum(qa_exact) / len(qa_exact),
+        "qa_max_score_delta": max(score_deltas),
+        "generation_p50_seconds": {run["backend"]: median_of(run, "generation_seconds") for run in (reference, candidate)},
+        "qa_p50_seconds": {run["backend"]: median_of(run, "qa_seconds") for run in (reference, candidate)},
+        "load_seconds": {run["backend"]: run["load_seconds"] for run in (reference, candidate)},
+        "peak_rss_mb": {run["backend"]: run["peak_rss_mb"] for run in (reference, candidate)},
+    }
+    report["generation_speedup"] = report["generation_p50_seconds"][reference["backend"]] / report["generation_p50_seconds"][candidate["backend"]]
+    report["qa_speedup"] = report["qa_p50_seconds"][reference["backend"]] / report["qa_p50_seconds"][candidate["backend"]]
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an inference backend against the fp32 PyTorch reference.")
+    parser.add_argument("--backend", default="onnx-int8", help="Candidate backend to check")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="JSONL sample set")
+    parser.add_argument("--output", help="Write the comparison report (or, with --worker, raw outputs) here")
+    parser.add_argument("--min-summary-f1", type=float, default=0.9, help="Minimum mean summary token F1")
+    parser.add_argument("--min-qa-match", type=float, default=0.9, help="Minimum QA exact-match rate")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args.worker, args.samples, args.output)
+        return
+
+    reference = _run_in_subprocess(REFERENCE_BACKEND, args.samples)
+    candidate = _run_in_subprocess(args.backend, args.samples)
+    report = compare(reference, candidate)
+    report["passed"] = report["summary_token_f1_mean"] >= args.min_summary_f1 and report["qa_exact_match"] >= args.min_qa_match
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if not report["passed"]:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
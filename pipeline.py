@@ -0,0 +1,392 @@
+import re
+import threading
+import time
+from contextlib import closing, contextmanager
+import admission
+import batching
+import cache
+import chunking
+import decoding
+import drafts
+import lexicon
+import models
+import storage
+import tracing
+from extractor import SOURCES, answer_combined, combine_inputs, create_pdf, extract_source, merge_extractions, normalize_source
+
+# Pipeline stages, in execution order
+STAGES = ("extraction", "generation", "pdf", "storage")
+
+# Long inputs are summarized chunk by chunk first (map), then fused (reduce)
+CHUNK_GENERATION_KWARGS = {
+    "max_length": 160,
+    "min_length": 30,
+    "num_beams": 2,
+    "early_stopping": True,
+    "no_repeat_ngram_size": 3,
+}
+# Tokens repeated between consecutive chunks of a section
+CHUNK_OVERLAP_TOKENS = 64
+# Tokens reserved for special tokens and the chunk's section header
+CHUNK_MARGIN_TOKENS = 32
+# Largest share of the input window the preamble (extracted fields) may take
+# in chunk prompts; a longer one is truncated so the notes keep room
+PREAMBLE_MAX_SHARE = 0.5
+# Chunk prompts submitted to the batcher at a time
+CHUNK_BATCH_SIZE = batching.GENERATION_MAX_BATCH
+
+SECTION_HEADERS = (
+    "Additional Notes from Image Report:",
+    "Additional Notes from Text Input:",
+    "Additional Notes from Doctor-Patient Conversation:",
+)
+SUMMARY_INSTRUCTION = "Provide a concise discharge summary incorporating all relevant details."
+CHUNK_INSTRUCTION = "Summarize the clinically relevant details of these notes."
+PARTIALS_HEADER = "Summaries of the clinical notes:"
+
+# Token streaming cannot be combined with beam search, so the streaming
+# endpoint uses the greedy decoding profile
+STREAM_PROFILE = "fast"
+# Seconds to wait for the next token before giving up on a stalled generation
+STREAM_TOKEN_TIMEOUT = 120
+
+def build_summary_input(extracted_info, ocr_text="", additional_text="", audio_text=""):
+    """
+    Builds the generation prompt from the extracted fields and the raw inputs.
+    Args:
+        extracted_info (dict): Output of extract_information_from_text.
+        ocr_text (str): Text from image report.
+        additional_text (str): Manually entered text.
+        audio_text (str): Transcribed audio text.
+    Returns:
+        str: Prompt for the summarization model.
+    """
+    combined_info = {
+        "Name": extracted_info.get("Name", "Not specified"),
+        "Age": extracted_info.get("Age", "Not specified"),
+        "Gender": extracted_info.get("Gender", "Not specified"),
+        "Disease": extracted_info.get("Disease", "Not specified"),
+        "Medications": extracted_info.get("Medications", "None specified") if extracted_info.get("Medications") != "Not Available" else "None specified",
+        "Discharge Date": extracted_info.get("Discharge Date")
+    }
+
+    return (
+        "Generate a discharge summary based on the following clinical information:\n"
+        f"Patient Name: {combined_info['Name']}\n"
+        f"Age: {combined_info['Age']}\n"
+        f"Gender: {combined_info['Gender']}\n"
+        f"Disease/Condition: {combined_info['Disease']}\n"
+        f"Medications: {', '.join(combined_info['Medications']) if isinstance(combined_info['Medications'], list) else combined_info['Medications']}\n"
+        f"Discharge Date: {combined_info['Discharge Date']}\n"
+        f"{SECTION_HEADERS[0]}\n" + (ocr_text if ocr_text else "None provided") + "\n"
+        f"{SECTION_HEADERS[1]}\n" + (additional_text if additional_text else "None provided") + "\n"
+        f"{SECTION_HEADERS[2]}\n" + (audio_text if audio_text else "None provided") + "\n"
+        f"{SUMMARY_INSTRUCTION}"
+    ).strip()
+
+def generate_summary(combined_text, profile=None, deadline=None):
+    """
+    Runs the summarization model on a prompt. Concurrent callers are batched
+    into shared generate() calls by the process-wide GenerationBatcher.
+    Args:
+        combined_text (str): Prompt built by build_summary_input.
+        profile (str): Decoding profile (see decoding.py); defaults to GENERATION_PROFILE.
+        deadline (float): Seconds the generation may take. A cheaper profile is
+            used when the requested one is not expected to make it, and
+            generation is cut off once it passes.
+    Returns:
+        str: Generated discharge summary.
+    """
+    start = time.perf_counter()
+    profile = profile or decoding.GENERATION_PROFILE
+    deadline = deadline or decoding.GENERATION_DEADLINE or None
+    input_tokens = count_tokens(combined_text)
+    # Condensed prompts fill the model's window
+    budget_tokens = min(input_tokens, models.input_token_limit())
+    profile = decoding.choose(profile, budget_tokens, deadline)
+    generate_kwargs = decoding.generation_kwargs(profile, budget_tokens)
+    key = generation_cache_key(combined_text, generate_kwargs)
+
+    result_cache = cache.get_cache()
+    summary = result_cache.get("generation", key) if result_cache else None
+    if summary is not None:
+        return summary
+
+    with admission.limit("generation"):
+        prompt = condense_input(combined_text, input_tokens)
+        kwargs = generate_kwargs
+        if deadline:
+            # Whatever queueing and condensing used comes out of the deadline
+            kwargs = decoding.generation_kwargs(profile, budget_tokens, max_time=max(deadline - (time.perf_counter() - start), 1e-3))
+        generate_start = time.perf_counter()
+        future = batching.get_batcher().submit(prompt, **kwargs)
+        summary = re.sub(r'\s+', ' ', future.result()).strip()
+        duration = time.perf_counter() - generate_start
+    decoding.observe(profile, generate_kwargs["max_length"], duration)
+    # A summary cut off at a deadline (its own or a batch-mate's tighter one)
+    # is not cached as the profile's result
+    if result_cache and not future.cut_off:
+        result_cache.set("generation", key, summary)
+    return summary
+
+def count_tokens(text):
+    return len(models.get_tokenizer()(text, add_special_tokens=False)["input_ids"])
+
+def truncate_tokens(text, max_tokens):
+    """Returns text cut to its first max_tokens tokens."""
+    tokenizer = models.get_tokenizer()
+    input_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    if len(input_ids) <= max_tokens:
+        return text
+    return tokenizer.decode(input_ids[:max_tokens]).strip()
+
+def _summarize_chunks(prompts):
+    # Submit together so the batcher can run them in shared generate() calls
+    batcher = batching.get_batcher()
+    futures = [batcher.submit(prompt, **CHUNK_GENERATION_KWARGS) for prompt in prompts]
+    return [re.sub(r'\s+', ' ', future.result()).strip() for future in futures]
+
+def _fold(preamble, partials, budget):
+    # Merge leading partial summaries until they all fit in one prompt, so the
+    # number kept in memory stays bounded however long the input is
+    counts = [count_tokens(partial) for partial in partials]
+    while len(partials) > 1 and sum(counts) > budget:
+        size, total = 0, 0
+        while size < len(partials) and (size < 2 or total + counts[size] <= budget):
+            total += counts[size]
+            size += 1
+        prompt = f"{preamble}\n{PARTIALS_HEADER}\n" + "\n".join(partials[:size]) + f"\n{CHUNK_INSTRUCTION}"
+        merged = _summarize_chunks([prompt])[0]
+        partials = [merged] + partials[size:]
+        counts = [count_tokens(merged)] + counts[size:]
+    return partials
+
+def condense_input(combined_text, input_tokens=None):
+    """
+    Returns a prompt that fits in the summarization model's input window.
+    Prompts that already fit are returned unchanged. Longer ones are split into
+    overlapping, section-aware chunks that are summarized in batches; the
+    chunk summaries, folded together whenever they outgrow the window, replace
+    the raw notes in the final prompt.
+    Args:
+        combined_text (str): Prompt built by build_summary_input.
+        input_tokens (int): Token count of combined_text, if already known.
+    Returns:
+        str: Prompt for the final generation pass.
+    """
+    limit = models.input_token_limit()
+    if input_tokens is None:
+        input_tokens = count_tokens(combined_text)
+    if input_tokens <= limit - CHUNK_MARGIN_TOKENS:
+        return combined_text
+
+    preamble, sections = chunking.split_sections(combined_text, SECTION_HEADERS, SUMMARY_INSTRUCTION)
+    # Long extracted fields must not squeeze the notes' budget down to nothing
+    preamble = truncate_tokens(preamble, int(limit * PREAMBLE_MAX_SHARE))
+    fixed_tokens = count_tokens(preamble) + count_tokens(SUMMARY_INSTRUCTION) + count_tokens(PARTIALS_HEADER)
+    budget = limit - fixed_tokens - CHUNK_MARGIN_TOKENS
+
+    partials, prompts = [], []
+    for header, chunk in chunking.iter_chunks(sections, count_tokens, budget, CHUNK_OVERLAP_TOKENS):
+        prompts.append(f"{preamble}\n{header}\n{chunk}\n{CHUNK_INSTRUCTION}")
+        if len(prompts) == CHUNK_BATCH_SIZE:
+            partials = _fold(preamble, partials + _summarize_chunks(prompts), budget)
+            prompts = []
+    if prompts:
+        partials = _fold(preamble, partials + _summarize_chunks(prompts), budget)
+
+    return f"{preamble}\n{PARTIALS_HEADER}\n" + "\n".join(partials) + f"\n{SUMMARY_INSTRUCTION}"
+
+def _admitted(extract, *args):
+    # Only actual model runs take an extraction slot; cache hits don't
+    with admission.limit("extraction"):
+        return extract(*args)
+
+def extract_fields(ocr_text="", additional_text="", audio_text="", draft_id=None):
+    """
+    Extracts each input source through a content-addressed cache, answers the
+    QA questions once over the combined context, and merges the results. A
+    source seen before is never re-parsed. With a draft, sources unchanged
+    since the draft's last run are taken from the draft even when the result
+    cache is disabled or has evicted them. The discharge date and time are
+    always stamped fresh.
+    Args:
+        draft_id (str): Optional draft (see drafts.py) to reuse and update.
+    Returns:
+        dict: Consolidated clinical information.
+    """
+    fingerprint = models.fingerprint("nlp", "nlp_med")
+    lexicon_version = lexicon.fingerprint()
+    previous = drafts.get_sources(draft_id) if draft_id else {}
+    sources, extractions, changed = {}, [], []
+    for name, text in zip(SOURCES, (ocr_text, additional_text, audio_text)):
+        key = cache.make_key("extraction", normalize_source(text), models=fingerprint, lexicon=lexicon_version)
+        if previous.get(name, {}).get("key") == key:
+            extraction = previous[name]["extraction"]
+        else:
+            with tracing.span("extraction.source", source=name):
+                extraction = cache.cached("extraction", key, lambda: _admitted(extract_source, text))
+            changed.append(name)
+        sources[name] = {"key": key, "extraction": extraction}
+        extractions.append(extraction)
+    if draft_id and changed:
+        drafts.save_sources(draft_id, sources)
+
+    # QA spans and scores depend on the whole context, so the questions are
+    # answered once over all sources together; Procedures only when the
+    # lexicon found none
+    combined_text = combine_inputs(ocr_text, additional_text, audio_text)
+    ask_procedures = not any(extraction["procedures"] or extraction.get("procedures_matched") for extraction in extractions)
+    key = cache.make_key("extraction_qa", combined_text, models=models.fingerprint("qa", "nlp"), procedures=ask_procedures)
+    answers = cache.cached("extraction", key, lambda: _admitted(answer_combined, combined_text, ask_procedures))
+    return merge_extractions(extractions, answers)
+
+def generation_cache_key(combined_text, generate_kwargs):
+    return cache.make_key("generation", combined_text, models=models.fingerprint("bart"), params=generate_kwargs)
+
+def run_pipeline(ocr_text="", additional_text="", audio_text="", on_stage=None, draft_id=None, profile=None, deadline=None):
+    """
+    Runs extraction, generation, PDF rendering and storage for one patient.
+    Args:
+        ocr_text (str): Text from image report.
+        additional_text (str): Manually entered text.
+        audio_text (str): Transcribed audio text.
+        on_stage (callable): Called as on_stage(stage, timings) before each stage,
+            with the per-stage timings recorded so far. It may raise to abort the run.
+        draft_id (str): Optional draft whose unchanged sources skip extraction.
+        profile (str): Decoding profile; defaults to GENERATION_PROFILE.
+        deadline (float): Generation deadline in seconds (see generate_summary).
+    Returns:
+        dict: extracted_info, summary and per-stage timings in seconds.
+    """
+    timings = {}
+
+    @contextmanager
+    def stage(name):
+        if on_stage:
+            on_stage(name, timings)
+        start = time.perf_counter()
+        with tracing.span(name):
+            yield
+        timings[name] = time.perf_counter() - start
+
+    with tracing.span("pipeline"):
+        with stage("extraction"):
+            extracted_info = extract_fields(ocr_text, additional_text, audio_text, draft_id)
+
+        with stage("generation"):
+            summary = generate_summary(build_summary_input(extracted_info, ocr_text, additional_text, audio_text), profile, deadline)
+
+        with stage("pdf"):
+            # Rendering and the WhatsApp notification continue in the background;
+            # downloads are rendered in memory by /pdf
+            create_pdf(extracted_info, summary)
+
+        with stage("storage"):
+            # Store data in SQLite database using extracted_info
+            storage.save_patient(extracted_info, summary)
+
+    return {"extracted_info": extracted_info, "summary": summary, "timings": timings}
+
+def stream_generation_kwargs(input_tokens):
+    """Decoding arguments for the streaming endpoint, budgeted for a prompt of input_tokens."""
+    return decoding.generation_kwargs(STREAM_PROFILE, min(input_tokens, models.input_token_limit()))
+
+class _StopOnEvent:
+    """Stopping criterion that ends generation once event is set."""
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+def stream_summary(combined_text, input_tokens=None):
+    """
+    Generates a summary and yields decoded text as the model produces it.
+    Closing the generator early (e.g. when the client disconnects) stops the
+    generation and returns only once the model has let go of the CPU.
+    Args:
+        combined_text (str): Prompt built by build_summary_input.
+        input_tokens (int): Token count of combined_text, if already known.
+    Yields:
+        str: Newly decoded text pieces, in order.
+    """
+    from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+    if input_tokens is None:
+        input_tokens = count_tokens(combined_text)
+    generate_kwargs = decoding.expand(stream_generation_kwargs(input_tokens))
+    stop = threading.Event()
+    generate_kwargs["stopping_criteria"] = StoppingCriteriaList([*generate_kwargs.get("stopping_criteria", []), _StopOnEvent(stop)])
+    tokenizer = models.get_tokenizer()
+    model = models.get_summarizer()
+    inputs = tokenizer(condense_input(combined_text, input_tokens), return_tensors="pt", max_length=models.input_token_limit(), truncation=True)
+    streamer = TextIteratorStreamer(tokenizer, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT)
+    errors = []
+
+    def run():
+        try:
+            model.generate(inputs["input_ids"], attention_mask=inputs["attention_mask"], streamer=streamer, **generate_kwargs)
+        except Exception as e:
+            errors.append(e)
+            # Unblock the consumer
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="summary-stream", daemon=True)
+    thread.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    finally:
+        # Ends the generation at its next step if the consumer stopped early
+        stop.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+def stream_pipeline(ocr_text="", additional_text="", audio_text="", draft_id=None):
+    """
+    Streaming variant of run_pipeline. Extracted fields are yielded as soon as
+    extraction finishes, then summary text as it is generated; the PDF and the
+    database row are written once generation completes.
+    Yields:
+        tuple: (event, data) with event one of "fields", "token" or "done".
+    """
+    # Spans must not stay open across a yield, so the streamed generation is
+    # timed by hand and recorded afterwards
+    with tracing.span("extraction", streaming=True):
+        extracted_info = extract_fields(ocr_text, additional_text, audio_text, draft_id)
+    yield "fields", extracted_info
+
+    combined_text = build_summary_input(extracted_info, ocr_text, additional_text, audio_text)
+    input_tokens = count_tokens(combined_text)
+    generate_kwargs = stream_generation_kwargs(input_tokens)
+    key = generation_cache_key(combined_text, generate_kwargs)
+    result_cache = cache.get_cache()
+    summary = result_cache.get("generation", key) if result_cache else None
+    if summary is not None:
+        # Cached: send the whole summary as one piece
+        yield "token", summary
+    else:
+        pieces = []
+        start = time.perf_counter()
+        # The slot is held while tokens stream out. If the client goes away the
+        # generation is stopped and its thread joined before the slot is released
+        with admission.limit("generation"), closing(stream_summary(combined_text, input_tokens)) as stream:
+            for text in stream:
+                pieces.append(text)
+                yield "token", text
+        summary = re.sub(r'\s+', ' ', "".join(pieces)).strip()
+        duration = time.perf_counter() - start
+        tracing.record("generation", duration, streaming=True)
+        tracing.record_generation(count_tokens(summary), duration, num_beams=generate_kwargs["num_beams"])
+        if result_cache:
+            result_cache.set("generation", key, summary)
+
+    with tracing.span("pdf", streaming=True):
+        create_pdf(extracted_info, summary)
+    with tracing.span("storage", streaming=True):
+        storage.save_patient(extracted_info, summary)
+    yield "done", {"summary": summary}
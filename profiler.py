@@ -0,0 +1,67 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+# Seconds between stack samples
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", "0.01"))
+# Start sampling at import (i.e. when the app starts)
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock profiler: a background thread snapshots every other
+    thread's Python stack at a fixed interval and counts identical stacks.
+    The output is in collapsed-stack format ("frame;frame;frame count"), which
+    flame graph tools read directly.
+    Args:
+        interval (float): Seconds between samples.
+    """
+    def __init__(self, interval=PROFILER_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.samples = Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops sampling and returns the collapsed stacks."""
+        with self._lock:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread.join()
+                self._thread = None
+        return self.collapsed()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+profiler = SamplingProfiler()
+if PROFILER_ENABLED:
+    profiler.start()
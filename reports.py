@@ -0,0 +1,295 @@
+"""
+Discharge summary PDF rendering.
+
+Each summary gets its own file, named by a hash of its content, written
+atomically so concurrent renders never clobber each other. Rendering can run
+into memory (render_bytes), on a background pool for PDFs shared by link
+(render_async), or for many summaries at once (render_batch, or the CLI below).
+
+Usage:
+    python reports.py summaries.jsonl [--output-dir static/pdfs] [--workers 4]
+
+Each input line is {"extracted_info": {...}, "summary": "..."}; the path of
+each rendered PDF is printed in input order.
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+PDF_DIR = os.path.join("static", "pdfs")
+# PDFs written only so a notification can link to them; each is deleted
+# PDF_RETENTION seconds after it was written, by a sweep run at most every
+# PDF_SWEEP_INTERVAL seconds
+SHARED_PDF_DIR = os.path.join(PDF_DIR, "shared")
+PDF_RETENTION = float(os.environ.get("PDF_RETENTION", "86400"))
+PDF_SWEEP_INTERVAL = 600
+# Background renders in the web app; "thread" or "process"
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "2"))
+PDF_EXECUTOR = os.environ.get("PDF_EXECUTOR", "thread")
+
+LEFT_MARGIN = 100
+BOTTOM_MARGIN = 40
+LINE_HEIGHT = 20
+BODY_FONT = "Helvetica"
+BODY_SIZE = 10
+
+@lru_cache(maxsize=4096)
+def _width(text, font, size):
+    return stringWidth(text, font, size)
+
+def _split_word(word, font, size, max_width):
+    """Hyphenates a word wider than a whole line into line-sized pieces."""
+    pieces, current, current_width = [], "", 0.0
+    limit = max_width - _width("-", font, size)
+    for char in word:
+        char_width = _width(char, font, size)
+        if current and current_width + char_width > limit:
+            pieces.append(current + "-")
+            current, current_width = "", 0.0
+        current += char
+        current_width += char_width
+    pieces.append(current)
+    return pieces
+
+def wrap_text(text, font=BODY_FONT, size=BODY_SIZE, max_width=None):
+    """
+    Greedy word wrap by font metrics. Each word is measured once, so the cost
+    is linear in the length of the text. Newlines start new lines.
+    Args:
+        text (str): Text to wrap.
+        font (str): Font name the text will be drawn in.
+        size (float): Font size.
+        max_width (float): Line width in points; defaults to the page's text column.
+    Returns:
+        list: Lines that each fit within max_width.
+    """
+    max_width = max_width or letter[0] - 2 * LEFT_MARGIN
+    space = _width(" ", font, size)
+    lines = []
+    for paragraph in text.split("\n"):
+        line, line_width = [], 0.0
+        for word in paragraph.split():
+            word_width = _width(word, font, size)
+            if word_width > max_width:
+                pieces = _split_word(word, font, size, max_width)
+                if line:
+                    lines.append(" ".join(line))
+                lines.extend(pieces[:-1])
+                line, line_width = [pieces[-1]], _width(pieces[-1], font, size)
+            elif line and line_width + space + word_width > max_width:
+                lines.append(" ".join(line))
+                line, line_width = [word], word_width
+            else:
+                line_width += (space if line else 0.0) + word_width
+                line.append(word)
+        if line:
+            lines.append(" ".join(line))
+    return lines
+
+def render_pdf(extracted_info, summary, output):
+    """
+    Render the discharge summary PDF.
+    Args:
+        extracted_info (dict): Dictionary containing extracted information from the text inputs.
+        summary (str): Summary text to be included in the PDF.
+        output: File path or writable binary file object.
+    """
+    c = canvas.Canvas(output, pagesize=letter)
+    width, height = letter
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(LEFT_MARGIN, height - 40, "Patient Discharge Summary")
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(LEFT_MARGIN, height - 80, f"Patient Name: {extracted_info.get('Name', 'Not specified')}")
+    c.drawString(LEFT_MARGIN, height - 100, f"Discharge Date: {extracted_info.get('Discharge Date', 'Not specified')}")
+    c.setStrokeColorRGB(0, 0, 0)
+    c.setLineWidth(0.5)
+    c.line(LEFT_MARGIN, height - 110, width - LEFT_MARGIN, height - 110)
+    c.setFont(BODY_FONT, BODY_SIZE)
+    c.drawString(LEFT_MARGIN, height - 140, "Discharge Summary Details:")
+
+    y = height - 160
+
+    def draw_lines(lines):
+        nonlocal y
+        for line in lines:
+            if y < BOTTOM_MARGIN:
+                c.showPage()
+                y = height - 40
+                c.setFont(BODY_FONT, BODY_SIZE)
+            c.drawString(LEFT_MARGIN, y, line)
+            y -= LINE_HEIGHT
+
+    for key, value in extracted_info.items():
+        draw_lines(wrap_text(f"{key}: {value}"))
+
+    y -= LINE_HEIGHT
+    if y < BOTTOM_MARGIN + LINE_HEIGHT:
+        c.showPage()
+        y = height - 40
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(LEFT_MARGIN, y, "SUMMARY")
+    c.setFont(BODY_FONT, BODY_SIZE)
+    y -= LINE_HEIGHT
+    draw_lines(wrap_text(summary))
+
+    # Keep the footer block together on one page
+    if y - 3 * LINE_HEIGHT < BOTTOM_MARGIN:
+        c.showPage()
+        y = height - 40
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(LEFT_MARGIN, y, "Approved by: ABC Hospital")
+    c.setFont("Helvetica-Bold", 8)
+    c.drawString(LEFT_MARGIN, y - 20, "Additional Notes")
+    c.drawString(LEFT_MARGIN, y - 40, "In case of Emergency, contact:")
+    c.drawString(LEFT_MARGIN, y - 60, "0494-2763225")
+    c.save()
+
+def render_bytes(extracted_info, summary):
+    """Renders the PDF in memory and returns its bytes."""
+    buffer = io.BytesIO()
+    render_pdf(extracted_info, summary, buffer)
+    return buffer.getvalue()
+
+def pdf_path_for(extracted_info, summary, directory=PDF_DIR):
+    """
+    Returns the file a summary renders to. The name is a hash of the content,
+    so different patients never share a file and the name is not guessable
+    from patient details.
+    """
+    content = json.dumps([extracted_info, summary], sort_keys=True, default=str)
+    return os.path.join(directory, f"discharge-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]}.pdf")
+
+def write_pdf(extracted_info, summary, directory=PDF_DIR):
+    """
+    Renders a summary to its own file. The PDF is built in memory and moved
+    into place, so readers never see a partly written file.
+    Returns:
+        tuple: (path, render seconds)
+    """
+    start = time.perf_counter()
+    data = render_bytes(extracted_info, summary)
+    path = pdf_path_for(extracted_info, summary, directory)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logger.info("Discharge summary PDF has been saved at %s", path)
+    return path, time.perf_counter() - start
+
+def sweep_pdfs(directory=SHARED_PDF_DIR, max_age=PDF_RETENTION):
+    """
+    Deletes rendered PDFs in directory older than max_age seconds.
+    Returns:
+        int: Number of files deleted.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not (entry.name.startswith("discharge-") and entry.name.endswith(".pdf")):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # Swept by another process in the meantime
+            pass
+    return removed
+
+_last_sweep = 0.0
+
+def _write_shared(extracted_info, summary):
+    global _last_sweep
+    result = write_pdf(extracted_info, summary, SHARED_PDF_DIR)
+    now = time.monotonic()
+    if now - _last_sweep >= PDF_SWEEP_INTERVAL:
+        _last_sweep = now
+        removed = sweep_pdfs(SHARED_PDF_DIR, PDF_RETENTION)
+        if removed:
+            logger.info("Deleted %d shared PDFs older than %.0f seconds", removed, PDF_RETENTION)
+    return result
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide render pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if PDF_EXECUTOR == "process" and "fork" in multiprocessing.get_all_start_methods():
+                _pool = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context("fork"))
+            else:
+                _pool = ThreadPoolExecutor(PDF_WORKERS, thread_name_prefix="pdf")
+        return _pool
+
+def render_async(extracted_info, summary):
+    """
+    Queues a render into SHARED_PDF_DIR on the background pool, for a PDF that
+    has to be reachable by URL. Old shared PDFs are swept on the way.
+    Returns:
+        Future: Resolves to (path, render seconds).
+    """
+    return get_pool().submit(_write_shared, extracted_info, summary)
+
+def _write_record(record, directory):
+    return write_pdf(record["extracted_info"], record["summary"], directory)[0]
+
+def render_batch(records, directory=PDF_DIR, workers=1):
+    """
+    Renders many summaries, in this process or across `workers` processes,
+    reusing the font metric caches between documents.
+    Args:
+        records (iterable): Dicts with extracted_info and summary.
+    Yields:
+        str: Path of each PDF, in input order.
+    """
+    if workers <= 1:
+        for record in records:
+            yield _write_record(record, directory)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        yield from pool.map(_write_record, records, itertools.repeat(directory), chunksize=16)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render discharge summary PDFs from a JSONL file.")
+    parser.add_argument("input", help="JSONL with extracted_info and summary per line")
+    parser.add_argument("--output-dir", default=PDF_DIR)
+    parser.add_argument("--workers", type=int, default=1, help="Rendering processes")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    start = time.perf_counter()
+    for path in render_batch(records, args.output_dir, args.workers):
+        print(path)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {len(records)} PDFs in {elapsed:.2f}s", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
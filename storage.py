@@ -0,0 +1,262 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# SQLite database initialization
+DB_PATH = "patients.db"
+# Idle connections kept per database and process
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+# Most patient rows committed in one transaction by the writer thread
+DB_WRITE_BATCH = int(os.environ.get("DB_WRITE_BATCH", "64"))
+# Rows per /view_data page
+PAGE_SIZE = 50
+
+WRITE_BATCH_SIZE = metrics.Histogram("storage_write_batch_size", "Patient rows committed per transaction", buckets=(1, 2, 4, 8, 16, 32, 64))
+
+def _open(db_path):
+    # Connections are handed between threads by the pool, never shared concurrently
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers proceed while a write is in progress; NORMAL sync is
+    # durable across application crashes and only risks the last commit on power loss
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class ConnectionPool:
+    """
+    Reuses SQLite connections instead of opening one per call. Connections are
+    created on demand; at most `size` idle ones are kept.
+    Args:
+        db_path (str): Database file.
+        size (int): Idle connections retained.
+    """
+    def __init__(self, db_path, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        """Yields a connection; commits on success and rolls back on error."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = _open(self.db_path)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+def get_pool(db_path=None):
+    """Returns this process's pool for db_path. SQLite connections must not cross a fork, so children start fresh."""
+    global _pools, _pools_pid
+    db_path = db_path or DB_PATH
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools, _pools_pid = {}, os.getpid()
+        if db_path not in _pools:
+            _pools[db_path] = ConnectionPool(db_path)
+        return _pools[db_path]
+
+def connect(db_path=None):
+    """Context manager yielding a pooled connection to db_path (default DB_PATH)."""
+    return get_pool(db_path).connection()
+
+def init_db():
+    with connect() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS patients
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         name TEXT,
+                         age TEXT,
+                         gender TEXT,
+                         history TEXT,
+                         summary TEXT,
+                         created_at REAL)''')
+        # Databases created before created_at existed; their old rows stay NULL
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(patients)")}
+        if "created_at" not in columns:
+            conn.execute("ALTER TABLE patients ADD COLUMN created_at REAL")
+        # NOCASE matches LIKE's default case-insensitivity, so prefix searches use the index
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_patients_name ON patients (name COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_patients_created_at ON patients (created_at)")
+        # Cases stored by each batch run (see batch.py)
+        conn.execute('''CREATE TABLE IF NOT EXISTS batch_checkpoints
+                        (run TEXT NOT NULL,
+                         case_id TEXT NOT NULL,
+                         PRIMARY KEY (run, case_id))''')
+
+def _patient_row(extracted_info, summary, created_at=None):
+    return (extracted_info.get('Name', 'Not specified'),
+            extracted_info.get('Age', 'Not specified'),
+            extracted_info.get('Gender', 'Not specified'),
+            extracted_info.get('Medical History', 'Not specified'),
+            summary,
+            created_at or time.time())
+
+def _insert(conn, rows):
+    conn.executemany('''INSERT INTO patients (name, age, gender, history, summary, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)''', rows)
+
+def save_patients(records, db_path=None, checkpoint=None):
+    """
+    Stores many patients in a single transaction.
+    Args:
+        records (iterable): (extracted_info, summary) pairs.
+        checkpoint (tuple): Optional (run name, case ids) marked complete in the
+            same transaction, so a resumed batch run never stores a case twice.
+    """
+    rows = [_patient_row(extracted_info, summary) for extracted_info, summary in records]
+    if not rows:
+        return
+    with tracing.span("storage.write", rows=len(rows)), connect(db_path) as conn:
+        _insert(conn, rows)
+        if checkpoint:
+            run, case_ids = checkpoint
+            conn.executemany("INSERT OR IGNORE INTO batch_checkpoints (run, case_id) VALUES (?, ?)",
+                             [(run, case_id) for case_id in case_ids])
+    WRITE_BATCH_SIZE.observe(len(rows))
+
+def completed_cases(run, db_path=None):
+    """
+    Returns:
+        set: Case ids already stored by the batch run `run`.
+    """
+    with connect(db_path) as conn:
+        return {row["case_id"] for row in conn.execute("SELECT case_id FROM batch_checkpoints WHERE run = ?", (run,))}
+
+class PatientWriter:
+    """
+    Group commit for patient rows: callers queue a row and wait, while one
+    thread per process commits everything queued so far in a single
+    transaction. Under concurrent load many saves share one fsync; a lone
+    save is committed immediately.
+    Args:
+        db_path (str): Database file.
+        max_batch (int): Most rows per transaction.
+    """
+    def __init__(self, db_path=None, max_batch=DB_WRITE_BATCH):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so each worker process starts its own
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="patient-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, extracted_info, summary):
+        """
+        Returns:
+            Future: Resolves once the row is committed.
+        """
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((_patient_row(extracted_info, summary), future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with tracing.span("storage.write", rows=len(batch)), connect(self.db_path) as conn:
+                    _insert(conn, [row for row, _ in batch])
+            except Exception as e:
+                logger.exception("Failed to store %d patient rows", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                WRITE_BATCH_SIZE.observe(len(batch))
+                for _, future in batch:
+                    future.set_result(None)
+
+_writer = PatientWriter()
+
+def save_patient(extracted_info, summary):
+    """
+    Stores a patient's extracted information and discharge summary. Blocks
+    until the row is committed, possibly together with other pending saves.
+    Args:
+        extracted_info (dict): Extracted clinical information.
+        summary (str): Generated discharge summary.
+    """
+    _writer.submit(extracted_info, summary).result()
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def list_patients(limit=PAGE_SIZE, before=None, search=None, since=None):
+    """
+    Returns one page of patients, newest first, without their summaries.
+    Pages are addressed by the last id seen (keyset pagination), so every
+    page costs the same however deep it is.
+    Args:
+        limit (int): Rows per page.
+        before (int): Only rows with a smaller id, i.e. the previous page's cursor.
+        search (str): Case-insensitive name prefix.
+        since (float): Only rows created at or after this Unix time.
+    Returns:
+        tuple: (list of sqlite3.Row with id, name, age, gender, history,
+        created_at; cursor for the next page or None if this is the last)
+    """
+    clauses, params = [], []
+    if before is not None:
+        clauses.append("id < ?")
+        params.append(before)
+    if search:
+        clauses.append("name LIKE ? ESCAPE '\\'")
+        params.append(_escape_like(search) + "%")
+    if since is not None:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with connect() as conn:
+        # One extra row tells us whether another page follows
+        rows = conn.execute(
+            f"SELECT id, name, age, gender, history, created_at FROM patients {where} ORDER BY id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1]["id"]
+    return rows, None
+
+def get_summary(patient_id):
+    """
+    Returns:
+        str: The patient's stored summary, or None if there is no such patient.
+    """
+    with connect() as conn:
+        row = conn.execute("SELECT summary FROM patients WHERE id = ?", (patient_id,)).fetchone()
+    return row["summary"] if row else None
@@ -0,0 +1,137 @@
+import threading
+import time
+import pytest
+import admission
+from admission import BACKGROUND, NORMAL, URGENT, Overloaded, StageLimiter
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+class Waiter(threading.Thread):
+    """Acquires a slot at a priority level in the background, recording the outcome."""
+    def __init__(self, limiter, level, admitted):
+        super().__init__(daemon=True)
+        self.limiter, self.level, self.admitted = limiter, level, admitted
+        self.error = None
+
+    def run(self):
+        try:
+            self.limiter.acquire(self.level)
+        except Overloaded as e:
+            self.error = e
+            return
+        self.admitted.append(self.level)
+        self.limiter.release(0.01)
+
+def queue_waiter(limiter, level, admitted):
+    waiting = len(limiter._waiters)
+    waiter = Waiter(limiter, level, admitted)
+    waiter.start()
+    wait_for(lambda: len(limiter._waiters) > waiting)
+    return waiter
+
+def test_admits_immediately_below_the_limit():
+    limiter = StageLimiter("test", limit=2, max_waiting=0)
+    with limiter.slot(NORMAL), limiter.slot(NORMAL):
+        pass
+
+def test_admits_by_priority_then_arrival():
+    limiter = StageLimiter("test", limit=1, max_waiting=4)
+    admitted = []
+    limiter.acquire(NORMAL)
+    waiters = [queue_waiter(limiter, level, admitted) for level in (BACKGROUND, NORMAL, URGENT, NORMAL)]
+    limiter.release(0.01)
+    for waiter in waiters:
+        waiter.join(2)
+    assert admitted == [URGENT, NORMAL, NORMAL, BACKGROUND]
+
+def test_sheds_when_the_queue_is_full():
+    limiter = StageLimiter("test", limit=1, max_waiting=1)
+    admitted = []
+    limiter.acquire(NORMAL)
+    waiter = queue_waiter(limiter, NORMAL, admitted)
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.check(NORMAL)
+    with pytest.raises(Overloaded):
+        limiter.acquire(NORMAL)
+    assert excinfo.value.stage == "test"
+    assert excinfo.value.retry_after >= 1
+    limiter.release(0.01)
+    waiter.join(2)
+    assert admitted == [NORMAL]
+
+def test_urgent_displaces_the_newest_normal_waiter():
+    limiter = StageLimiter("test", limit=1, max_waiting=2)
+    admitted = []
+    limiter.acquire(NORMAL)
+    older = queue_waiter(limiter, NORMAL, admitted)
+    newer = queue_waiter(limiter, NORMAL, admitted)
+    limiter.check(URGENT)
+    # The queue stays the same length: the urgent request takes the newer one's place
+    urgent = Waiter(limiter, URGENT, admitted)
+    urgent.start()
+    newer.join(2)
+    assert isinstance(newer.error, Overloaded)
+    limiter.release(0.01)
+    for waiter in (older, urgent):
+        waiter.join(2)
+    assert admitted == [URGENT, NORMAL]
+    assert older.error is None
+
+def test_background_is_never_shed():
+    limiter = StageLimiter("test", limit=1, max_waiting=0, timeout=0.01)
+    admitted = []
+    limiter.acquire(NORMAL)
+    limiter.check(BACKGROUND)
+    waiter = queue_waiter(limiter, BACKGROUND, admitted)
+    time.sleep(0.05)
+    limiter.release(0.01)
+    waiter.join(2)
+    assert admitted == [BACKGROUND]
+
+def test_waiting_past_the_timeout_is_shed():
+    limiter = StageLimiter("test", limit=1, max_waiting=1, timeout=0.05)
+    limiter.acquire(NORMAL)
+    with pytest.raises(Overloaded):
+        limiter.acquire(NORMAL)
+    assert limiter._waiters == []
+
+def test_priority_context_sets_the_default_level():
+    limiter = StageLimiter("test", limit=1, max_waiting=0)
+    limiter.acquire(NORMAL)
+    with pytest.raises(Overloaded):
+        limiter.check()
+    with admission.priority(BACKGROUND):
+        limiter.check()
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    pytest.importorskip("flask")
+    # Importing the app creates its SQLite tables in the working directory
+    monkeypatch.chdir(tmp_path)
+    return pytest.importorskip("app")
+
+def test_overloaded_becomes_429_with_retry_after(app_module):
+    with app_module.app.test_request_context():
+        response, status = app_module.overloaded(Overloaded("generation", 7))
+    assert status == 429
+    assert response.headers["Retry-After"] == "7"
+    assert response.get_json()["stage"] == "generation"
+
+@pytest.mark.parametrize("path, headers, level", [
+    ("/ocr", {}, NORMAL),
+    ("/ocr?urgent=true", {}, URGENT),
+    ("/ocr", {"X-Priority": "urgent"}, URGENT),
+])
+def test_request_priority_never_reads_the_body(app_module, path, headers, level):
+    with app_module.app.test_request_context(path, method="POST", headers=headers, data={"urgent": "true"}):
+        from flask import request
+        app_module.set_request_priority()
+        try:
+            assert admission._priority.get() == level
+            assert "form" not in request.__dict__
+        finally:
+            app_module.reset_request_priority(None)
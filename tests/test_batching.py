@@ -0,0 +1,47 @@
+import batching
+
+class FakeOutputs(list):
+    def __ne__(self, other):
+        return FakeOutputs(token != other for ids in self for token in ids)
+
+    def sum(self):
+        return sum(self)
+
+class FakeTokenizer:
+    pad_token_id = 0
+
+    def pad(self, encoded, return_tensors=None):
+        return {"input_ids": FakeOutputs(encoded["input_ids"]), "attention_mask": None}
+
+    def batch_decode(self, outputs, skip_special_tokens=True):
+        return [str(ids) for ids in outputs]
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, input_ids, attention_mask=None, **kwargs):
+        self.calls.append((len(input_ids), kwargs.get("max_time")))
+        return input_ids
+
+def batcher(model):
+    instance = batching.GenerationBatcher.__new__(batching.GenerationBatcher)
+    instance.max_batch_size = 8
+    instance.tokenizer = FakeTokenizer()
+    instance.model = model
+    return instance
+
+def test_deadlines_do_not_split_batches():
+    requests = [batching._Request([1, 2], {"num_beams": 1, "max_time": t}) for t in (30.0, 5.0, 12.5)]
+    requests.append(batching._Request([1, 2], {"num_beams": 1}))
+    model = FakeModel()
+    instance = batcher(model)
+    batches = list(instance._batches(requests))
+    assert sorted(len(batch) for batch in batches) == [1, 3]
+    for batch in batches:
+        instance._run_batch(batch)
+    timed = [max_time for size, max_time in model.calls if size == 3]
+    assert 4.0 < timed[0] <= 5.0
+    assert (1, None) in model.calls
+    assert [request.future.result() for request in requests] == ["[1, 2]"] * 4
+    assert not any(request.future.cut_off for request in requests)
@@ -0,0 +1,78 @@
+import pytest
+import chunking
+
+HEADERS = (
+    "Additional Notes from Image Report:",
+    "Additional Notes from Text Input:",
+    "Additional Notes from Doctor-Patient Conversation:",
+)
+INSTRUCTION = "Provide a concise discharge summary incorporating all relevant details."
+
+def build(preamble, bodies):
+    lines = [preamble]
+    for header, body in zip(HEADERS, bodies):
+        lines += [header, body]
+    return "\n".join(lines + [INSTRUCTION])
+
+def test_split_sections():
+    text = build("Patient Name: A", ["ocr text", "typed notes", "None provided"])
+    preamble, sections = chunking.split_sections(text, HEADERS, INSTRUCTION)
+    assert preamble == "Patient Name: A"
+    assert sections == list(zip(HEADERS, ["ocr text", "typed notes", "None provided"]))
+
+def test_split_sections_ignores_headers_inside_text():
+    text = build(
+        f"Disease/Condition: see {HEADERS[1]}",
+        [f"quoted {HEADERS[2]} in the report", "typed notes", "conversation"],
+    )
+    preamble, sections = chunking.split_sections(text, HEADERS, INSTRUCTION)
+    assert preamble == f"Disease/Condition: see {HEADERS[1]}"
+    assert [body for _, body in sections] == [f"quoted {HEADERS[2]} in the report", "typed notes", "conversation"]
+
+def test_split_sections_without_headers():
+    assert chunking.split_sections("just a prompt", HEADERS, INSTRUCTION) == ("just a prompt", [])
+
+def count_words(text):
+    return len(text.split())
+
+def test_window_text_respects_budget_and_overlaps():
+    text = " ".join(f"Sentence number {i} is here." for i in range(20))
+    windows = list(chunking.window_text(text, count_words, budget=20, overlap=5))
+    assert len(windows) > 1
+    assert all(count_words(window) <= 20 for window in windows)
+    # Consecutive windows share their boundary sentence
+    for previous, current in zip(windows, windows[1:]):
+        assert previous.split(".")[-2].strip() in current
+
+def test_window_text_splits_unpunctuated_text():
+    windows = list(chunking.window_text("word " * 50, count_words, budget=10, overlap=0))
+    assert [count_words(window) for window in windows] == [10] * 5
+
+def test_iter_chunks_skips_empty_sections():
+    sections = [(HEADERS[0], "None provided"), (HEADERS[1], "Short note."), (HEADERS[2], "")]
+    assert list(chunking.iter_chunks(sections, count_words, 50, 10)) == [(HEADERS[1], "Short note.")]
+
+class WordTokenizer:
+    def __call__(self, text, add_special_tokens=False):
+        return {"input_ids": text.split()}
+
+    def decode(self, input_ids):
+        return " ".join(input_ids)
+
+def test_condense_input_keeps_a_budget_with_a_long_preamble(monkeypatch):
+    pipeline = pytest.importorskip("pipeline")
+    monkeypatch.setattr(pipeline.models, "get_tokenizer", WordTokenizer)
+    monkeypatch.setattr(pipeline.models, "input_token_limit", lambda: 200)
+    prompts = []
+    def summarize(batch):
+        prompts.extend(batch)
+        return ["partial"] * len(batch)
+    monkeypatch.setattr(pipeline, "_summarize_chunks", summarize)
+
+    preamble = "Medications: " + "drug " * 500
+    notes = " ".join(f"Note sentence {i}." for i in range(100))
+    prompt = pipeline.condense_input(build(preamble, [notes, "None provided", "None provided"]))
+
+    assert prompts
+    assert all(count_words(chunk_prompt) <= 200 for chunk_prompt in prompts)
+    assert prompt.endswith(pipeline.SUMMARY_INSTRUCTION)
@@ -0,0 +1,126 @@
+import re
+from collections import namedtuple
+import pytest
+from context import ContextEngine, SentenceIndex, is_patient_condition
+
+Sentence = namedtuple("Sentence", ["start_char", "end_char", "text"])
+
+def sentences(*texts):
+    """Sentence spans for texts joined by single spaces, like spaCy's (end exclusive of the space)."""
+    sents, start = [], 0
+    for text in texts:
+        sents.append(Sentence(start, start + len(text), text))
+        start += len(text) + 1
+    return sents
+
+# The per-entity checks extract_information_from_text made before ContextEngine
+BASELINE_NEGATION = [
+    r'\bno history of\b', r'\bdoes not have\b', r'\bnot have\b', r'\bwithout\b',
+    r'\bno evidence of\b', r'\bnot diagnosed with\b', r'\b(not that i\'m aware of|not that i know of)\b',
+    r'\bno\b', r'\bnot\b', r'\bnever had\b', r'\babsence of\b', r'\bnegative for\b',
+]
+BASELINE_QUESTION = r'\b(do you|have you|are there|is there|any|what|when|where|how|did you|can you)\b.*\?|[\?\!]'
+BASELINE_FAMILY = r'\b(in your family|family history|parents|siblings|family|relatives)\b'
+BASELINE_HYPOTHETICAL = r'\b(suggestive of|likely|possible|probable|may be|consistent with|indicative of)\b'
+BASELINE_PATIENT = r'\b(the patient|patient|i|he|she)\b.*\b(has|had|history of|diagnosed with)\b'
+
+def baseline_is_patient_condition(sents, offset):
+    sentence_idx = next((idx for idx, sent in enumerate(sents) if sent.start_char <= offset <= sent.end_char), -1)
+    if sentence_idx == -1:
+        return False
+    sentence_text = sents[sentence_idx].text.lower()
+    is_negated = any(re.search(pattern, sentence_text) for pattern in BASELINE_NEGATION)
+    is_question = bool(re.search(BASELINE_QUESTION, sentence_text))
+    if not is_negated and is_question and sentence_idx + 1 < len(sents):
+        next_text = sents[sentence_idx + 1].text.lower()
+        is_negated = any(re.search(pattern, next_text) for pattern in BASELINE_NEGATION)
+    is_family_history = bool(re.search(BASELINE_FAMILY, sentence_text))
+    is_potential_diagnosis = bool(re.search(BASELINE_HYPOTHETICAL, sentence_text))
+    is_patient_specific = bool(re.search(BASELINE_PATIENT, sentence_text))
+    return not is_negated and not is_family_history and not is_question and not is_potential_diagnosis and is_patient_specific
+
+CORPUS = [
+    "The patient has diabetes.",
+    "Patient had a myocardial infarction in 2019.",
+    "He was diagnosed with hypertension last year.",
+    "She has no history of asthma.",
+    "The patient does not have tuberculosis.",
+    "No evidence of pneumonia on the chest film.",
+    "Do you have any heart disease?",
+    "No.",
+    "Have you ever had a stroke?",
+    "Yes, I had a stroke two years ago.",
+    "Any kidney problems?",
+    "Not that I'm aware of.",
+    "There is a family history of breast cancer.",
+    "His parents had coronary artery disease.",
+    "Findings are suggestive of pulmonary embolism.",
+    "The patient likely has sepsis.",
+    "She has anemia, negative for malaria.",
+    "I never had jaundice.",
+    "Patient has chronic kidney disease without dialysis.",
+    "He had chest pain!",
+    "Known case of COPD.",
+]
+
+def test_matches_baseline_classification():
+    sents = sentences(*CORPUS)
+    # Every word start, so mentions at the start, middle and end of sentences are covered
+    offsets = [sent.start_char + m.start() for sent in sents for m in re.finditer(r"\w+", sent.text)]
+    contexts = ContextEngine().classify(SentenceIndex(sents), offsets)
+    assert [is_patient_condition(context) for context in contexts] == \
+        [baseline_is_patient_condition(sents, offset) for offset in offsets]
+
+@pytest.mark.parametrize("text, flag", [
+    ("She has no history of asthma.", "negated"),
+    ("There is a family history of breast cancer.", "family"),
+    ("Findings are suggestive of pulmonary embolism.", "hypothetical"),
+    ("Do you have any heart disease?", "question"),
+    ("The patient has diabetes.", "patient"),
+])
+def test_flags(text, flag):
+    context, = ContextEngine().classify(SentenceIndex(sentences(text)), [0])
+    assert getattr(context, flag)
+
+def test_question_answered_with_negation():
+    sents = sentences("Any diabetes?", "No.", "Any asthma?", "Yes, since childhood.")
+    negated_diabetes, negated_asthma = [context.negated for context in ContextEngine().classify(SentenceIndex(sents), [4, 22])]
+    assert negated_diabetes
+    assert not negated_asthma
+
+def test_affirmed_patient_condition():
+    context, = ContextEngine().classify(SentenceIndex(sentences("The patient has diabetes.")), [16])
+    assert is_patient_condition(context)
+
+def test_offset_outside_every_sentence():
+    sents = [Sentence(0, 10, "First one."), Sentence(20, 30, "Second one")]
+    assert ContextEngine().classify(SentenceIndex(sents), [15]) == [None]
+    assert not is_patient_condition(None)
+
+def test_sentence_index_find():
+    sents = sentences("One.", "Two.", "Three.")
+    index = SentenceIndex(sents)
+    assert [index.find(offset) for offset in (0, 3, 5, 10, 15)] == [0, 0, 1, 2, 2]
+    assert index.find(100) == -1
+
+def test_custom_triggers():
+    engine = ContextEngine({"negated": ["denies"]})
+    context, = engine.classify(SentenceIndex(sentences("Patient denies chest pain.")), [15])
+    assert context.negated
+    assert not context.family
+
+@pytest.mark.parametrize("text, mention, negated", [
+    ("Patient is not on aspirin.", "aspirin", True),
+    ("Started aspirin, no fever.", "aspirin", False),
+    ("No fever, started aspirin.", "aspirin", False),
+    ("Aspirin was given but no heparin.", "heparin", True),
+    ("No heparin but aspirin was given.", "aspirin", False),
+])
+def test_scoped_negation_covers_the_words_after_the_trigger(text, mention, negated):
+    context, = ContextEngine().classify(SentenceIndex(sentences(text)), [text.lower().index(mention)], scoped=True)
+    assert context.negated is negated
+
+def test_scoped_negation_keeps_the_question_answer_rule():
+    sents = sentences("Are you taking aspirin?", "No.")
+    context, = ContextEngine().classify(SentenceIndex(sents), [15], scoped=True)
+    assert context.negated
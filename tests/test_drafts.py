@@ -0,0 +1,27 @@
+import time
+import pytest
+import drafts
+import storage
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_PATH", str(tmp_path / "test.db"))
+    drafts.init_drafts_table()
+
+def test_loading_a_draft_keeps_it_alive(db, monkeypatch):
+    monkeypatch.setattr(drafts, "DRAFT_TTL", 10)
+    draft_id = drafts.create_draft("alice")
+    drafts.save_sources(draft_id, {"ocr": {"key": "k", "extraction": {}}})
+    start = time.time()
+    for offset in (8, 16, 24):
+        monkeypatch.setattr(time, "time", lambda: start + offset)
+        assert drafts.get_sources(draft_id) == {"ocr": {"key": "k", "extraction": {}}}
+    assert drafts.get_owner(draft_id) == "alice"
+
+def test_expired_draft_is_not_revived(db, monkeypatch):
+    monkeypatch.setattr(drafts, "DRAFT_TTL", 10)
+    draft_id = drafts.create_draft("alice")
+    start = time.time()
+    monkeypatch.setattr(time, "time", lambda: start + 11)
+    assert drafts.get_sources(draft_id) == {}
+    assert drafts.get_owner(draft_id) is None
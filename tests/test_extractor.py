@@ -0,0 +1,46 @@
+import re
+from collections import namedtuple
+import pytest
+
+extractor = pytest.importorskip("extractor")
+
+Sentence = namedtuple("Sentence", ["start_char", "end_char", "text"])
+Entity = namedtuple("Entity", ["start_char", "end_char", "text", "label_"])
+Doc = namedtuple("Doc", ["sents", "ents"])
+
+class FakeNLP:
+    """Splits sentences at terminal punctuation and tags the given words as CHEMICAL."""
+    def __init__(self, chemicals=()):
+        self.chemicals = chemicals
+
+    def __call__(self, text):
+        sents = [Sentence(m.start(), m.end(), m.group()) for m in re.finditer(r"[^.?!]+[.?!]?", text) if m.group().strip()]
+        ents = [Entity(m.start(), m.end(), m.group(), "CHEMICAL")
+                for word in self.chemicals for m in re.finditer(rf"\b{re.escape(word)}\b", text, re.IGNORECASE)]
+        return Doc(sents, sorted(ents))
+
+@pytest.fixture
+def nlp(monkeypatch):
+    def install(*chemicals):
+        monkeypatch.setattr(extractor.models, "get_nlp_med", lambda: FakeNLP(chemicals))
+        monkeypatch.setattr(extractor.models, "get_nlp", lambda: FakeNLP())
+    return install
+
+def test_negated_lexicon_drug_is_not_restored_by_ner(nlp):
+    nlp("aspirin")
+    assert extractor.extract_source("Patient is not on aspirin.")["medications"] == []
+
+def test_negation_after_a_drug_does_not_drop_it(nlp):
+    nlp()
+    extraction = extractor.extract_source("Started aspirin, no fever. Continued metformin.")
+    assert extraction["medications"] == ["aspirin", "metformin"]
+
+def test_ner_fallback_drops_negated_chemicals(nlp):
+    nlp("zorbex", "qualtrin")
+    assert extractor.extract_source("Not on zorbex. Started qualtrin.")["medications"] == ["qualtrin"]
+
+def test_negated_procedure_still_counts_as_matched(nlp):
+    nlp()
+    extraction = extractor.extract_source("No appendectomy was done.")
+    assert extraction["procedures"] == []
+    assert extraction["procedures_matched"]
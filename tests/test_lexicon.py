@@ -0,0 +1,70 @@
+import json
+import lexicon
+from lexicon import Lexicon, LexiconMatch
+
+CONCEPTS = {
+    "medications": {
+        "aspirin": ["acetylsalicylic acid", "ecosprin"],
+        "insulin glargine": ["lantus"],
+        "insulin": ["human insulin"],
+    },
+    "procedures": {
+        "appendectomy": ["appendicectomy"],
+        "laparoscopic appendectomy": ["lap appendectomy"],
+        "caesarean section": ["c-section"],
+    },
+}
+
+def test_match_maps_variants_to_canonical_names():
+    text = "Started Ecosprin and acetylsalicylic acid."
+    assert Lexicon(CONCEPTS).match(text) == [
+        LexiconMatch(8, 16, "medications", "aspirin"),
+        LexiconMatch(21, 41, "medications", "aspirin"),
+    ]
+
+def test_match_is_leftmost_longest():
+    matches = Lexicon(CONCEPTS).match("Underwent lap appendectomy, then insulin glargine.")
+    assert [m.concept for m in matches] == ["laparoscopic appendectomy", "insulin glargine"]
+
+def test_match_ignores_case_hyphens_and_spacing():
+    matches = Lexicon(CONCEPTS).match("Delivered by C section; prior c-section and C-SECTION.")
+    assert [m.concept for m in matches] == ["caesarean section"] * 3
+
+def test_match_needs_whole_words():
+    assert Lexicon(CONCEPTS).match("insulinoma and appendectomies") == []
+
+def test_match_by_category():
+    matches = Lexicon(CONCEPTS).match("Aspirin after appendectomy.", category="procedures")
+    assert [m.concept for m in matches] == ["appendectomy"]
+
+def test_concepts_dedupes_in_first_mention_order():
+    matches = Lexicon(CONCEPTS).match("Lantus, aspirin, appendicectomy, then ecosprin again.")
+    assert lexicon.concepts(matches, "medications") == ["insulin glargine", "aspirin"]
+    assert lexicon.concepts(matches, "procedures") == ["appendectomy"]
+
+def test_normalize():
+    terms = Lexicon(CONCEPTS)
+    assert terms.normalize("Human  Insulin") == "insulin"
+    assert terms.normalize("Metformin-HCl") == "metformin hcl"
+
+def test_fingerprint_follows_the_file(tmp_path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps(CONCEPTS))
+    first = lexicon.fingerprint(str(path))
+    assert lexicon.get_lexicon(str(path)).normalize("lantus") == "insulin glargine"
+    other = tmp_path / "other.json"
+    other.write_text(json.dumps({"medications": {"aspirin": []}}))
+    assert lexicon.fingerprint(str(other)) != first
+
+def test_shipped_lexicon_has_no_ambiguous_abbreviations():
+    terms = lexicon.get_lexicon()
+    assert terms.match("THR, tha, tah, mrm, aten and doxy were noted after intubation.") == []
+
+def test_edited_file_is_reloaded(tmp_path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps({"medications": {"aspirin": []}}))
+    assert lexicon.get_lexicon(str(path)).match("lantus") == []
+    first = lexicon.fingerprint(str(path))
+    path.write_text(json.dumps(CONCEPTS))
+    assert [m.concept for m in lexicon.get_lexicon(str(path)).match("lantus")] == ["insulin glargine"]
+    assert lexicon.fingerprint(str(path)) != first
@@ -0,0 +1,39 @@
+import os
+import time
+import pytest
+
+reports = pytest.importorskip("reports")
+
+INFO = {"Name": "Test Patient", "Discharge Date": "2000-01-01"}
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+def test_render_bytes_is_a_pdf():
+    assert reports.render_bytes(INFO, "Recovered well.").startswith(b"%PDF-")
+
+def test_sweep_deletes_only_old_rendered_pdfs(tmp_path):
+    old = tmp_path / "discharge-old.pdf"
+    new = tmp_path / "discharge-new.pdf"
+    other = tmp_path / "notes.txt"
+    for path in (old, new, other):
+        path.write_bytes(b"x")
+    age(old, 120)
+    age(other, 120)
+    assert reports.sweep_pdfs(str(tmp_path), max_age=60) == 1
+    assert sorted(os.listdir(tmp_path)) == ["discharge-new.pdf", "notes.txt"]
+
+def test_sweep_of_a_missing_directory(tmp_path):
+    assert reports.sweep_pdfs(str(tmp_path / "missing")) == 0
+
+def test_shared_render_sweeps_old_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(reports, "SHARED_PDF_DIR", str(tmp_path))
+    monkeypatch.setattr(reports, "PDF_RETENTION", 60)
+    monkeypatch.setattr(reports, "_last_sweep", 0.0)
+    stale = tmp_path / "discharge-stale.pdf"
+    stale.write_bytes(b"x")
+    age(stale, 120)
+    path, _ = reports.render_async(INFO, "Recovered well.").result()
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
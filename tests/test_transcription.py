@@ -0,0 +1,81 @@
+import io
+import os
+import time
+import pytest
+
+pytest.importorskip("werkzeug")
+import storage
+import transcription
+
+def multipart(fields, boundary="xyz"):
+    """Encodes (name, filename, content) parts as a multipart/form-data body."""
+    parts = []
+    for name, filename, content in fields:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename is not None else "")
+        parts.append(f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n")
+    return b"".join(parts) + f"--{boundary}--\r\n".encode()
+
+def test_upload_chunks_streams_the_audio_part(monkeypatch):
+    monkeypatch.setattr(transcription, "UPLOAD_CHUNK_BYTES", 7)
+    audio = bytes(range(256)) * 40
+    body = multipart([("note", None, b"hello"), ("audio", "a.wav", audio), ("other", "b.txt", b"ignored")])
+    assert b"".join(transcription.upload_chunks(io.BytesIO(body), "multipart/form-data", "xyz")) == audio
+
+def test_upload_chunks_accepts_a_raw_body():
+    assert b"".join(transcription.upload_chunks(io.BytesIO(b"raw audio"), "audio/wav")) == b"raw audio"
+
+@pytest.mark.parametrize("fields", [
+    [("note", None, b"hello")],
+    [("audio", "", b"")],
+])
+def test_upload_chunks_without_a_file(fields):
+    with pytest.raises(ValueError):
+        list(transcription.upload_chunks(io.BytesIO(multipart(fields)), "multipart/form-data", "xyz"))
+
+def test_save_upload_removes_the_file_on_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcription, "UPLOAD_DIR", str(tmp_path))
+    chunks = transcription.upload_chunks(io.BytesIO(multipart([])), "multipart/form-data", "xyz")
+    with pytest.raises(ValueError):
+        transcription.save_upload(chunks)
+    assert os.listdir(tmp_path) == []
+
+class RecordingExecutor:
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append(args)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_PATH", str(tmp_path / "test.db"))
+    transcription.init_transcriptions_table()
+    executor = RecordingExecutor()
+    monkeypatch.setattr(transcription, "_get_executor", lambda: executor)
+    return executor
+
+def queued(transcription_id, path, age):
+    then = time.time() - age
+    with storage.connect() as conn:
+        conn.execute(
+            "INSERT INTO transcriptions (id, status, digest, created_at, updated_at, upload_path) VALUES (?, 'queued', 'd', ?, ?, ?)",
+            (transcription_id, then, then, path)
+        )
+
+def test_stale_queued_uploads_are_sent_again(db, tmp_path):
+    audio = tmp_path / "audio-1"
+    audio.write_bytes(b"audio")
+    queued("stale", str(audio), transcription.TRANSCRIBE_QUEUED_TIMEOUT + 1)
+    queued("fresh", str(audio), 0)
+    transcription.reclaim_stale()
+    assert db.calls == [("stale", str(audio))]
+    # Claimed rows are renewed, so they are not sent twice
+    transcription.reclaim_stale()
+    assert len(db.calls) == 1
+
+def test_stale_queued_upload_without_its_file_fails(db, tmp_path):
+    queued("lost", str(tmp_path / "missing"), transcription.TRANSCRIBE_QUEUED_TIMEOUT + 1)
+    job = transcription.get_transcription("lost")
+    assert job["status"] == "failed"
+    assert job["error"] == transcription.TRANSCRIBE_LOST
+    assert db.calls == []
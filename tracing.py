@@ -0,0 +1,86 @@
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+import metrics
+
+logger = logging.getLogger("discharge.trace")
+
+STAGE_DURATION = metrics.Histogram("stage_duration_seconds", "Wall time of each pipeline stage")
+STAGE_ERRORS = metrics.Counter("stage_errors_total", "Pipeline stages that raised")
+GENERATED_TOKENS = metrics.Counter("generated_tokens_total", "Output tokens produced by the summarization model")
+GENERATION_TOKENS_PER_SECOND = metrics.Histogram(
+    "generation_tokens_per_second", "Output tokens per second of each generate() call",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+# Innermost open span in the current thread/context
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed stage. Spans opened inside another share its trace id."""
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+def _emit(span):
+    logger.info(json.dumps({
+        "span": span.name,
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "duration_ms": round(span.duration * 1000, 3),
+        **span.attributes,
+    }, default=str))
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a block as a named stage: logs it as a structured span and records
+    its duration in the stage_duration_seconds histogram.
+    Args:
+        name (str): Stage name, dotted for sub-stages (e.g. "extraction.qa").
+        **attributes: Extra fields to log with the span.
+    Yields:
+        Span: Call .set(...) on it to attach attributes discovered inside the block.
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=repr(e))
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current_span.reset(token)
+        STAGE_DURATION.observe(current.duration, stage=name)
+        _emit(current)
+
+def record(name, duration, **attributes):
+    """Records a stage timed elsewhere (e.g. in a worker process) as a child of the current span."""
+    completed = Span(name, _current_span.get(), attributes)
+    completed.duration = duration
+    STAGE_DURATION.observe(duration, stage=name)
+    _emit(completed)
+
+def record_generation(new_tokens, duration, num_beams, batch_size=1):
+    """Records output token throughput for one generate() call."""
+    GENERATED_TOKENS.inc(new_tokens)
+    if duration > 0:
+        GENERATION_TOKENS_PER_SECOND.observe(new_tokens / duration, num_beams=num_beams)
+    current = _current_span.get()
+    if current is not None:
+        current.set(new_tokens=new_tokens, num_beams=num_beams, batch_size=batch_size,
+                    tokens_per_second=round(new_tokens / duration, 2) if duration > 0 else None)
@@ -0,0 +1,320 @@
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+import cache
+import storage
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Uploads are spooled here under random names while they are sent to the provider
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Concurrent uploads to the provider
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "2"))
+# Public URL of /transcribe/webhook. When unset, status requests poll the provider instead.
+TRANSCRIBE_WEBHOOK_URL = os.environ.get("TRANSCRIBE_WEBHOOK_URL")
+# With a webhook, a transcription unchanged this many seconds is polled anyway,
+# in case its callback was lost or rejected
+TRANSCRIBE_WEBHOOK_FALLBACK = float(os.environ.get("TRANSCRIBE_WEBHOOK_FALLBACK", "180"))
+TRANSCRIBE_WEBHOOK_SECRET = os.environ.get("TRANSCRIBE_WEBHOOK_SECRET", "")
+WEBHOOK_AUTH_HEADER = "X-Webhook-Secret"
+# Minimum seconds between provider polls for one transcription, however often clients ask
+TRANSCRIBE_POLL_INTERVAL = float(os.environ.get("TRANSCRIBE_POLL_INTERVAL", "2"))
+# A transcription left "queued" this long (e.g. its process died before sending
+# the audio) is sent again by another process. The row is touched when its
+# upload starts, so this only has to outlast one upload to the provider.
+TRANSCRIBE_QUEUED_TIMEOUT = float(os.environ.get("TRANSCRIBE_QUEUED_TIMEOUT", "600"))
+TRANSCRIBE_LOST = "The upload was lost before it was sent"
+# The SDK itself reads ASSEMBLYAI_API_KEY and ASSEMBLYAI_BASE_URL; the latter
+# can point at the local fake in fake_assemblyai.py
+PROVIDER = "assemblyai"
+
+TERMINAL_STATUSES = ("done", "failed")
+
+def _sdk():
+    """
+    Imports the AssemblyAI SDK on first use. It is slow to import and only
+    needed once audio arrives, so app startup skips it.
+    """
+    import assemblyai as aai
+    return aai
+
+def init_transcriptions_table(db_path=None):
+    with storage.connect(db_path) as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS transcriptions
+                        (id TEXT PRIMARY KEY,
+                         status TEXT NOT NULL,
+                         digest TEXT NOT NULL,
+                         provider_id TEXT,
+                         text TEXT,
+                         error TEXT,
+                         created_at REAL NOT NULL,
+                         updated_at REAL NOT NULL,
+                         polled_at REAL,
+                         upload_path TEXT)''')
+        # Tables created before stale uploads were reclaimed
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(transcriptions)")}
+        if "upload_path" not in columns:
+            conn.execute("ALTER TABLE transcriptions ADD COLUMN upload_path TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcriptions_provider_id ON transcriptions (provider_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transcriptions_status ON transcriptions (status)")
+
+def _update(transcription_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    with storage.connect() as conn:
+        conn.execute(f"UPDATE transcriptions SET {assignments} WHERE id = ?", (*fields.values(), transcription_id))
+
+def _row(column, value):
+    with storage.connect() as conn:
+        return conn.execute(f"SELECT * FROM transcriptions WHERE {column} = ?", (value,)).fetchone()
+
+def cache_key(digest):
+    return cache.make_key("transcription", digest, provider=PROVIDER)
+
+def upload_chunks(stream, mimetype, boundary=None, field="audio"):
+    """
+    Yields the bytes of an uploaded file straight from the request body, in
+    UPLOAD_CHUNK_BYTES reads, so the upload is never buffered by the framework
+    first. A multipart body yields the file part named field; any other body
+    is the file itself.
+    Args:
+        stream: The raw request body.
+        mimetype (str): The request's content type, without parameters.
+        boundary (str): The multipart boundary, for multipart/form-data.
+        field (str): Form field holding the file.
+    Raises:
+        ValueError: If a multipart body has no file in field.
+    """
+    if mimetype != "multipart/form-data":
+        yield from iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b"")
+        return
+    if not boundary:
+        raise ValueError("Malformed multipart body")
+    decoder = MultipartDecoder(boundary.encode())
+    current, found = None, False
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_BYTES)
+        decoder.receive_data(chunk or None)
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, Data):
+                if current == field and event.data:
+                    found = True
+                    yield event.data
+            else:
+                # Only a file part with a filename counts as a selected file
+                current = event.name if isinstance(event, File) and event.filename else None
+            event = decoder.next_event()
+        if isinstance(event, Epilogue) or not chunk:
+            break
+    if not found:
+        raise ValueError("No audio file provided")
+
+def save_upload(chunks):
+    """
+    Copies an upload to a uniquely named file in UPLOAD_DIR, hashing it on the
+    way so the content is read only once.
+    Args:
+        chunks: Iterable of bytes, e.g. from upload_chunks.
+    Returns:
+        tuple: (path, SHA-256 hex digest)
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(prefix="audio-", dir=UPLOAD_DIR)
+    try:
+        with tracing.span("transcription.upload") as current, os.fdopen(fd, "wb") as f:
+            size = 0
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+            current.set(bytes=size)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning("Error: %s - %s", e.filename, e.strerror)
+
+def _submit_to_provider(transcription_id, path):
+    """
+    Uploads the audio and starts the provider's job without waiting for it.
+    Runs on the worker pool. The file is deleted whatever the outcome.
+    """
+    try:
+        # Renews the row, so it is not reclaimed as stale while this upload runs
+        _update(transcription_id)
+        aai = _sdk()
+        config = aai.TranscriptionConfig()
+        if TRANSCRIBE_WEBHOOK_URL:
+            if TRANSCRIBE_WEBHOOK_SECRET:
+                config.set_webhook(TRANSCRIBE_WEBHOOK_URL, WEBHOOK_AUTH_HEADER, TRANSCRIBE_WEBHOOK_SECRET)
+            else:
+                config.set_webhook(TRANSCRIBE_WEBHOOK_URL)
+        with tracing.span("transcription.submit", provider=PROVIDER):
+            transcript = aai.Transcriber().submit(path, config)
+        if transcript.status == aai.TranscriptStatus.error:
+            _update(transcription_id, status="failed", error=transcript.error, upload_path=None)
+        else:
+            _update(transcription_id, status="processing", provider_id=transcript.id, upload_path=None)
+    except Exception as e:
+        logger.exception("Transcription %s could not be submitted", transcription_id)
+        _update(transcription_id, status="failed", error=str(e), upload_path=None)
+    finally:
+        _remove(path)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    # Created on first use, so each forked web worker gets its own threads
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(TRANSCRIBE_WORKERS, thread_name_prefix="transcribe")
+        return _executor
+
+def submit(path, digest):
+    """
+    Records a transcription and hands the upload to the worker pool. The file
+    at path is deleted once it has been sent.
+    Returns:
+        dict: The new transcription's status, as returned by get_transcription.
+    """
+    transcription_id = uuid.uuid4().hex
+    now = time.time()
+    with storage.connect() as conn:
+        conn.execute(
+            "INSERT INTO transcriptions (id, status, digest, created_at, updated_at, upload_path) VALUES (?, 'queued', ?, ?, ?, ?)",
+            (transcription_id, digest, now, now, path)
+        )
+    _get_executor().submit(_submit_to_provider, transcription_id, path)
+    reclaim_stale()
+    return get_transcription(transcription_id)
+
+def claim_stale(db_path=None):
+    """
+    Takes over transcriptions left "queued" for TRANSCRIBE_QUEUED_TIMEOUT
+    seconds. Rows are claimed conditionally, so two processes reclaiming at
+    once never take the same one.
+    Returns:
+        list: (transcription id, upload path) of the rows claimed.
+    """
+    now = time.time()
+    claimed = []
+    with storage.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT id, upload_path, updated_at FROM transcriptions WHERE status = 'queued' AND updated_at < ?",
+            (now - TRANSCRIBE_QUEUED_TIMEOUT,)
+        ).fetchall()
+        for row in rows:
+            cursor = conn.execute(
+                "UPDATE transcriptions SET updated_at = ? WHERE id = ? AND status = 'queued' AND updated_at = ?",
+                (now, row["id"], row["updated_at"])
+            )
+            if cursor.rowcount:
+                claimed.append((row["id"], row["upload_path"]))
+    return claimed
+
+def reclaim_stale():
+    """
+    Sends stale queued uploads to the provider again, or marks them failed if
+    their file is gone. Called on every new upload and on status requests for
+    queued rows, so a crash never leaves a row queued, or its file on disk,
+    for good.
+    """
+    for transcription_id, path in claim_stale():
+        if path and os.path.exists(path):
+            logger.warning("Re-sending transcription %s, left queued by another process", transcription_id)
+            _get_executor().submit(_submit_to_provider, transcription_id, path)
+        else:
+            _update(transcription_id, status="failed", error=TRANSCRIBE_LOST, upload_path=None)
+
+def _apply(row, transcript):
+    """Stores the outcome of a finished provider job; unfinished jobs are left alone."""
+    aai = _sdk()
+    if transcript.status == aai.TranscriptStatus.completed:
+        _update(row["id"], status="done", text=transcript.text or "")
+        tracing.record("transcription", time.time() - row["created_at"], provider=PROVIDER)
+        result_cache = cache.get_cache()
+        if result_cache:
+            result_cache.set("transcription", cache_key(row["digest"]), transcript.text or "")
+    elif transcript.status == aai.TranscriptStatus.error:
+        _update(row["id"], status="failed", error=transcript.error)
+
+def _refresh(row):
+    """Polls the provider once, without blocking until the job finishes."""
+    _update(row["id"], polled_at=time.time())
+    aai = _sdk()
+    from assemblyai import api as aai_api
+    try:
+        transcript = aai_api.get_transcript(aai.Client.get_default().http_client, row["provider_id"])
+    except Exception as e:
+        # Transient provider errors are retried on the next poll
+        logger.warning("Polling transcription %s failed: %s", row["id"], e)
+        return
+    _apply(row, transcript)
+
+def get_transcription(transcription_id):
+    """
+    Returns a transcription's status, polling the provider if the job is still
+    running and the last poll is old enough. With a webhook configured, the
+    provider is only polled once the row has gone TRANSCRIBE_WEBHOOK_FALLBACK
+    seconds without an update, so a lost callback delays the result instead of
+    leaving it processing forever.
+    Returns:
+        dict: Status and, once done, the text; None if it does not exist.
+    """
+    row = _row("id", transcription_id)
+    if row is None:
+        return None
+    if TRANSCRIBE_WEBHOOK_URL:
+        # Every poll also bumps updated_at, so this paces the fallback polls too
+        due = time.time() - row["updated_at"] >= TRANSCRIBE_WEBHOOK_FALLBACK
+    else:
+        due = time.time() - (row["polled_at"] or 0) >= TRANSCRIBE_POLL_INTERVAL
+    if row["status"] == "processing" and due:
+        _refresh(row)
+        row = _row("id", transcription_id)
+    elif row["status"] == "queued" and time.time() - row["updated_at"] >= TRANSCRIBE_QUEUED_TIMEOUT:
+        reclaim_stale()
+        row = _row("id", transcription_id)
+    return {
+        "transcription_id": row["id"],
+        "status": row["status"],
+        "transcription": row["text"],
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+def handle_webhook(payload, secret):
+    """
+    Handles the provider's completion callback, which carries only the
+    provider's transcript id; the result itself is fetched from the API.
+    Args:
+        payload (dict): Webhook body.
+        secret (str): Value of the WEBHOOK_AUTH_HEADER request header.
+    Returns:
+        bool: False if the secret does not match.
+    """
+    if TRANSCRIBE_WEBHOOK_SECRET and not hmac.compare_digest(secret or "", TRANSCRIBE_WEBHOOK_SECRET):
+        return False
+    row = _row("provider_id", payload.get("transcript_id", ""))
+    if row is not None and row["status"] not in TERMINAL_STATUSES:
+        _refresh(row)
+    return True